@@ -11,6 +11,7 @@ __all__ = [
     'get_session_infos',
     'get_system_infos',
     'connect_bus',
+    'connect_peer',
     'with_connection',
     'with_session',
     'with_system',
@@ -61,115 +62,160 @@ def ConnectionFactory(W, R, info, *, loop=None, **kws):
     from .conn import Connection
     return Connection(W, R, info, loop=loop, **kws)
 
-@asyncio.coroutine
-def connect_bus(infos, *,
-                allowed_methods=_supported_methods,
-                factory=ConnectionFactory,
-                loop=None,
-                **kws):
-    """Accepts a sequence/generator of dictionaries describing possible bus endpoints.
-    Tries to connect to each until one succeeds.
-    
-    A coroutine
-    
-    :returns: Connection
+async def _dial(info):
+    if 'unix:abstract' in info:
+        return await asyncio.open_unix_connection('\0'+info['unix:abstract'])
+    elif 'unix:path' in info:
+        return await asyncio.open_unix_connection(info['unix:path'])
+
+    #TODO: transports not yet handled
+    #       'nonce-tcp:host=xxx,port=...,family=...,noncefile='
+    #       'tcp:host=xxx,port=...,family=...'
+    #       'unixexec:path=...,arg0=...,...'
+    return None, None
+
+async def _authenticate(R, W, *, allowed_methods, unix_fd, loop):
+    """Client side of the SASL exchange, through BEGIN.
+
+    :returns: (R, W, guid).  R and W may be replaced with an FDStream.  guid is the server's, as str.
+    :throws: RuntimeError if no method is accepted
     """
+    W.write(b'\0AUTH\r\n')
+    L = await R.readline()
+    if not L.startswith(b'REJECTED'):
+        raise RuntimeError('Bad auth phase (not dbus?)')
+
+    methods = set(L.decode('ascii').strip().split(' ')[1:])
+    ok, guid = False, None
+    _log.debug('Advertised auth methods: %s', methods)
+    methods.intersection_update(allowed_methods)
+    _log.debug('Proceed with methods: %s', methods)
+
+    if not ok and 'EXTERNAL' in methods:
+        _log.debug('Attempt EXTERNAL')
+        W.write(b'AUTH EXTERNAL '+hexencode(str(os.getuid()).encode('ascii'))+b'\r\n')
+        L = await R.readline()
+        if L.startswith(b'OK'):
+            ok, guid = True, L[2:].strip().decode('ascii')
+            _log.debug('EXTERNAL accepted')
+        elif L.startswith(b'REJECTED'):
+            _log.debug('EXTERNAL rejected: %s', L)
+        else:
+            raise RuntimeError('EXTERNAL incomplete: %s'%L)
+
+    # TODO: not working
+    if not ok and 'ANONYMOUS' in methods:
+        _log.debug('Attempt ANONYMOUS')
+        W.write(b'AUTH ANONYMOUS'+hexencode(b'Nemo')+b'\r\n')
+        if L.startswith(b'OK'):
+            ok, guid = True, L[2:].strip().decode('ascii')
+            _log.debug('ANONYMOUS accepted')
+        elif L.startswith(b'REJECTED'):
+            _log.debug('ANONYMOUS rejected: %s', L)
+        else:
+            raise RuntimeError('ANONYMOUS incomplete: %s'%L)
+
+    if not ok:
+        raise RuntimeError('No supported auth method')
+
+    if unix_fd:
+        W.write(b'NEGOTIATE_UNIX_FD\r\n')
+        L = await R.readline()
+        if L.startswith(b'AGREE_UNIX_FD'):
+            _log.debug('Unix FD passing agreed')
+            # asyncio transports can't pass file descriptors
+            from .unixfd import FDStream
+            R = W = FDStream.from_stream(W, loop=loop)
+        else:
+            _log.debug('Unix FD passing refused: %s', L)
+
+    W.write(b'BEGIN\r\n')
+    return R, W, guid
+
+async def _connect(infos, *, peer, allowed_methods, factory, loop, unix_fd, **kws):
     for info in infos:
         R, W = None, None
         try:
-            _log.debug('Trying bus %s', info)
-            if 'unix:abstract' in info:
-                R, W = yield from asyncio.open_unix_connection('\0'+info['unix:abstract'], loop=loop)
-            elif 'unix:path' in info:
-                R, W = yield from asyncio.open_unix_connection(info['unix:path'], loop=loop)
-            else:
+            _log.debug('Trying %s %s', 'peer' if peer else 'bus', info)
+            R, W = await _dial(info)
+            if R is None:
                 _log.debug('No supported transport: %s', info)
                 continue
 
-            #TODO: transports not yet handled
-            #       'nonce-tcp:host=xxx,port=...,family=...,noncefile='
-            #       'tcp:host=xxx,port=...,family=...'
-            #       'unixexec:path=...,arg0=...,...'
-
-            # start authentication phase
-
-            W.write(b'\0AUTH\r\n')
-            L = yield from R.readline()
-            if not L.startswith(b'REJECTED'):
-                raise RuntimeError('Bad auth phase (not dbus?)')
-
-            methods = set(L.decode('ascii').strip().split(' ')[1:])
-            ok = False
-            _log.debug('Advertised auth methods: %s', methods)
-            methods.intersection_update(allowed_methods)
-            _log.debug('Proceed with methods: %s', methods)
-
-            if not ok and 'EXTERNAL' in methods:
-                _log.debug('Attempt EXTERNAL')
-                W.write(b'AUTH EXTERNAL '+hexencode(str(os.getuid()).encode('ascii'))+b'\r\n')
-                L = yield from R.readline()
-                if L.startswith(b'OK'):
-                    ok = True
-                    _log.debug('EXTERNAL accepted')
-                elif L.startswith(b'REJECTED'):
-                    _log.debug('EXTERNAL rejected: %s', L)
-                else:
-                    raise RuntimeError('EXTERNAL incomplete: %s'%L)
-
-            # TODO: not working
-            if not ok and 'ANONYMOUS' in methods:
-                _log.debug('Attempt ANONYMOUS')
-                W.write(b'AUTH ANONYMOUS'+hexencode(b'Nemo')+b'\r\n')
-                if L.startswith(b'OK'):
-                    ok = True
-                    _log.debug('ANONYMOUS accepted')
-                elif L.startswith(b'REJECTED'):
-                    _log.debug('ANONYMOUS rejected: %s', L)
-                else:
-                    raise RuntimeError('ANONYMOUS incomplete: %s'%L)
-
-            if not ok:
-                _log.debug('No supported auth method')
-                continue
-            else:
-                # TODO: NEGOTIATE_UNIX_FD
-                W.write(b'BEGIN\r\n')
+            R, W, guid = await _authenticate(R, W, allowed_methods=allowed_methods, unix_fd=unix_fd, loop=loop)
 
-            _log.debug('Authenticated with bus %s', info)
+            _log.debug('Authenticated with %s', info)
 
             conn = factory(W, R, info, loop=loop, **kws)
+            conn.guid = guid
         except:
             if W is not None:
                 W.close()
             _log.exception("Can't attach to %s", info)
             continue
 
+        if peer:
+            conn.setup_peer()
+            return conn
+
         # Connection now has responsibility for call R.close()
         try:
-            yield from conn.setup()
+            await conn.setup()
         except:
             conn.close()
             raise
         return conn
 
-    raise RuntimeError('No Bus')
+    raise RuntimeError('No Peer' if peer else 'No Bus')
 
-@asyncio.coroutine
-def with_connection(auth_info, func, **kws):
+async def connect_bus(infos, *,
+                allowed_methods=_supported_methods,
+                factory=ConnectionFactory,
+                loop=None,
+                unix_fd=False,
+                **kws):
+    """Accepts a sequence/generator of dictionaries describing possible bus endpoints.
+    Tries to connect to each until one succeeds.
+    
+    A coroutine
+
+    :param bool unix_fd: Request file descriptor passing (type 'h').  cf. :py:mod:`dbucket.unixfd`.
+                         Check Connection.unix_fd to see if the bus agreed.
+    :returns: Connection
+    """
+    return await _connect(infos, peer=False, allowed_methods=allowed_methods, factory=factory,
+                          loop=loop, unix_fd=unix_fd, **kws)
+
+async def connect_peer(infos, *,
+                allowed_methods=_supported_methods,
+                factory=ConnectionFactory,
+                loop=None,
+                unix_fd=False,
+                **kws):
+    """Connect directly to a peer, eg. a :py:class:`.server.Server`, without a bus daemon.
+
+    As connect_bus(), except that no Hello is sent.  The Connection has no
+    bus name, and messages are exchanged with the peer alone.
+    cf. :py:meth:`.Connection.setup_peer`
+
+    :returns: Connection
+    """
+    return await _connect(infos, peer=True, allowed_methods=allowed_methods, factory=factory,
+                          loop=loop, unix_fd=unix_fd, **kws)
+
+async def with_connection(auth_info, func, **kws):
     """A coroutine which run the provided co-routine add passes in
     a newly created Connection 'func(conn)'.
     
     The connection is closed after the func() completes.
+    Equivalent to 'async with await connect_bus(auth_info()) as conn:'
     
     This coroutine completes with the value returned by func()
     
     Remaining keyword arguments are passed to connect_bus(**kws)
     """
-    conn = yield from connect_bus(auth_info(), **kws)
-    try:
-        return (yield from func(conn))
-    finally:
-        yield from conn.close()
+    async with await connect_bus(auth_info(), **kws) as conn:
+        return (await func(conn))
 
 def with_session(func, **kws):
     return with_connection(get_session_infos, func, **kws)
@@ -0,0 +1,4 @@
+"""Micro-benchmarks run against a private test dbus-daemon.
+
+Run as eg. 'python -m dbucket.bench.calls'
+"""
@@ -0,0 +1,82 @@
+"""Compare method call rate using Futures vs. callbacks
+
+python -m dbucket.bench.calls [-n COUNT] [-d DEPTH]
+"""
+import logging
+_log = logging.getLogger(__name__)
+
+import asyncio, time
+
+from ..auth import connect_bus
+from ..proxy import Interface, Method
+from ..test.util import test_bus_info
+
+NAME = 'org.dbucket.bench'
+PATH = '/org/dbucket/bench'
+
+@Interface(NAME)
+class Echo(object):
+    @Method()
+    def Echo(self, i:int) -> int:
+        return i
+
+async def bench_future(conn, count, depth):
+    async def worker(N):
+        for i in range(N):
+            await conn.call(destination=NAME, path=PATH, interface=NAME,
+                            member='Echo', sig='i', body=i)
+    await asyncio.gather(*[worker(count//depth) for i in range(depth)])
+
+async def bench_callback(conn, count, depth):
+    done = conn.loop.create_future()
+    remaining = [count//depth*depth]
+
+    def next_call(i):
+        conn.call_cb(make_cb(i), destination=NAME, path=PATH, interface=NAME,
+                     member='Echo', sig='i', body=i)
+
+    def make_cb(i):
+        def cb(result, error):
+            remaining[0] -= 1
+            if error is not None:
+                if not done.done():
+                    done.set_exception(error)
+            elif remaining[0]==0:
+                done.set_result(None)
+            elif remaining[0]>=depth:
+                next_call(i+1)
+        return cb
+
+    for i in range(depth):
+        next_call(0)
+    await done
+
+async def main(args):
+    server = await connect_bus(test_bus_info())
+    client = await connect_bus(test_bus_info())
+    try:
+        server.attach(Echo(), path=PATH)
+        await server.daemon.RequestName(NAME, 4)
+
+        for name, fn in [('future', bench_future), ('callback', bench_callback)]:
+            # warm up
+            await fn(client, min(100, args.count), 1)
+            T0 = time.perf_counter()
+            await fn(client, args.count, args.depth)
+            T1 = time.perf_counter()
+            print('%-10s %8d calls depth %3d in %.3f s -> %.0f calls/s'%(name, args.count, args.depth,
+                                                                       T1-T0, args.count/(T1-T0)))
+    finally:
+        await asyncio.gather(client.close(), server.close())
+
+def getargs():
+    from argparse import ArgumentParser
+    P = ArgumentParser()
+    P.add_argument('-n', '--count', type=int, default=10000, help='Number of calls')
+    P.add_argument('-d', '--depth', type=int, default=1, help='Number of concurrent calls')
+    return P.parse_args()
+
+if __name__=='__main__':
+    args = getargs()
+    logging.basicConfig(level=logging.WARN)
+    asyncio.run(main(args))
@@ -0,0 +1,77 @@
+"""Memory and setup latency of many bus connections
+
+python -m dbucket.bench.conns [-n COUNT] [-d DEPTH]
+
+Opens COUNT connections to a private test dbus-daemon, DEPTH at a time,
+and reports the time taken by connect_bus() (authentication, Hello,
+and setup()) along with the memory held per open connection.
+"""
+import logging
+_log = logging.getLogger(__name__)
+
+import asyncio, time, gc, resource, tracemalloc
+
+from ..auth import connect_bus
+from ..test.util import test_bus_info
+
+def _rss():
+    'Resident set size in bytes'
+    with open('/proc/self/statm') as F:
+        return int(F.read().split()[1])*resource.getpagesize()
+
+async def main(args):
+    info = test_bus_info()
+
+    # each connection is a socket
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    need = args.count+64
+    if soft!=resource.RLIM_INFINITY and soft<need:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(need, hard), hard))
+
+    # warm up.  The first connection also builds the shared daemon proxy class
+    conn = await connect_bus(info)
+    await conn.close()
+
+    gc.collect()
+    rss0 = _rss()
+    tracemalloc.start()
+    mem0, _peak = tracemalloc.get_traced_memory()
+
+    conns, times = [], []
+    async def worker(N):
+        for i in range(N):
+            T0 = time.perf_counter()
+            conns.append(await connect_bus(info))
+            times.append(time.perf_counter()-T0)
+
+    T0 = time.perf_counter()
+    await asyncio.gather(*[worker(args.count//args.depth) for i in range(args.depth)])
+    T1 = time.perf_counter()
+
+    try:
+        gc.collect()
+        mem1, _peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        rss1 = _rss()
+
+        N = len(conns)
+        times.sort()
+        print('%d connections depth %d in %.3f s -> %.0f conn/s'%(N, args.depth, T1-T0, N/(T1-T0)))
+        print('setup latency  p50 %.2f ms  p99 %.2f ms  max %.2f ms'%(
+            times[N//2]*1e3, times[min(N-1, N*99//100)]*1e3, times[-1]*1e3))
+        print('memory per connection  python heap %.1f KB  RSS %.1f KB'%(
+            (mem1-mem0)/N/1024, (rss1-rss0)/N/1024))
+    finally:
+        await asyncio.gather(*[C.close() for C in conns])
+
+def getargs():
+    from argparse import ArgumentParser
+    P = ArgumentParser()
+    P.add_argument('-n', '--count', type=int, default=1000, help='Number of connections')
+    P.add_argument('-d', '--depth', type=int, default=1, help='Number of concurrent connects')
+    return P.parse_args()
+
+if __name__=='__main__':
+    args = getargs()
+    logging.basicConfig(level=logging.WARN)
+    asyncio.run(main(args))
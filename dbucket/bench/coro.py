@@ -0,0 +1,64 @@
+"""Compare per-call overhead of native coroutines vs. generator based coroutines
+
+python -m dbucket.bench.coro [-n COUNT]
+
+Each call passes through the same depth of coroutines as a proxy method call
+(proxy method -> Connection.call() -> Future).  Generator based coroutines
+are built with types.coroutine(), which is what @asyncio.coroutine did
+outside of debug mode.
+
+'ready' calls await an already completed Future.  'suspend' calls wait for
+the Future to be completed by the event loop, as a reply would be.
+"""
+import asyncio, time, types
+
+def _gen_chain():
+    @types.coroutine
+    def call(F):
+        return (yield from F)
+    @types.coroutine
+    def method(F):
+        return (yield from call(F))
+    @types.coroutine
+    def user(F):
+        return (yield from method(F))
+    return user
+
+def _native_chain():
+    async def call(F):
+        return (await F)
+    async def method(F):
+        return (await call(F))
+    async def user(F):
+        return (await method(F))
+    return user
+
+async def _run(top, count, suspend):
+    loop = asyncio.get_running_loop()
+    T0 = time.perf_counter()
+    for i in range(count):
+        F = loop.create_future()
+        if suspend:
+            loop.call_soon(F.set_result, i)
+        else:
+            F.set_result(i)
+        await top(F)
+    return time.perf_counter()-T0
+
+async def main(args):
+    for suspend in (False, True):
+        for name, chain in [('generator', _gen_chain), ('native', _native_chain)]:
+            top = chain()
+            await _run(top, min(1000, args.count), suspend) # warm up
+            T = await _run(top, args.count, suspend)
+            print('%-10s %-8s %8d calls in %.3f s -> %.0f ns/call'%(name, 'suspend' if suspend else 'ready',
+                                                                  args.count, T, T/args.count*1e9))
+
+def getargs():
+    from argparse import ArgumentParser
+    P = ArgumentParser()
+    P.add_argument('-n', '--count', type=int, default=200000, help='Number of calls')
+    return P.parse_args()
+
+if __name__=='__main__':
+    asyncio.run(main(getargs()))
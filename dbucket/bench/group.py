@@ -0,0 +1,96 @@
+"""Method call rate of a ConnectionGroup with 1..N event loop threads
+
+python -m dbucket.bench.group [-n COUNT] [-d DEPTH] [-t MAXTHREADS]
+
+Both the callers and the callees are ConnectionGroups.
+Each client loop calls the server loop of the same index.
+Scaling beyond one thread requires a free-threaded Python build,
+or a workload dominated by I/O.
+"""
+import logging
+_log = logging.getLogger(__name__)
+
+import os, sys, time
+
+from ..group import ConnectionGroup
+from ..proxy import Interface, Method
+from ..test.util import test_bus_info
+
+NAME = 'org.dbucket.bench'
+PATH = '/org/dbucket/bench'
+
+@Interface(NAME)
+class Echo(object):
+    @Method()
+    def Echo(self, i:int) -> int:
+        return i
+
+async def worker(conn, destination, count, depth):
+    # callback based, as in bench.calls
+    done = conn.loop.create_future()
+    remaining = [count//depth*depth]
+
+    def next_call(i):
+        conn.call_cb(on_reply, destination=destination, path=PATH, interface=NAME,
+                     member='Echo', sig='i', body=i)
+
+    def on_reply(result, error):
+        remaining[0] -= 1
+        if error is not None:
+            if not done.done():
+                done.set_exception(error)
+        elif remaining[0]==0:
+            done.set_result(None)
+        elif remaining[0]>=depth:
+            next_call(result+1)
+
+    for i in range(depth):
+        next_call(0)
+    await done
+
+def run(nthreads, count, depth):
+    server = ConnectionGroup(test_bus_info(), nthreads).start()
+    client = ConnectionGroup(test_bus_info(), nthreads).start()
+    try:
+        # an int key i is placed on loop i
+        for i in range(nthreads):
+            server.submit(i, lambda conn: conn.attach(Echo(), path=PATH)).result()
+        names = [C.name for C in server.connections]
+        each = count//nthreads
+
+        def start(nwork):
+            return [client.submit(i, worker, names[i], nwork, depth) for i in range(nthreads)]
+
+        for F in start(min(100, each)): # warm up
+            F.result()
+        T0 = time.perf_counter()
+        for F in start(each):
+            F.result()
+        T1 = time.perf_counter()
+        return each*nthreads, T1-T0
+    finally:
+        client.close()
+        server.close()
+
+def main(args):
+    gil = getattr(sys, '_is_gil_enabled', lambda: True)()
+    print('GIL %s, %d CPUs'%('enabled' if gil else 'disabled', os.cpu_count()))
+    base = None
+    for N in range(1, args.threads+1):
+        count, T = run(N, args.count, args.depth)
+        rate = count/T
+        base = base or rate
+        print('%3d threads %8d calls depth %3d in %.3f s -> %8.0f calls/s  x%.2f'%(N, count, args.depth, T, rate, rate/base))
+
+def getargs():
+    from argparse import ArgumentParser
+    P = ArgumentParser()
+    P.add_argument('-n', '--count', type=int, default=20000, help='Total number of calls')
+    P.add_argument('-d', '--depth', type=int, default=16, help='Concurrent calls per thread')
+    P.add_argument('-t', '--threads', type=int, default=min(8, os.cpu_count() or 1), help='Maximum number of threads')
+    return P.parse_args()
+
+if __name__=='__main__':
+    args = getargs()
+    logging.basicConfig(level=logging.WARN)
+    main(args)
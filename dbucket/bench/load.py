@@ -0,0 +1,463 @@
+"""Load test: sustained calls/s and signals/s, with tail latencies, as JSON
+
+python -m dbucket.bench.load [-e EXPORTERS] [-c CLIENTS] [--procs] [-w echo,array,props,signal]
+                             [-r RATE | -d DEPTH] [-t SECONDS] [--bus auto|daemon|broker|ADDRESS]
+                             [-o OUT.json] [--compare BASE.json [--tolerance 0.1]]
+
+Each exporter exports one object with methods Echo (short string),
+Array (large int32 array) and the Properties interface (GetAll of
+many properties), and emits a signal Tick.  Clients spread their calls
+over all exporters.  Closed loop (the default) keeps DEPTH calls in flight
+per client.  Open loop (--rate) sends on a fixed schedule, and measures
+latency from the scheduled time, so time spent behind schedule counts.
+For 'signal' every exporter emits Tick, and every client receives all of them.
+
+With --procs each exporter and client runs in its own process.
+Otherwise all run as tasks of one event loop.
+
+With --compare, a drop in throughput, or growth of p99 latency, beyond
+--tolerance of the earlier report is printed, and the exit code is 1.
+"""
+import logging
+_log = logging.getLogger(__name__)
+
+import asyncio, json, os, platform, sys, time
+from functools import partial
+
+from ..auth import connect_bus, makedict
+from ..proxy import Interface, Method, Signal
+from ..xcode import Variant
+
+NAME = 'org.dbucket.load'
+PATH = '/org/dbucket/load'
+PROPERTIES = 'org.freedesktop.DBus.Properties'
+WORKLOADS = ('echo', 'array', 'props', 'signal')
+
+def _name(index):
+    return '%s.e%d'%(NAME, index)
+
+_prop_types = [
+    lambda i: Variant(b'i', i),
+    lambda i: Variant(b's', 'value %d'%i),
+    lambda i: Variant(b'd', i/3.0),
+    lambda i: Variant(b'as', ['a', 'b', str(i)]),
+]
+
+@Interface(NAME)
+class Load(object):
+    def __init__(self, nprops):
+        self._props = {'Prop%d'%i:_prop_types[i%len(_prop_types)](i) for i in range(nprops)}
+        self._arrays = {}
+
+    @Method()
+    def Echo(self, s:str) -> str:
+        return s
+
+    @Method()
+    def Array(self, n:'u') -> 'ai':
+        try:
+            return self._arrays[n]
+        except KeyError:
+            A = self._arrays[n] = list(range(n))
+            return A
+
+    @Method(interface=PROPERTIES)
+    def Get(self, iface:str, name:str) -> 'v':
+        return self._props[name]
+
+    @Method(interface=PROPERTIES)
+    def GetAll(self, iface:str) -> 'a{sv}':
+        return self._props
+
+    @Signal()
+    def Tick(self, t:'d'):
+        pass
+
+def _call_spec(workload, opts):
+    if workload=='echo':
+        return dict(path=PATH, interface=NAME, member='Echo', sig='s', body='x'*opts['payload'])
+    elif workload=='array':
+        return dict(path=PATH, interface=NAME, member='Array', sig='u', body=opts['size'])
+    elif workload=='props':
+        return dict(path=PATH, interface=PROPERTIES, member='GetAll', sig='s', body=NAME)
+    raise ValueError('Unknown workload %r'%workload)
+
+class _Exporter(object):
+    def __init__(self, index, info, opts):
+        self.index, self.info, self.opts = index, info, opts
+
+    async def setup(self):
+        self.conn = await connect_bus(self.info)
+        self.obj = Load(self.opts['props'])
+        self.conn.attach(self.obj, path=PATH)
+        await self.conn.daemon.RequestName(_name(self.index), 4)
+
+    async def close(self):
+        await self.conn.close()
+
+    async def emit(self, duration, rate, depth):
+        """Emit Tick for duration seconds, with the (scheduled) send time as body.
+        Open loop at rate/s, or else in bursts of depth once the previous burst is written.
+        """
+        loop, Tick = asyncio.get_running_loop(), self.obj.Tick
+        T0 = loop.time()
+        end, sent = T0+duration, 0
+        if rate:
+            total = int(duration*rate)
+            while sent<total:
+                due = min(total, int((loop.time()-T0)*rate)+1)
+                for n in range(sent, due):
+                    Tick(T0+n/rate)
+                sent = due
+                await asyncio.sleep(max(0.0, T0+sent/rate-loop.time()))
+        else:
+            while loop.time()<end:
+                for n in range(depth):
+                    Tick(loop.time())
+                sent += depth
+                while self.conn.send_stats['signal']['queued']:
+                    await asyncio.sleep(0.001)
+                await asyncio.sleep(0)
+        return {'sent':sent}
+
+class _Client(object):
+    #: seconds to wait for replies/signals still in flight at the end of a run
+    grace = 10.0
+
+    def __init__(self, index, info, opts):
+        self.index, self.info, self.opts = index, info, opts
+        self._sub = None
+
+    async def setup(self):
+        self.conn = await connect_bus(self.info)
+
+    async def close(self):
+        if self._sub is not None:
+            await self._sub.close()
+        await self.conn.close()
+
+    async def calls(self, workload, targets, warmup, duration, rate, depth):
+        """Run calls for warmup+duration seconds.
+        Only calls scheduled after warmup are counted.
+        """
+        conn, loop = self.conn, asyncio.get_running_loop()
+        spec = _call_spec(workload, self.opts)
+        samples, errors, inflight = [], [], [0]
+        T0 = loop.time()
+        start = T0+warmup
+        end = start+duration
+
+        def issue(n, sched):
+            inflight[0] += 1
+            conn.call_cb(partial(reply, n, sched), destination=targets[n%len(targets)], **spec)
+
+        def reply(n, sched, result, error):
+            inflight[0] -= 1
+            now = loop.time()
+            if start<=sched<end:
+                if error is None:
+                    samples.append(now-sched)
+                else:
+                    errors.append(str(error))
+            if not rate and now<end:
+                issue(n+1, now)
+
+        if rate:
+            sent, total = 0, int((warmup+duration)*rate)
+            while sent<total:
+                due = min(total, int((loop.time()-T0)*rate)+1)
+                for n in range(sent, due):
+                    issue(n, T0+n/rate)
+                sent = due
+                await asyncio.sleep(max(0.0, T0+sent/rate-loop.time()))
+        else:
+            for n in range(depth):
+                issue(n, loop.time())
+            await asyncio.sleep(end-loop.time())
+
+        limit = loop.time()+self.grace
+        while inflight[0] and loop.time()<limit:
+            await asyncio.sleep(0.01)
+        return {'samples':samples, 'errors':len(errors), 'error':errors[:1], 'lost':inflight[0]}
+
+    async def subscribe(self):
+        self._ticks = []
+        self._sub = await self.conn.subscribe(self._tick, interface=NAME, member='Tick')
+
+    def _tick(self, evt):
+        self._ticks.append((evt.body, self.conn.loop.time()))
+
+    async def collect(self, warmup, duration, expect):
+        """Receive Tick for warmup+duration seconds.
+        Signals sent before warmup are not counted.
+        """
+        loop = asyncio.get_running_loop()
+        start = loop.time()+warmup
+        end = start+duration
+        await asyncio.sleep(end-loop.time())
+        limit = loop.time()+self.grace
+        while len(self._ticks)<expect and loop.time()<limit:
+            await asyncio.sleep(0.01)
+        await self._sub.close()
+        self._sub = None
+        samples = [R-T for T, R in self._ticks if start<=T<end]
+        self._ticks = []
+        return {'samples':samples, 'received':len(samples)}
+
+_roles = {'exporter':_Exporter, 'client':_Client}
+
+class _Local(object):
+    'Role running as a task of this event loop'
+    def __init__(self, kind, index, info, opts):
+        self.role = _roles[kind](index, info, opts)
+
+    async def start(self):
+        await self.role.setup()
+
+    async def run(self, cmd, *args):
+        return await getattr(self.role, cmd)(*args)
+
+    async def stop(self):
+        await self.role.close()
+
+def _child(kind, index, info, opts, pipe):
+    logging.basicConfig(level=logging.WARN)
+    asyncio.run(_child_main(kind, index, info, opts, pipe))
+
+async def _child_main(kind, index, info, opts, pipe):
+    loop = asyncio.get_running_loop()
+    role = _roles[kind](index, info, opts)
+    try:
+        await role.setup()
+    except Exception as e:
+        pipe.send(('error', repr(e)))
+        return
+    pipe.send(('ok', None))
+    try:
+        while True:
+            cmd = await loop.run_in_executor(None, pipe.recv)
+            if cmd is None:
+                break
+            try:
+                pipe.send(('ok', await getattr(role, cmd[0])(*cmd[1:])))
+            except Exception as e:
+                _log.exception('%s %d: %s', kind, index, cmd[0])
+                pipe.send(('error', repr(e)))
+    finally:
+        await role.close()
+
+class _Remote(object):
+    'Role running in a child process'
+    def __init__(self, kind, index, info, opts):
+        import multiprocessing
+        ctx = multiprocessing.get_context('spawn')
+        self.name = '%s %d'%(kind, index)
+        self.pipe, child = ctx.Pipe()
+        self.proc = ctx.Process(target=_child, args=(kind, index, info, opts, child), daemon=True)
+
+    async def _recv(self):
+        status, val = await asyncio.get_running_loop().run_in_executor(None, self.pipe.recv)
+        if status!='ok':
+            raise RuntimeError('%s: %s'%(self.name, val))
+        return val
+
+    async def start(self):
+        self.proc.start()
+        await self._recv()
+
+    async def run(self, cmd, *args):
+        self.pipe.send((cmd,)+args)
+        return await self._recv()
+
+    async def stop(self):
+        if self.proc.is_alive():
+            self.pipe.send(None)
+            await asyncio.get_running_loop().run_in_executor(None, self.proc.join, 5.0)
+        if self.proc.is_alive():
+            self.proc.kill()
+
+def latency_summary(samples):
+    """Summarize latencies, in seconds, as a dict of microseconds
+    with keys p50, p99, p999, max and mean.  Empty if no samples.
+    """
+    if not samples:
+        return {}
+    S = sorted(samples)
+    N = len(S)
+    def us(v):
+        return round(v*1e6, 1)
+    R = {'p%s'%K:us(S[min(N-1, int(q*N))]) for K, q in [('50', 0.5), ('99', 0.99), ('999', 0.999)]}
+    R['max'] = us(S[-1])
+    R['mean'] = us(sum(S)/N)
+    return R
+
+def _call_result(results, args, nclients):
+    samples = [T for R in results for T in R['samples']]
+    errors = [E for R in results for E in R['error']]
+    ret = {
+        'mode':'open' if args.rate else 'closed',
+        'count':len(samples),
+        'errors':sum(R['errors'] for R in results),
+        'lost':sum(R['lost'] for R in results),
+        'duration':args.duration,
+        'throughput':round(len(samples)/args.duration, 1),
+        'per_connection':round(len(samples)/args.duration/nclients, 1),
+        'latency_us':latency_summary(samples),
+    }
+    if args.rate:
+        ret['offered'] = args.rate
+    if errors:
+        ret['error'] = errors[0]
+    return ret
+
+def _signal_result(sent, received, args):
+    samples = [T for R in received for T in R['samples']]
+    nsent = sum(S['sent'] for S in sent)
+    ret = {
+        'mode':'open' if args.rate else 'closed',
+        'sent':nsent,
+        'count':len(samples),
+        'duration':args.duration,
+        'throughput':round(len(samples)/args.duration, 1),
+        'sent_per_connection':round(nsent/(args.warmup+args.duration)/len(sent), 1),
+        'latency_us':latency_summary(samples),
+    }
+    if args.rate:
+        ret['offered'] = args.rate
+    return ret
+
+async def run(args, info):
+    """Start exporters and clients, and run each workload in turn.
+    :returns: dict of results by workload name
+    """
+    opts = {'props':args.props, 'size':args.size, 'payload':args.payload}
+    make = _Remote if args.procs else _Local
+    exporters = [make('exporter', i, info, opts) for i in range(args.exporters)]
+    clients = [make('client', i, info, opts) for i in range(args.clients)]
+    targets = [_name(i) for i in range(args.exporters)]
+    started = []
+    results = {}
+    try:
+        for R in exporters+clients:
+            await R.start()
+            started.append(R)
+
+        for W in args.workloads:
+            _log.info('Running %s', W)
+            if W=='signal':
+                rate = args.rate and args.rate/len(exporters)
+                await asyncio.gather(*[C.run('subscribe') for C in clients])
+                # while open loop, each client expects every signal sent
+                expect = len(exporters)*int((args.warmup+args.duration)*rate) if rate else 0
+                sent, received = await asyncio.gather(
+                    asyncio.gather(*[E.run('emit', args.warmup+args.duration, rate, args.depth) for E in exporters]),
+                    asyncio.gather(*[C.run('collect', args.warmup, args.duration, expect) for C in clients]),
+                )
+                results[W] = _signal_result(sent, received, args)
+            else:
+                rate = args.rate and args.rate/len(clients)
+                R = await asyncio.gather(*[C.run('calls', W, targets, args.warmup, args.duration, rate, args.depth)
+                                           for C in clients])
+                results[W] = _call_result(R, args, len(clients))
+    finally:
+        await asyncio.gather(*[R.stop() for R in started])
+    return results
+
+def compare(base, report, tolerance):
+    """Compare two reports.
+    :returns: list of regressions, as strings.  Empty if none.
+    """
+    bad = []
+    for W, R in report['results'].items():
+        B = base.get('results', {}).get(W)
+        if B is None:
+            continue
+        if R['throughput'] < B['throughput']*(1.0-tolerance):
+            bad.append('%s throughput %.1f/s < %.1f/s'%(W, R['throughput'], B['throughput']))
+        P, BP = R['latency_us'].get('p99'), B['latency_us'].get('p99')
+        if P is not None and BP is not None and P > BP*(1.0+tolerance):
+            bad.append('%s p99 latency %.1f us > %.1f us'%(W, P, BP))
+    return bad
+
+def _start_bus(bus):
+    """:returns: (runner or None, bus info list)
+    """
+    from ..test.util import DaemonRunner, BrokerRunner, test_bus_runner
+    if bus=='auto':
+        R = test_bus_runner()()
+    elif bus=='daemon':
+        R = DaemonRunner()
+    elif bus=='broker':
+        R = BrokerRunner()
+    else:
+        return None, [makedict(bus)]
+    R.start()
+    return R, R.get_info()
+
+def main(args):
+    runner, info = _start_bus(args.bus)
+    try:
+        T0 = time.time()
+        results = asyncio.run(run(args, info))
+    finally:
+        if runner is not None:
+            runner.stop()
+
+    report = {
+        'time':T0,
+        'config':{K:getattr(args, K) for K in ('exporters', 'clients', 'procs', 'workloads', 'rate', 'depth',
+                                               'duration', 'warmup', 'props', 'size', 'payload')},
+        'system':{
+            'bus':runner.daemon if runner is not None else args.bus,
+            'python':'%s %s'%(platform.python_implementation(), platform.python_version()),
+            'platform':platform.platform(),
+            'cpus':os.cpu_count(),
+        },
+        'results':results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as F:
+            F.write(text+'\n')
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as F:
+            bad = compare(json.load(F), report, args.tolerance)
+        for L in bad:
+            print('Regression:', L, file=sys.stderr)
+        return 1 if bad else 0
+    return 0
+
+def getargs():
+    from argparse import ArgumentParser
+    P = ArgumentParser()
+    P.add_argument('-e', '--exporters', type=int, default=1, help='Number of exporting connections')
+    P.add_argument('-c', '--clients', type=int, default=1, help='Number of client connections')
+    P.add_argument('--procs', action='store_true', help='Run each exporter and client in a separate process')
+    P.add_argument('-w', '--workloads', type=lambda s:s.split(','), default=list(WORKLOADS),
+                   help='Comma separated list from: %s'%', '.join(WORKLOADS))
+    P.add_argument('-r', '--rate', type=float, help='Open loop.  Total calls/s, or signals/s, to offer')
+    P.add_argument('-d', '--depth', type=int, default=1,
+                   help='Closed loop.  Calls in flight per client, or signals per burst')
+    P.add_argument('-t', '--duration', type=float, default=5.0, help='Seconds measured per workload')
+    P.add_argument('--warmup', type=float, default=1.0, help='Seconds before measurement starts')
+    P.add_argument('--props', type=int, default=100, help='Number of properties for "props"')
+    P.add_argument('--size', type=int, default=4096, help='Array length for "array"')
+    P.add_argument('--payload', type=int, default=16, help='String length for "echo"')
+    P.add_argument('--bus', default='auto',
+                   help='"daemon", "broker", "auto" ($DBUCKET_TEST_BUS), or the address of a running bus')
+    P.add_argument('-o', '--output', help='Write JSON report to this file instead of stdout')
+    P.add_argument('--compare', metavar='BASE', help='Earlier JSON report to check for regressions')
+    P.add_argument('--tolerance', type=float, default=0.1, help='Allowed fractional change (default 0.1)')
+    args = P.parse_args()
+    for W in args.workloads:
+        if W not in WORKLOADS:
+            P.error('Unknown workload %r'%W)
+    return args
+
+if __name__=='__main__':
+    args = getargs()
+    logging.basicConfig(level=logging.WARN)
+    sys.exit(main(args))
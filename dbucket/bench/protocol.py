@@ -0,0 +1,57 @@
+"""Protocol throughput in memory, without sockets or an event loop
+
+python -m dbucket.bench.protocol [-n COUNT] [-b BATCH] [-s SIZE]
+
+A client Protocol encodes method calls, which a server Protocol decodes
+and replies to.  BATCH messages are passed between them in each chunk,
+as if read from a socket together.
+"""
+import time
+
+from ..protocol import Protocol, METHOD_CALL
+
+def run(count, batch, size):
+    client, server = Protocol(), Protocol()
+    arg = 'x'*size
+    done = 0
+    T0 = time.perf_counter()
+    while done<count:
+        N = min(batch, count-done)
+        S = []
+        for i in range(N):
+            SN, M = client.call(None, path='/bench', interface='org.dbucket.bench', member='Echo',
+                                destination=':1.1', sig='s', body=arg)
+            S.extend(M)
+        server.receive_data(b''.join(S))
+
+        S = []
+        while True:
+            evt = server.next_event()
+            if evt is None:
+                break
+            assert evt.type==METHOD_CALL
+            evt.sender = ':1.2' # normally set by the daemon
+            S.extend(server.method_return(evt, 's', evt.body))
+        client.receive_data(b''.join(S))
+
+        while True:
+            evt = client.next_event()
+            if evt is None:
+                break
+            client.take_reply(evt)
+            done += 1
+    return time.perf_counter()-T0
+
+def getargs():
+    from argparse import ArgumentParser
+    P = ArgumentParser()
+    P.add_argument('-n', '--count', type=int, default=20000, help='Number of calls')
+    P.add_argument('-b', '--batch', type=int, default=16, help='Messages per chunk')
+    P.add_argument('-s', '--size', type=int, default=16, help='Argument length')
+    return P.parse_args()
+
+if __name__=='__main__':
+    args = getargs()
+    run(min(1000, args.count), args.batch, args.size) # warm up
+    T = run(args.count, args.batch, args.size)
+    print('%8d calls batch %3d in %.3f s -> %.0f calls/s'%(args.count, args.batch, T, args.count/T))
@@ -0,0 +1,299 @@
+"""Blocking API for threaded code
+
+A :py:class:`BlockingConnection` owns one event loop, run by a background
+thread, and one persistent Connection.  Its methods may be called from any
+other thread, and block until complete.
+
+  with BlockingConnection(get_session_infos()) as conn:
+      names = conn.call(destination=DBUS, path=DBUS_PATH, interface=DBUS, member='ListNames')
+
+      daemon = conn.proxy(destination=DBUS, path=DBUS_PATH, interface=DBUS)
+      print(daemon.GetId())
+
+      with conn.signals(interface='org.example', member='Changed') as S:
+          for evt in S:
+              ...
+
+Work submitted from any number of threads is queued, and the loop thread is
+woken once for each batch rather than once per call.
+"""
+import logging
+_log = logging.getLogger(__name__)
+
+import threading, queue, inspect
+from collections import deque
+from functools import partial
+import asyncio
+import concurrent.futures
+
+from .auth import connect_bus
+from .group import LoopThread
+from .proxy import PropertyAccessor
+
+__all__ = [
+    'BlockingConnection',
+    'BlockingProxy',
+    'SignalIterator',
+]
+
+def _reply(F, result, error):
+    if error is None:
+        F.set_result(result)
+    else:
+        F.set_exception(error)
+
+def _chain(F, fut):
+    if fut.cancelled():
+        F.cancel()
+    elif fut.exception() is not None:
+        F.set_exception(fut.exception())
+    else:
+        F.set_result(fut.result())
+
+def _start_await(F, fn):
+    ret = fn()
+    if inspect.isawaitable(ret):
+        asyncio.ensure_future(ret).add_done_callback(partial(_chain, F))
+    else:
+        F.set_result(ret)
+
+class BlockingConnection(object):
+    """A Connection with a private event loop thread, for use from other threads.
+
+    :param infos: Bus address(es), as for :py:func:`.connect_bus`
+    :param float timeout: Default timeout (seconds) of blocking operations.  None waits forever.
+    :param kws: Passed to :py:func:`.connect_bus`
+    """
+    def __init__(self, infos, *, timeout=None, **kws):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._pending = deque() # [(concurrent Future, fn, arg)]
+        self._scheduled = False
+        #: Number of times the loop thread was woken to run submitted work
+        self.wakeups = 0
+
+        self._LT = LoopThread(name='dbucket-blocking')
+        try:
+            self.conn = self._LT.submit(connect_bus(list(infos), **kws)).result(timeout)
+        except:
+            self._LT.stop()
+            raise
+
+    @property
+    def name(self):
+        'My unique bus name'
+        return self.conn.name
+
+    def close(self):
+        """Close the Connection, and stop the loop thread.
+        """
+        if self._LT is None:
+            return
+        try:
+            self.run(lambda conn: conn.close())
+        finally:
+            LT, self._LT = self._LT, None
+            LT.stop(self.timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, A, B, C):
+        self.close()
+
+    def _submit(self, fn, arg):
+        if self._LT is None:
+            raise RuntimeError("BlockingConnection closed")
+        F = concurrent.futures.Future()
+        with self._lock:
+            self._pending.append((F, fn, arg))
+            wake = not self._scheduled
+            self._scheduled = True
+        if wake:
+            self._LT.call_soon(self._run_pending)
+        return F
+
+    def _run_pending(self):
+        # in loop thread.  Runs everything submitted since the last wake up
+        with self._lock:
+            Q, self._pending = self._pending, deque()
+            self._scheduled = False
+        self.wakeups += 1
+        for F, fn, arg in Q:
+            if F.set_running_or_notify_cancel():
+                try:
+                    fn(F, arg)
+                except Exception as e:
+                    F.set_exception(e)
+
+    def _wait(self, F, timeout):
+        if self._LT is not None and self._LT.in_thread:
+            raise RuntimeError("Blocking call from the BlockingConnection loop thread would deadlock")
+        return F.result(self.timeout if timeout is None else timeout)
+
+    def _start_call(self, F, kws):
+        self.conn.call_cb(partial(_reply, F), **kws)
+
+    def call_async(self, **kws):
+        """As call(), without waiting.
+
+        :returns: concurrent.futures.Future
+        """
+        return self._submit(self._start_call, kws)
+
+    def call(self, *, timeout=None, **kws):
+        """Call a remote method, and wait for the result.
+        Keyword arguments are passed to :py:meth:`.Connection.call`.
+
+        :throws: RemoteError, or concurrent.futures.TimeoutError
+        """
+        return self._wait(self.call_async(**kws), timeout)
+
+    def signal(self, **kws):
+        """Emit a signal.  Keyword arguments are passed to :py:meth:`.Connection.signal`.
+        Does not wait.
+        """
+        self._submit(_start_await, partial(self.conn.signal, **kws))
+
+    def run(self, fn, *args, timeout=None):
+        """Run 'fn(conn, *args)' in the loop thread, and wait for the result.
+        fn may be a coroutine function.  eg. to attach() an object.
+        """
+        return self._wait(self._submit(_start_await, partial(fn, self.conn, *args)), timeout)
+
+    def proxy(self, *, destination=None, path=None, interface=None, timeout=None):
+        """Build a proxy from introspection data.  cf. :py:meth:`.Connection.proxy`
+
+        :returns: BlockingProxy
+        """
+        P = self.run(lambda conn: conn.proxy(destination=destination, path=path, interface=interface),
+                     timeout=timeout)
+        return BlockingProxy(self, P)
+
+    def signals(self, *, maxsize=100, timeout=None, **kws):
+        """Subscribe to signals.  Keyword arguments are passed to :py:meth:`.Subscription.add`.
+
+        :param int maxsize: Signals are dropped, and counted, when this many are waiting to be taken.
+        :returns: SignalIterator
+        """
+        S = SignalIterator(self, maxsize)
+        S._sub = self.run(lambda conn: conn.subscribe(S._push, **kws), timeout=timeout)
+        return S
+
+class BlockingProxy(object):
+    """Wraps a proxy object so that method calls, and property reads, block.
+
+    Methods accept an additional keyword argument timeout=.
+    Streaming methods return an iterator over the chunks.
+    """
+    def __init__(self, bconn, proxy):
+        self._bconn, self._proxy = bconn, proxy
+
+    def __getattr__(self, name):
+        B, P = self._bconn, self._proxy
+        # from the class, as a PropertyAccessor must only be evaluated in the loop thread
+        A = getattr(type(P), name)
+        if getattr(A, '_dbus_chunked', False):
+            def meth(*args):
+                return _ChunkIterator(B, B.run(lambda conn: A(P, *args)))
+        elif hasattr(A, '_dbus_method'):
+            def meth(*args, timeout=None):
+                return B._wait(B._submit(_start_await, partial(A, P, *args)), timeout)
+        elif isinstance(A, PropertyAccessor):
+            return B.run(lambda conn: A.__get__(P, type(P)))
+        else:
+            raise AttributeError(name)
+        meth.__name__, meth.__doc__ = name, A.__doc__
+        return meth
+
+    def __repr__(self):
+        return 'Blocking%r'%(self._proxy,)
+
+class _ChunkIterator(object):
+    def __init__(self, bconn, stream):
+        self._bconn, self._S = bconn, stream
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        async def take(conn):
+            try:
+                return True, await self._S.__anext__()
+            except StopAsyncIteration:
+                return False, None
+        ok, V = self._bconn.run(take)
+        if not ok:
+            raise StopIteration
+        return V
+
+    def close(self):
+        self._bconn.run(lambda conn: self._S.aclose())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, A, B, C):
+        self.close()
+
+_END = object()
+
+class SignalIterator(object):
+    """Iterator over received signals (:py:class:`.BusEvent`).
+    Returned by :py:meth:`BlockingConnection.signals`.
+
+    Iteration ends after close().
+    """
+    def __init__(self, bconn, maxsize):
+        self._bconn, self._sub = bconn, None
+        self._Q = queue.Queue(maxsize)
+        self._closed = False
+        #: Number of signals dropped as the queue was full
+        self.dropped = 0
+
+    def _push(self, evt):
+        # in loop thread
+        try:
+            self._Q.put_nowait(evt)
+        except queue.Full:
+            self.dropped += 1
+
+    def get(self, timeout=None):
+        """Take the next signal.
+
+        :throws: queue.Empty on timeout.  StopIteration after close()
+        """
+        evt = self._Q.get(timeout=timeout)
+        if evt is _END:
+            self._Q.put_nowait(_END) # for other waiters
+            raise StopIteration
+        return evt
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.get()
+
+    def close(self):
+        """Unsubscribe, and wake any waiting get()
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._bconn.run(lambda conn: self._sub.close())
+        while True:
+            try:
+                self._Q.put_nowait(_END)
+                break
+            except queue.Full:
+                try:
+                    self._Q.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, A, B, C):
+        self.close()
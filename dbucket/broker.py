@@ -0,0 +1,714 @@
+"""A minimal message bus, in python
+
+:py:class:`Broker` stands in for dbus-daemon, eg. for tests and benchmarks
+which should not depend on an external binary.  Supported are: Hello and
+unique names, RequestName/ReleaseName with queueing, NameOwnerChanged,
+NameAcquired and NameLost, AddMatch/RemoveMatch, and unicast and broadcast
+routing over unix sockets, with file descriptor passing.  There is no
+service activation, no security policy, and no eavesdropping or monitoring.
+
+  B = await Broker(abstract='dbucket-test').start()
+  conn = await connect_bus([B.info])
+
+Or as a separate process, which prints its address once listening.
+
+  python -m dbucket.broker [--address unix:abstract=NAME] [--print-address]
+
+Messages are forwarded without decoding the body.  The header is re-encoded
+only to append the sender field, replacing any set by the client.
+A client sending an invalid message is disconnected.
+"""
+import logging
+_log = logging.getLogger(__name__)
+
+import os, re, struct
+import asyncio
+
+from .conn import DBUS, DBUS_PATH, INTROSPECTABLE, UnknownMethod, UnknownInterface, RemoteError
+from .protocol import (Protocol, BusEvent, _frame, _FDFrame,
+                       METHOD_CALL, METHOD_RETURN, ERROR, SIGNAL)
+from .server import Server
+from .valid import is_bus_name
+from .xcode import decode, Decoder, Encoder, Variant
+
+__all__ = [
+    'Broker',
+    'parse_match',
+]
+
+PEER = 'org.freedesktop.DBus.Peer'
+PROPERTIES = 'org.freedesktop.DBus.Properties'
+
+# RequestName() flags
+ALLOW_REPLACEMENT = 1
+REPLACE_EXISTING = 2
+DO_NOT_QUEUE = 4
+
+# message header flags
+_NO_REPLY_EXPECTED = 1
+
+def _err(name):
+    return 'org.freedesktop.DBus.Error.'+name
+
+_MSGTYPES = {
+    'method_call':METHOD_CALL,
+    'method_return':METHOD_RETURN,
+    'error':ERROR,
+    'signal':SIGNAL,
+}
+_argkey = re.compile(r'^arg([0-9]{1,2})(path|namespace)?$')
+
+def parse_match(expr):
+    """Split a match rule into a dict.  eg. "type='signal',arg0='it'\\''s'"
+
+    :throws: ValueError
+    """
+    ret, i, N = {}, 0, len(expr)
+    while i<N:
+        eq = expr.find('=', i)
+        if eq<0:
+            raise ValueError("Expected key=value in match rule: %r"%expr)
+        key = expr[i:eq].strip()
+        val, quoted, i = [], False, eq+1
+        while i<N:
+            c = expr[i]
+            if quoted:
+                if c=="'":
+                    quoted = False
+                else:
+                    val.append(c)
+            elif c=="'":
+                quoted = True
+            elif c=='\\' and expr[i+1:i+2]=="'":
+                val.append("'")
+                i += 1
+            elif c==',':
+                break
+            else:
+                val.append(c)
+            i += 1
+        if quoted:
+            raise ValueError("Unterminated quote in match rule: %r"%expr)
+        elif key in ret:
+            raise ValueError("Duplicate key '%s' in match rule"%key)
+        ret[key] = ''.join(val)
+        i += 1 # skip ','
+    return ret
+
+class _Rule(object):
+    # a parsed match rule
+    __slots__ = ('type', 'sender', 'fields', 'path_namespace', 'args')
+    def __init__(self, expr):
+        self.type = self.sender = self.path_namespace = None
+        self.fields, self.args = [], [] # [(attr, value)], [(N, kind, value)]
+        for K, V in parse_match(expr).items():
+            M = _argkey.match(K)
+            if K=='type':
+                try:
+                    self.type = _MSGTYPES[V]
+                except KeyError:
+                    raise ValueError("Unknown message type '%s'"%V)
+            elif K=='sender':
+                self.sender = V
+            elif K in ('interface', 'member', 'path', 'destination'):
+                self.fields.append((K, V))
+            elif K=='path_namespace':
+                self.path_namespace = V.rstrip('/')
+            elif K=='eavesdrop':
+                pass
+            elif M is not None and int(M.group(1))<64 and (M.group(2)!='namespace' or M.group(1)=='0'):
+                self.args.append((int(M.group(1)), M.group(2), V))
+            else:
+                raise ValueError("Unknown match rule key '%s'"%K)
+
+    def test(self, evt, owner, args):
+        """owner(name) is the unique name owning a well-known name.
+        args() returns the decoded message arguments as a tuple.
+        """
+        if self.type is not None and evt.type!=self.type:
+            return False
+        for K, V in self.fields:
+            if getattr(evt, K)!=V:
+                return False
+        if self.path_namespace is not None:
+            P, NS = evt.path, self.path_namespace
+            if not (P==NS or P.startswith(NS+'/')):
+                return False
+        if self.sender is not None and evt.sender!=self.sender and owner(self.sender)!=evt.sender:
+            return False
+        if self.args:
+            A = args()
+            for N, kind, V in self.args:
+                if N>=len(A) or not isinstance(A[N], str):
+                    return False
+                S = A[N]
+                if kind is None:
+                    if S!=V:
+                        return False
+                elif kind=='path':
+                    if not (S==V or (V.endswith('/') and S.startswith(V)) or (S.endswith('/') and V.startswith(S))):
+                        return False
+                elif not (S==V or S.startswith(V+'.')): # namespace
+                    return False
+        return True
+
+class _Client(object):
+    def __init__(self, R, W, creds, unix_fd):
+        self.R, self.W, self.creds = R, W, creds
+        self.unix_fd = unix_fd
+        self.proto = Protocol(unix_fd=unix_fd)
+        #: Unique name.  None until Hello
+        self.name = None
+        #: Well-known names owned, or queued for
+        self.names = set()
+        #: {expr:[_Rule, count]}
+        self.rules = {}
+        self._sender = {} # {lsb:encoded header field}
+
+    def sender_field(self, lsb):
+        'The sender header field, encoded to be appended to an 8 byte aligned header array'
+        try:
+            return self._sender[lsb]
+        except KeyError:
+            E = Encoder(0, lsb)
+            E.encode(b'(yv)', ((7, self.name),))
+            F = self._sender[lsb] = b''.join(E.bufs)
+            return F
+
+    def __repr__(self):
+        return '_Client(%s, pid=%d)'%(self.name, self.creds[0])
+
+class _Disconnect(Exception):
+    pass
+
+def _strip_sender(raw, lsb):
+    """Remove the sender field from the header of a received message.
+
+    :returns: The message header, with its field array length updated.  Without body.
+    """
+    L = '<I' if lsb else '>I'
+    hlen, = struct.unpack_from(L, raw, 12)
+    D = Decoder(memoryview(raw)[16:16+hlen], 16, lsb)
+    fields, size = [], 0
+    while D.bpos<16+hlen:
+        D._dalign(8)
+        start = D.bpos
+        code, _val = D.decode(b'yv')
+        if code!=7:
+            # fields start 8 byte aligned, so moving one keeps its alignment
+            pad = (-size)%8
+            fields += [b'\0'*pad, raw[start:D.bpos]]
+            size += pad+D.bpos-start
+    return b''.join([raw[:12], struct.pack(L, size)]+fields)
+
+_methods = {} # {(interface, member):(function name, in sig, out sig)}
+
+def _method(interface, insig='', outsig=''):
+    def decorate(fn):
+        _methods[(interface, fn.__name__.lstrip('_'))] = (fn.__name__, insig, outsig)
+        return fn
+    return decorate
+
+_DBUS_EXTRA = '''
+    <property name="Features" type="as" access="read"/>
+    <property name="Interfaces" type="as" access="read"/>
+    <signal name="NameOwnerChanged"><arg type="s"/><arg type="s"/><arg type="s"/></signal>
+    <signal name="NameLost"><arg type="s"/></signal>
+    <signal name="NameAcquired"><arg type="s"/></signal>'''
+
+def _introspect():
+    ifaces = {}
+    for (iface, member), (_fn, insig, outsig) in _methods.items():
+        L = ifaces.setdefault(iface, [])
+        L.append('    <method name="%s">'%member)
+        L.extend(['<arg direction="in" type="%s"/>'%T for T in _split(insig)])
+        L.extend(['<arg direction="out" type="%s"/>'%T for T in _split(outsig)])
+        L.append('</method>\n')
+    S = ['<!DOCTYPE node PUBLIC "-//freedesktop//DTD D-BUS Object Introspection 1.0//EN"\n'
+         '"http://www.freedesktop.org/standards/dbus/1.0/introspect.dtd">\n<node>\n']
+    for iface, L in ifaces.items():
+        S.append('  <interface name="%s">\n'%iface)
+        S.extend(L)
+        if iface==DBUS:
+            S.append(_DBUS_EXTRA+'\n')
+        S.append('  </interface>\n')
+    S.append('</node>\n')
+    return ''.join(S)
+
+def _split(sig):
+    # complete types of a signature.  Only those used by the bus methods.
+    ret = []
+    while sig:
+        N = 1
+        while sig[N-1]=='a':
+            N += 1
+        if sig[N-1]=='{':
+            N = sig.index('}', N)+1
+        ret.append(sig[:N])
+        sig = sig[N:]
+    return ret
+
+class Broker(Server):
+    """A message bus listening on a unix socket.
+
+    :param str path: Filesystem path of the socket.
+    :param str abstract: Or a name in the abstract namespace (Linux).
+    :param uids: User ids allowed to connect.  Default is the uid of this process.  None allows any.
+    :param bool unix_fd: Agree to file descriptor passing if requested.
+    """
+    read_size = 64*1024
+    #: Reading from a sender pauses while a recipient has more than this many bytes waiting to be sent.
+    high_water = 256*1024
+
+    def __init__(self, *, path=None, abstract=None, uids=(os.getuid(),),
+                 unix_fd=True, auth_timeout=10.0, loop=None):
+        Server.__init__(self, None, path=path, abstract=abstract, uids=uids, unix_fd=unix_fd,
+                        auth_timeout=auth_timeout, loop=loop)
+        self._proto = Protocol() # serial numbers and encoding of messages from the bus itself
+        self._clients = {} # {unique name:_Client} after Hello
+        self._names = {} # {well-known name:[[_Client, flags]]}  Primary owner first
+        self._congested = set() # [_Client]
+        self._nextid = 1
+        #: Number of messages received from clients
+        self.received = 0
+        #: Number of messages sent to clients
+        self.sent = 0
+
+    # connection handling
+
+    async def _connected(self, R, W, creds):
+        C = _Client(R, W, creds, unix_fd=hasattr(R, 'take_fds'))
+        P, take_fds = C.proto, getattr(R, 'take_fds', None)
+        try:
+            while True:
+                data = await R.read(self.read_size)
+                if not data:
+                    break
+                if take_fds is not None:
+                    P.receive_fds(take_fds())
+                P.receive_data(data)
+
+                while True:
+                    M = P.next_message()
+                    if M is None:
+                        break
+                    self.received += 1
+                    self._route(C, *M)
+
+                while self._congested:
+                    D = self._congested.pop()
+                    try:
+                        await D.W.drain()
+                    except ConnectionError:
+                        pass
+
+        except (RuntimeError, ValueError, _Disconnect) as e:
+            # invalid message or body
+            _log.warning("Disconnect %s: %s", C, e)
+        except ConnectionError as e:
+            _log.debug("Disconnect %s: %s", C, e)
+        finally:
+            self._disconnect(C)
+
+    def _disconnect(self, C):
+        self._congested.discard(C)
+        if C.name is not None and self._clients.get(C.name) is C:
+            del self._clients[C.name]
+            for name in list(C.names):
+                self._release(C, name)
+            self._owner_changed(C.name, C, None)
+        C.W.close()
+
+    def _send(self, D, S):
+        W = D.W
+        if W.is_closing():
+            return
+        W.writelines(S)
+        self.sent += 1
+        if W.transport.get_write_buffer_size()>self.high_water:
+            self._congested.add(D)
+
+    def _owner(self, name):
+        'The _Client owning a name, or None'
+        if name[:1]==':':
+            return self._clients.get(name)
+        Q = self._names.get(name)
+        if Q:
+            return Q[0][0]
+
+    def _owner_name(self, name):
+        D = self._owner(name)
+        if D is not None:
+            return D.name
+
+    # routing
+
+    def _route(self, C, evt, body, lsb, raw):
+        if C.name is None:
+            if evt.type==METHOD_CALL and evt.destination==DBUS and evt.member=='Hello':
+                self._hello(C, evt, raw)
+                return
+            raise _Disconnect('Message before Hello')
+
+        if evt.sender is not None:
+            # replaced, as dbus-daemon does
+            raw = _strip_sender(raw, lsb)
+        evt.sender = C.name
+
+        dest = evt.destination
+        if dest is None:
+            if evt.type==SIGNAL:
+                self._broadcast(evt, self._forward_frame(C, evt, body, lsb, raw), _Args(evt, body, lsb))
+        elif dest==DBUS:
+            if evt.type==METHOD_CALL:
+                self._bus_call(C, evt, body, lsb, raw)
+        else:
+            D = self._owner(dest)
+            if D is None:
+                if evt.type==METHOD_CALL:
+                    self._error(C, evt, raw, _err('ServiceUnknown'),
+                                'The name %s was not provided by any .service files'%dest)
+            elif evt._fds and not D.unix_fd:
+                if evt.type==METHOD_CALL:
+                    self._error(C, evt, raw, _err('NotSupported'),
+                                'Recipient %s does not accept file descriptors'%dest)
+            else:
+                self._send(D, self._forward_frame(C, evt, body, lsb, raw))
+
+    def _forward_frame(self, C, evt, body, lsb, raw):
+        # append the sender field to the received header
+        L = '<I' if lsb else '>I'
+        hlen, = struct.unpack_from(L, raw, 12)
+        pad = (-hlen)%8
+        field = C.sender_field(lsb)
+        header = b''.join([raw[:12], struct.pack(L, hlen+pad+len(field)), raw[16:16+hlen], b'\0'*pad, field])
+        S = _frame(header, body)
+        if evt._fds:
+            S = _FDFrame(S, evt._fds)
+        return S
+
+    def _broadcast(self, evt, S, args):
+        owner = self._owner_name
+        fds = bool(evt._fds)
+        for D in list(self._clients.values()):
+            if fds and not D.unix_fd:
+                continue
+            for R, _n in D.rules.values():
+                if R.test(evt, owner, args):
+                    self._send(D, S)
+                    break
+
+    # messages from the bus itself
+
+    def _bus_message(self, msg):
+        msg.opts.append((7, DBUS)) # sender
+        return self._proto.encode(msg)
+
+    def _reply(self, C, evt, raw, sig, body):
+        if not raw[2]&_NO_REPLY_EXPECTED:
+            self._send(C, self._bus_message(self._proto.prepare_return(evt, sig or None, body)))
+
+    def _error(self, C, evt, raw, name, msg):
+        if not raw[2]&_NO_REPLY_EXPECTED:
+            self._send(C, self._bus_message(self._proto.prepare_error(evt, name, msg)))
+
+    def _signal(self, member, sig, body, destination=None):
+        P = self._proto
+        msg = P.prepare_signal(path=DBUS_PATH, interface=DBUS, member=member, destination=destination,
+                               sig=sig, body=body)
+        S = self._bus_message(msg)
+        if destination is not None:
+            D = self._clients.get(destination)
+            if D is not None:
+                self._send(D, S)
+        else:
+            evt = BusEvent.build(SIGNAL, msg.serial, sender=DBUS, path=DBUS_PATH, interface=DBUS,
+                                 member=member, sig=sig, body=body)
+            self._broadcast(evt, S, lambda: body if isinstance(body, tuple) else (body,))
+
+    def _owner_changed(self, name, old, new):
+        self._signal('NameOwnerChanged', 'sss', (name, old.name if old else '', new.name if new else ''))
+        if old is not None:
+            self._signal('NameLost', 's', name, destination=old.name)
+        if new is not None:
+            self._signal('NameAcquired', 's', name, destination=new.name)
+
+    # bus methods
+
+    def _hello(self, C, evt, raw):
+        C.name = ':1.%d'%self._nextid
+        self._nextid += 1
+        self._clients[C.name] = C
+        evt.sender = C.name
+        self._reply(C, evt, raw, 's', C.name)
+        self._owner_changed(C.name, None, C)
+
+    def _bus_call(self, C, evt, body, lsb, raw):
+        iface = evt.interface
+        if iface is None:
+            for I in (DBUS, PEER, INTROSPECTABLE, PROPERTIES):
+                if (I, evt.member) in _methods:
+                    iface = I
+                    break
+        try:
+            fn, insig, outsig = _methods[(iface, evt.member)]
+        except KeyError:
+            if iface not in (DBUS, PEER, INTROSPECTABLE, PROPERTIES):
+                self._error(C, evt, raw, UnknownInterface, "Unknown interface '%s'"%iface)
+            else:
+                self._error(C, evt, raw, UnknownMethod, "Unknown method '%s.%s'"%(iface, evt.member))
+            return
+
+        sig = (evt.sig or b'').decode('ascii')
+        if sig!=insig:
+            self._error(C, evt, raw, _err('InvalidArgs'),
+                        "Call to %s has signature '%s', expected '%s'"%(evt.member, sig, insig))
+            return
+        C.proto.decode_body(evt, body, lsb)
+        B = evt.body
+        args = () if not insig else B if len(_split(insig))>1 else (B,)
+
+        try:
+            ret = getattr(self, fn)(C, *args)
+        except RemoteError as e:
+            self._error(C, evt, raw, e.name, str(e))
+        else:
+            self._reply(C, evt, raw, outsig, ret)
+
+    def _check_name(self, name):
+        if not is_bus_name(name) or name==DBUS:
+            raise RemoteError("Invalid well-known name '%s'"%name, name=_err('InvalidArgs'))
+
+    def _client(self, name, what):
+        D = self._owner(name)
+        if D is None:
+            raise RemoteError("Could not get %s of name '%s': no such name"%(what, name), name=_err('NameHasNoOwner'))
+        return D
+
+    @_method(DBUS, '', 's')
+    def _Hello(self, C):
+        raise RemoteError("Already handled an Hello message", name=_err('Failed'))
+
+    @_method(DBUS, 'su', 'u')
+    def _RequestName(self, C, name, flags):
+        self._check_name(name)
+        Q = self._names.get(name)
+        if Q is None:
+            self._names[name] = [[C, flags]]
+            C.names.add(name)
+            self._owner_changed(name, None, C)
+            return 1 # primary owner
+
+        E = ([E for E in Q if E[0] is C] or [None])[0]
+        P, pflags = Q[0]
+        if P is C:
+            Q[0][1] = flags
+            return 4 # already owner
+
+        elif (flags&REPLACE_EXISTING) and (pflags&ALLOW_REPLACEMENT):
+            if E is not None:
+                Q.remove(E)
+            Q[0] = [C, flags]
+            C.names.add(name)
+            if pflags&DO_NOT_QUEUE:
+                P.names.discard(name)
+            else:
+                Q.insert(1, [P, pflags])
+            self._owner_changed(name, P, C)
+            return 1
+
+        elif flags&DO_NOT_QUEUE:
+            if E is not None:
+                Q.remove(E)
+                C.names.discard(name)
+            return 3 # exists
+
+        elif E is None:
+            Q.append([C, flags])
+            C.names.add(name)
+        else:
+            E[1] = flags
+        return 2 # in queue
+
+    @_method(DBUS, 's', 'u')
+    def _ReleaseName(self, C, name):
+        self._check_name(name)
+        if name not in self._names:
+            return 2 # non-existent
+        elif name not in C.names:
+            return 3 # not owner
+        self._release(C, name)
+        return 1
+
+    def _release(self, C, name):
+        Q = self._names[name]
+        C.names.discard(name)
+        if Q[0][0] is C:
+            Q.pop(0)
+            if not Q:
+                del self._names[name]
+            self._owner_changed(name, C, Q[0][0] if Q else None)
+        else:
+            Q[:] = [E for E in Q if E[0] is not C]
+
+    @_method(DBUS, 'su', 'u')
+    def _StartServiceByName(self, C, name, flags):
+        if self._owner(name) is None:
+            raise RemoteError('The name %s was not provided by any .service files'%name,
+                              name=_err('ServiceUnknown'))
+        return 2 # already running
+
+    @_method(DBUS, 'a{ss}')
+    def _UpdateActivationEnvironment(self, C, env):
+        pass
+
+    @_method(DBUS, 's', 'b')
+    def _NameHasOwner(self, C, name):
+        return name==DBUS or self._owner(name) is not None
+
+    @_method(DBUS, '', 'as')
+    def _ListNames(self, C):
+        return [DBUS]+list(self._clients)+list(self._names)
+
+    @_method(DBUS, '', 'as')
+    def _ListActivatableNames(self, C):
+        return [DBUS]
+
+    @_method(DBUS, 's')
+    def _AddMatch(self, C, expr):
+        try:
+            R = _Rule(expr)
+        except ValueError as e:
+            raise RemoteError(str(e), name=_err('MatchRuleInvalid'))
+        E = C.rules.get(expr)
+        if E is None:
+            C.rules[expr] = [R, 1]
+        else:
+            E[1] += 1
+
+    @_method(DBUS, 's')
+    def _RemoveMatch(self, C, expr):
+        E = C.rules.get(expr)
+        if E is None:
+            raise RemoteError("The given match rule wasn't found and can't be removed", name=_err('MatchRuleNotFound'))
+        E[1] -= 1
+        if E[1]==0:
+            del C.rules[expr]
+
+    @_method(DBUS, 's', 's')
+    def _GetNameOwner(self, C, name):
+        if name==DBUS:
+            return DBUS
+        return self._client(name, 'owner').name
+
+    @_method(DBUS, 's', 'as')
+    def _ListQueuedOwners(self, C, name):
+        if name==DBUS:
+            return [DBUS]
+        elif name in self._names:
+            return [E[0].name for E in self._names[name]]
+        return [self._client(name, 'queued owners').name]
+
+    @_method(DBUS, 's', 'u')
+    def _GetConnectionUnixUser(self, C, name):
+        return self._client(name, 'UID').creds[1]
+
+    @_method(DBUS, 's', 'u')
+    def _GetConnectionUnixProcessID(self, C, name):
+        return self._client(name, 'PID').creds[0]
+
+    @_method(DBUS, 's', 'ay')
+    def _GetAdtAuditSessionData(self, C, name):
+        raise RemoteError('Not supported', name=_err('AdtAuditDataUnknown'))
+
+    @_method(DBUS, 's', 'ay')
+    def _GetConnectionSELinuxSecurityContext(self, C, name):
+        raise RemoteError('Not supported', name=_err('SELinuxSecurityContextUnknown'))
+
+    @_method(DBUS)
+    def _ReloadConfig(self, C):
+        pass
+
+    @_method(DBUS, '', 's')
+    def _GetId(self, C):
+        return self.guid.decode('ascii')
+
+    @_method(DBUS, 's', 'a{sv}')
+    def _GetConnectionCredentials(self, C, name):
+        pid, uid, _gid = self._client(name, 'credentials').creds
+        return {'UnixUserID':Variant(b'u', uid), 'ProcessID':Variant(b'u', pid)}
+
+    @_method(PROPERTIES, 'ss', 'v')
+    def _Get(self, C, iface, prop):
+        return self._GetAll(C, iface)[prop]
+
+    @_method(PROPERTIES, 's', 'a{sv}')
+    def _GetAll(self, C, iface):
+        if iface!=DBUS:
+            raise RemoteError("No such interface '%s'"%iface, name=UnknownInterface)
+        return {'Features':Variant(b'as', []), 'Interfaces':Variant(b'as', [])}
+
+    @_method(INTROSPECTABLE, '', 's')
+    def _Introspect(self, C):
+        return _INTROSPECT
+
+    @_method(PEER)
+    def _Ping(self, C):
+        pass
+
+    @_method(PEER, '', 's')
+    def _GetMachineId(self, C):
+        for fname in ('/etc/machine-id', '/var/lib/dbus/machine-id'):
+            try:
+                with open(fname) as F:
+                    return F.read().strip()
+            except OSError:
+                pass
+        return self.guid.decode('ascii')
+
+class _Args(object):
+    # arguments of a forwarded signal, decoded only if a match rule needs them
+    __slots__ = ('evt', 'body', 'lsb', 'args')
+    def __init__(self, evt, body, lsb):
+        self.evt, self.body, self.lsb, self.args = evt, body, lsb, None
+
+    def __call__(self):
+        if self.args is None:
+            if not len(self.body):
+                self.args = ()
+            else:
+                B = decode(self.evt.sig, self.body, lsb=self.lsb)
+                self.args = B if isinstance(B, tuple) else (B,)
+        return self.args
+
+_INTROSPECT = _introspect()
+
+def getargs():
+    from argparse import ArgumentParser
+    P = ArgumentParser(description='A minimal message bus')
+    P.add_argument('--address', help="eg. 'unix:abstract=NAME' or 'unix:path=FILE'.  Default is a new abstract name")
+    P.add_argument('--print-address', action='store_true', help='Print the bus address once listening')
+    P.add_argument('--any-user', action='store_true', help='Allow connections from any uid')
+    P.add_argument('-v', '--verbose', action='store_const', const=logging.DEBUG, default=logging.WARN)
+    return P.parse_args()
+
+async def main(args):
+    import signal
+    from .auth import makedict
+    info = makedict(args.address) if args.address else {'unix:abstract':'dbucket-broker-%d'%os.getpid()}
+    kws = {}
+    if args.any_user:
+        kws['uids'] = None
+    async with Broker(path=info.get('unix:path'), abstract=info.get('unix:abstract'), **kws) as B:
+        if args.print_address:
+            print(B.address, flush=True)
+        done = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for S in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(S, done.set)
+        await done.wait()
+
+if __name__=='__main__':
+    args = getargs()
+    logging.basicConfig(level=args.verbose)
+    asyncio.run(main(args))
@@ -0,0 +1,159 @@
+"""Client side call de-duplication and reply cache
+
+Opt-in with :py:meth:`.Connection.enable_cache`.
+
+  cache = conn.enable_cache(ttl=1.0)
+  cache.mark('org.freedesktop.NetworkManager', 'GetDevices')
+  devs = await cache.call(destination=..., path=..., interface=..., member='GetDevices')
+
+Identical concurrent calls made through :py:meth:`CallCache.call` (same destination,
+path, interface, member, and body) share a single method call.
+The results of methods marked cacheable are also kept for a time (TTL).
+Proxy methods which are marked go through the cache automatically.
+
+Entries for a destination are discarded when its owner changes,
+as seen by a NameOwnerChanged signal.
+"""
+import logging
+_log = logging.getLogger(__name__)
+
+from collections import OrderedDict
+import asyncio
+
+from .conn import DBUS, DBUS_PATH
+from .xcode import encode
+
+__all__ = [
+    'CallCache',
+]
+
+class CallCache(object):
+    """Single-flight calls, and TTL/LRU reply cache, for one Connection.
+
+    :param conn: The Connection
+    :param float ttl: Default lifetime (seconds) of cached results.
+    :param int max_entries: Least recently used results are discarded beyond this.
+    """
+    def __init__(self, conn, *, ttl=1.0, max_entries=1024):
+        self.conn, self.ttl, self.max_entries = conn, ttl, max_entries
+        self.marked = {} # {(interface, member):ttl}
+        self._inflight = {} # {key:Future}
+        self._entries = OrderedDict() # {key:(expires, value)}
+        self._gen = 0 # incremented on any invalidation
+        self._watch = {} # {destination:Condition|Future}
+        self._sub = None
+        self._sub_lock = asyncio.Lock()
+        self.hits = self.misses = self.shared = 0
+
+    def mark(self, interface, member, ttl=None):
+        """Mark a method as cacheable.
+
+        :param float ttl: Lifetime of results.  None for the default.  0 to only share concurrent calls.
+        """
+        self.marked[(interface, member)] = self.ttl if ttl is None else ttl
+
+    def invalidate(self, destination=None):
+        """Discard cached results.  For one destination, or all if None.
+        """
+        # results of calls in progress are not kept
+        self._gen += 1
+        if destination is None:
+            self._entries.clear()
+        else:
+            for K in [K for K in self._entries if K[0]==destination]:
+                del self._entries[K]
+
+    async def call(self, *, path=None, interface=None, member=None, destination=None, sig=None, body=None, ttl=None):
+        """As :py:meth:`.Connection.call`.  The caller asserts that the method has no side effects,
+        so that an identical call in progress may be shared.
+
+        :param float ttl: Lifetime of the result.  None to use the ttl given to mark(), or 0 if not marked.
+
+        Shared and cached results are not copied.  Every caller gets the same object,
+        which must not be modified.
+        """
+        if ttl is None:
+            ttl = self.marked.get((interface, member), 0)
+        if sig:
+            key = (destination, path, interface, member, sig, encode(sig.encode('ascii'), body))
+        else:
+            key = (destination, path, interface, member, '', b'')
+
+        E = self._entries.get(key)
+        if E is not None:
+            if E[0]>self.conn.loop.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return E[1]
+            del self._entries[key]
+
+        F = self._inflight.get(key)
+        if F is not None:
+            self.shared += 1
+        else:
+            self.misses += 1
+            F = self._inflight[key] = self.conn.loop.create_task(
+                self._call(key, ttl, path, interface, member, destination, sig, body))
+        # one caller being cancelled does not cancel the call
+        return await asyncio.shield(F)
+
+    async def _call(self, key, ttl, path, interface, member, destination, sig, body):
+        try:
+            if ttl>0:
+                await self._watch_owner(destination)
+            gen = self._gen
+            ret = await self.conn.call(path=path, interface=interface, member=member,
+                                       destination=destination, sig=sig, body=body)
+            if ttl>0 and gen==self._gen:
+                # not invalidated while in progress
+                self._entries[key] = (self.conn.loop.time()+ttl, ret)
+                while len(self._entries)>self.max_entries:
+                    self._entries.popitem(last=False)
+            return ret
+        finally:
+            del self._inflight[key]
+
+    async def _watch_owner(self, destination):
+        while True:
+            W = self._watch.get(destination)
+            if W is None:
+                break
+            elif not isinstance(W, asyncio.Future):
+                return # already watching
+            await W # concurrent setup.  re-check as it may have failed
+
+        W = self._watch[destination] = self.conn.loop.create_future()
+        match = dict(sender=DBUS, path=DBUS_PATH, interface=DBUS,
+                     member='NameOwnerChanged', arg0=destination)
+        try:
+            async with self._sub_lock:
+                if self._sub is None:
+                    self._sub = await self.conn.subscribe(self._owner_changed, **match)
+                    C = self._sub._cond[0]
+                else:
+                    C = await self._sub.add(**match)
+        except:
+            del self._watch[destination]
+            raise
+        finally:
+            W.set_result(None)
+        self._watch[destination] = C
+
+    def _owner_changed(self, evt):
+        name, old, new = evt.body
+        _log.debug("Invalidate cache for %s", name)
+        self.invalidate(name)
+        if name.startswith(':') and not new:
+            # a unique name never returns
+            C = self._watch.pop(name, None)
+            if C is not None and not isinstance(C, asyncio.Future) and self._sub is not None:
+                self.conn.loop.create_task(self._sub.remove(C))
+
+    async def close(self):
+        """Remove signal matches, and discard all cached results.
+        """
+        self._entries.clear()
+        self._watch.clear()
+        if self._sub is not None:
+            S, self._sub = self._sub, None
+            await S.close()
@@ -0,0 +1,250 @@
+"""Chunked replies from streaming methods
+
+A @Method() which is an async generator function streams its result.
+Each value yielded is sent to the caller as a unicast signal
+org.dbucket.Chunks.Chunk, with a body of the method call serial number followed
+by the value.  The method return (or error) follows the last chunk.
+So no single message need hold the whole result, and the first chunks
+arrive before the last is produced.
+
+Replies are sent ahead of signals waiting in the send lanes, and so may
+overtake the last chunks.  The method return carries the number of chunks
+sent ('u'), and the caller reads until all have arrived.  An error is
+only sent once the chunks before it have been written.
+
+The caller grants credit with Credit(serial, count) signals.  The producer
+suspends when it has sent as many chunks as credited, so at most 'window'
+chunks are in flight.  A Cancel(serial) signal stops the producer.
+
+Callers use :py:meth:`.Connection.call_stream`, or the method of a proxy
+built from introspection, which includes the annotation org.dbucket.Chunked.
+
+  async for row in proxy.Rows(1000):
+      ...
+"""
+import logging
+_log = logging.getLogger(__name__)
+
+from collections import deque
+import asyncio
+
+from .signal import Subscription, Condition
+from .xcode import sigsplit
+
+__all__ = [
+    'CHUNKS',
+    'ANNOTATION',
+    'ChunkStream',
+]
+
+#: Interface name of chunk control signals
+CHUNKS = 'org.dbucket.Chunks'
+#: Introspection annotation of streaming methods
+ANNOTATION = 'org.dbucket.Chunked'
+#: Error name when the caller stops granting credit
+Timeout = CHUNKS+'.Timeout'
+
+def _wake(F):
+    if F is not None and not F.done():
+        F.set_result(None)
+
+class ChunkStream(object):
+    """Async iterator over the chunks of a streaming method call.
+    Returned by :py:meth:`.Connection.call_stream`.
+
+    Iteration ends after the method return, or raises RemoteError.
+    Leaving an 'async with' block, or aclose(), before the end cancels the call.
+    """
+    def __init__(self, conn, destination, path, window):
+        self.conn, self._dest, self._path = conn, destination, path
+        self._window = window
+        self.serial = None
+        self._Q = deque()
+        self._consumed = 0 # since last Credit
+        self._received = 0 # chunks received
+        self._total = None # chunks sent, once the method return arrives
+        self._sender = None # unique name of the producer
+        self._done, self._error = False, None
+        self._wait = None
+
+    def _start(self, serial):
+        self.serial = serial
+        self._send('Credit', 'uu', (serial, self._window))
+
+    def _send(self, member, sig, body):
+        self.conn.signal(destination=self._sender or self._dest, path=self._path,
+                         interface=CHUNKS, member=member, sig=sig, body=body)
+
+    def _chunk(self, evt, value):
+        if self._sender is None:
+            self._sender = evt.sender
+        elif evt.sender!=self._sender:
+            self.conn.log.warning("Ignore chunk for %s from %s", self.serial, evt.sender)
+            return
+        self._Q.append(value)
+        self._received += 1
+        if self._total is not None and self._received>=self._total:
+            self._end(None)
+        _wake(self._wait)
+
+    def _finish(self, result, error):
+        # reply callback, passed the RawBody.  The method return of a streaming method is
+        # the number of chunks sent ('u'), which may not all have arrived.
+        # Anything else (eg. a method which doesn't stream) ends the stream now.
+        if error is None and result.sig=='u':
+            total = result.decode()
+            if self._received<total:
+                self._total = total
+                return
+        self._end(error)
+
+    def _end(self, error):
+        self._done, self._error = True, error
+        self.conn._chunks.streams.pop(self.serial, None)
+        _wake(self._wait)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self._Q:
+            if self._done:
+                if self._error is not None:
+                    E, self._error = self._error, None
+                    raise E
+                raise StopAsyncIteration
+            self._wait = self.conn.loop.create_future()
+            try:
+                await self._wait
+            finally:
+                self._wait = None
+
+        V = self._Q.popleft()
+        self._consumed += 1
+        if not self._done and self._consumed*2>=self._window:
+            self._send('Credit', 'uu', (self.serial, self._consumed))
+            self._consumed = 0
+        return V
+
+    async def aclose(self):
+        """Cancel the call, if not complete, and discard chunks not yet taken.
+        """
+        if not self._done:
+            self._done = True
+            if self.serial is not None:
+                self.conn._chunks.streams.pop(self.serial, None)
+                self.conn._proto.forget_reply(self.serial)
+                self._send('Cancel', 'u', self.serial)
+        self._Q.clear()
+        _wake(self._wait)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, A, B, C):
+        await self.aclose()
+
+class _Producer(object):
+    def __init__(self, mgr, evt, sig, gen):
+        self.mgr, self.evt, self.sig, self.gen = mgr, evt, sig, gen
+        self.credit = 0
+        self._wait = None
+        self.T = mgr.conn.loop.create_task(self._run())
+
+    def add_credit(self, N):
+        self.credit += N
+        _wake(self._wait)
+
+    async def _run(self):
+        conn, evt, sig = self.mgr.conn, self.evt, self.sig
+        nsig = len(list(sigsplit(sig.encode('ascii'))))
+        sent = 0
+        try:
+            async for V in self.gen:
+                while self.credit<=0:
+                    self._wait = conn.loop.create_future()
+                    try:
+                        await asyncio.wait_for(self._wait, self.mgr.credit_timeout)
+                    finally:
+                        self._wait = None
+                self.credit -= 1
+
+                if nsig==0:
+                    body = evt.serial
+                elif nsig==1:
+                    body = (evt.serial, V)
+                else:
+                    body = (evt.serial,)+tuple(V)
+                conn.signal(destination=evt.sender, path=evt.path, interface=CHUNKS,
+                            member='Chunk', sig='u'+sig, body=body)
+                sent += 1
+
+        except asyncio.CancelledError:
+            pass # by caller, or on close.  No reply
+        except Exception as e:
+            from .conn import RemoteError
+            if isinstance(e, asyncio.TimeoutError):
+                conn.log.warning("No credit for chunks of %s", evt)
+                name, msg = Timeout, "Caller stopped granting credit"
+            elif isinstance(e, RemoteError):
+                name, msg = e.name, repr(e)
+            else:
+                conn.log.exception("Error streaming method %s", evt)
+                name, msg = "%s.%s"%(e.__class__.__module__, e.__class__.__name__), repr(e)
+            try:
+                # chunks still waiting in the signal lane would be overtaken by the error
+                await conn._lane_written('signal')
+            except asyncio.CancelledError:
+                pass
+            else:
+                conn._error(evt, name, msg)
+        else:
+            conn._method_return(evt, 'u', sent)
+        finally:
+            self.mgr.producers.pop((evt.sender, evt.serial), None)
+            await self.gen.aclose()
+
+class _Chunks(object):
+    """Per-Connection state of chunked calls.  Created on first use.
+    """
+    #: Seconds a producer waits for credit before abandoning the call
+    credit_timeout = 60.0
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.streams = {} # calls we made.  {serial:ChunkStream}
+        self.producers = {} # calls we are answering.  {(sender, serial):_Producer}
+
+        # unicast signals, so no AddMatch
+        S = Subscription(conn, self._signal)
+        S._cond.append(Condition(remove=False, interface=CHUNKS))
+        conn._signals.append(S)
+
+    def _signal(self, evt):
+        if evt.destination!=self.conn.name:
+            return
+        body = evt.body if isinstance(evt.body, tuple) else (evt.body,)
+        if evt.member=='Chunk':
+            S = self.streams.get(body[0])
+            if S is not None:
+                S._chunk(evt, None if len(body)==1 else body[1] if len(body)==2 else body[1:])
+        else:
+            P = self.producers.get((evt.sender, body[0]))
+            if P is None:
+                pass
+            elif evt.member=='Credit':
+                P.add_credit(body[1])
+            elif evt.member=='Cancel':
+                P.T.cancel()
+
+    def produce(self, evt, sig, gen):
+        self.producers[(evt.sender, evt.serial)] = _Producer(self, evt, sig, gen)
+
+    def close(self):
+        'Cancel producers, and fail streams still waiting for chunks'
+        for P in list(self.producers.values()):
+            P.T.cancel()
+        if self.streams:
+            from .conn import NoReplyError
+            for S in list(self.streams.values()):
+                S._end(NoReplyError())
@@ -2,15 +2,13 @@
 import logging
 #_log = logging.getLogger(__name__)
 
-import sys, struct, re
+import struct, time, inspect, weakref
 from functools import partial
+from collections import deque
 import asyncio
 
-ensure_future = getattr(asyncio, 'ensure_future', asyncio.async)
-
-from .xcode import encode, decode, Object, Signature, Variant
-from .valid import is_interface
-from .signal import SignalQueue, Condition
+from .signal import SignalQueue, Subscription, Condition
+from .protocol import Protocol, RawBody, ManyMessage, _sys_lsb, METHOD_CALL, METHOD_RETURN, ERROR, SIGNAL, NO_REPLY_EXPECTED
 
 #: Bus name and Interface name for DBUS daemon
 DBUS='org.freedesktop.DBus'
@@ -19,20 +17,42 @@ DBUS_PATH='/org/freedesktop/DBus'
 
 #: Interface name for Introspect method
 INTROSPECTABLE='org.freedesktop.DBus.Introspectable'
+#: Interface of batched method calls.  cf. :py:meth:`Connection.call_batch`
+BATCH = 'org.dbucket.Batch'
 
 # Common error names
 # see dbus/dbus-protocol.h
 UnknownMethod = 'org.freedesktop.DBus.Error.UnknownMethod'
+UnknownObject = 'org.freedesktop.DBus.Error.UnknownObject'
+UnknownInterface = 'org.freedesktop.DBus.Error.UnknownInterface'
 LimitsExceed = 'org.freedesktop.DBus.Error.LimitsExceeded'
 NoReply = 'org.freedesktop.DBus.Error.NoReply'
 
-METHOD_CALL = 1
-METHOD_RETURN = 2
-ERROR = 3
-SIGNAL = 4
+#: Outgoing priority lanes.  Replies and errors, then method calls, then signals.
+LANES = ('reply', 'call', 'signal')
+_lane_of = {METHOD_RETURN:0, ERROR:0, METHOD_CALL:1, SIGNAL:2}
+
+class _RawReply(object):
+    """Pending call_raw().  A reply callback, which completes a Future.
+    Replies to calls with this callback are not decoded.
+    """
+    __slots__ = ('F',)
+    def __init__(self, F):
+        self.F = F
+    def __call__(self, result, error):
+        if self.F.done():
+            pass
+        elif error is not None:
+            self.F.set_exception(error)
+        else:
+            self.F.set_result(result)
 
-_sys_lsb = sys.byteorder=='little'
-_sys_L   = b'l' if _sys_lsb else b'B'
+class _RawCallback(_RawReply):
+    """A reply callback, passed the undecoded :py:class:`.RawBody` of the reply.
+    """
+    __slots__ = ()
+    def __call__(self, result, error):
+        self.F(result, error)
 
 class ConnectionClosed(asyncio.CancelledError):
     """Thrown when underlying Connection has become dis-connected
@@ -53,109 +73,209 @@ class NoReplyError(RemoteError):
     def __init__(self):
         RemoteError.__init__(self, "Bus Connection closed/lost", name=NoReply)
 
+def _size_hint(val):
+    """Cheap lower bound on the encoded size of a message body
+    """
+    if isinstance(val, (bytes, str, list, dict)):
+        return len(val)
+    elif isinstance(val, tuple):
+        return sum(map(_size_hint, val))
+    return 0
+
+def _timed(stats, fn, *args):
+    """Run fn(*args), usually in an executor thread.
+    Stats are not thread safe, so the caller adds the time from the loop thread.
+
+    :returns: (result, seconds).  seconds is None if stats is None.
+    """
+    if stats is None:
+        return fn(*args), None
+    T0 = stats.clock()
+    R = fn(*args)
+    return R, stats.clock()-T0
+
 def _loop_sync(loop):
     '''Synchronize loop callback queue.
     Returns after all presently pending callbacks have run
     '''
-    F=asyncio.Future(loop=loop)
+    F=loop.create_future()
     loop.call_soon(partial(F.set_result, None))
     return F
 
-class BusEvent(object):
-    """Representation of a METHOD_CALL or SIGNAL message
+class MemoryBudget(object):
+    """Approximate accounting of the memory held on behalf of a Connection,
+    and the policies applied when it exceeds a limit.
+
+    :param int limit: Budget in bytes.
+    :param bool shed_signals: When over budget, drop received signals instead of
+                              queueing them (SignalQueues enter the OFLOW state).
+                              Signals from the daemon, and callback subscriptions, are not affected.
+    :param bool reject_calls: When over budget, fail new outgoing method calls locally with LimitsExceeded.
+    :param bool reply_limits: When over budget, reply LimitsExceeded to received method calls.
+    :param int call_cost: Bytes charged for each method call in progress, made or being handled.
+
+    Counts the bytes of messages waiting in SignalQueues, in the transport write buffer,
+    and in the send lanes, as well as method calls in progress.
+    """
+    def __init__(self, limit, *, shed_signals=True, reject_calls=True, reply_limits=True, call_cost=1024):
+        self.limit, self.call_cost = limit, call_cost
+        self.shed_signals, self.reject_calls, self.reply_limits = shed_signals, reject_calls, reply_limits
+        #: Number of signals dropped, calls rejected, and LimitsExceeded replies sent
+        self.shed, self.rejected, self.replied = 0, 0, 0
+
+    def usage(self, conn):
+        """:returns: {'signals':#, 'transport':#, 'inprog':#, 'handlers':#, 'total':#} in bytes
+        """
+        R = {
+            'signals':conn._signal_held,
+            'transport':(conn._W.transport.get_write_buffer_size() if conn._W is not None else 0) + conn._lane_bytes,
+            'inprog':len(conn._inprog)*self.call_cost,
+            'handlers':conn._handlers*self.call_cost,
+        }
+        R['total'] = sum(R.values())
+        return R
+
+    def over(self, conn):
+        return self.usage(conn)['total']>self.limit
+
+    def _shedding(self, conn, evt):
+        # should this received signal be dropped?
+        if self.shed_signals and evt.sender!=DBUS and self.over(conn):
+            self.shed += 1
+            return True
+        return False
+
+class Tracer(object):
+    """Handle for a set of tracing callbacks.  Returned by :py:meth:`Connection.add_tracer`.
+
+    :param on_send: 'on_send(conn, mtype, serial, size, ts, data)'
+                    called as each message is passed to the transport.
+                    data is the list of buffers [header, pad, body]
+    :param on_recv: 'on_recv(conn, evt, size, ts, data)' called as each message is received,
+                    before the body is decoded.  data is a tuple of raw buffers making up the message
+    :param on_dispatch_done: 'on_dispatch_done(conn, evt, start, end)' called after
+                    the receiver has delivered a reply or signal, or run a method handler.
+                    Asynchronous handlers may still be in progress.
+    :param on_handler: 'on_handler(conn, evt, coro)' called with the coroutine of an
+                    asynchronous method handler before it is scheduled.
+                    Returns the coroutine to run in its place.  eg. coro wrapped.
+
+    Timestamps are from :py:attr:`Connection.clock`.
+    Buffers must not be modified, and should be copied if kept.
     """
-    #: Message type.  METHOD_CALL or SIGNAL
-    type=None
-    #: Bus Path string
-    path=None
-    #: Interface name.  May be None for METHOD_CALL
-    interface=None
-    #: Destination.  May be None
-    destination=None
-    #: Member name (aka method name)
-    member=None
-    #: Originator of the message.  Will be a unique name or DBUS
-    sender=None
-    #: Body signature.  Used only if body is not None
-    sig=None
-    #: Body value
-    body=None
-    _dattrs = ('sender', 'interface', 'member', 'path', 'destination', 'type', '_error', '_return_sn', 'sig')
-    def __init__(self, mtype, sn, headers, body=None):
-        self.type, self.serial, self.body = mtype, sn, body
-        for code, val in headers:
-            if code==1:
-                self.path = val
-            elif code==2:
-                self.interface = val
-            elif code==3:
-                self.member = val
-            elif code==4:
-                self._error = val
-            elif code==5:
-                self._return_sn = val
-            elif code==6:
-                self.destination = val
-            elif code==7:
-                self.sender = val
-            elif code==8:
-                self.sig = val
-
-    @classmethod
-    def build(klass, mtype, sn, **kws):
-        evt = klass(mtype, sn, [], body=kws.pop('body', None))
-        for N in klass._dattrs:
-            if N in kws:
-                setattr(evt, N, kws.pop(N))
-        assert len(kws)==0, kws
-        return evt
+    def __init__(self, on_send=None, on_recv=None, on_dispatch_done=None, on_handler=None):
+        self.on_send, self.on_recv, self.on_dispatch_done = on_send, on_recv, on_dispatch_done
+        self.on_handler = on_handler
 
     def __repr__(self):
-        S = ','.join(["%s='%s'"%(K,getattr(self, K, None)) for K in self._dattrs+('body',)])
-        return "%s(%s)"%(self.__class__.__name__, S)
+        return 'Tracer(%s, %s, %s, %s)'%(self.on_send, self.on_recv, self.on_dispatch_done, self.on_handler)
 
 class Connection(object):
+    """A connection to a bus daemon.  Created by :py:func:`.connect_bus`.
+
+    May be used as an async context manager which close()s on exit.
+    eg. 'async with await connect_bus(infos) as conn:'
+    """
     #: whether to log message byte strings (very verbose)
     debug_net = False
-
-    def __init__(self, W, R, info, loop=None, name=None):
+    #: Time source for tracing timestamps
+    clock = staticmethod(time.time)
+    #: Transport write buffer size (bytes) above which outgoing messages
+    #: wait in priority lanes.
+    send_hwm = 64*1024
+    #: Number of messages taken from each of the reply, call, and signal lanes
+    #: in each round while flushing.
+    lane_weights = (8, 4, 1)
+    #: Message bodies of at least this size (bytes) are encoded or decoded
+    #: by 'executor' instead of on the event loop.  None disables.
+    offload_size = None
+    #: The concurrent.futures.Executor used for large messages.
+    #: None selects the default executor of the event loop.
+    executor = None
+    #: Maximum number of bytes taken from the transport with each read
+    read_size = 64*1024
+    # proxy classes for bus daemons, shared by connections to the same bus.  {guid:class}  cf. setup()
+    # an entry lasts only as long as some connection's daemon proxy uses it.
+    _daemon_proxies = weakref.WeakValueDictionary()
+    #: GUID of the bus or peer, from authentication.  None if not known.
+    guid = None
+    #: Proxy for the bus daemon.  None until setup(), and for peer connections.
+    daemon = None
+    #: True for a direct connection to a peer, without a bus daemon.  cf. setup_peer()
+    peer = False
+    #: User id of the peer, for a connection accepted by a :py:class:`.Server`.  Otherwise None.
+    peer_uid = None
+
+    def __init__(self, W, R, info, loop=None, name=None, stats=None, budget=None):
         self.log = logging.getLogger(__name__) # replaced in setup
+        if stats is True:
+            from .stats import Stats
+            stats = Stats()
+        self._stats = stats # None when disabled
+        self._budget = budget # MemoryBudget or None
+        self._handlers = 0 # number of method handlers in progress
         self._W, self._R, self._info, self._loop = W, R, info, loop or asyncio.get_event_loop()
         self._running = True
         self._closed = None
-        self._lost = asyncio.Future(loop=loop)
+        self._lost = self._loop.create_future()
 
-        self._inprog  = {} # in progress method calls we made.  {sn:Future()}
-        self._signals = [] # registered signal matches we might receive.  [SignalQueue()]
+        # file descriptor passing negotiated?  cf. unixfd.FDStream
+        self._take_fds = getattr(R, 'take_fds', None)
 
-        self._add_queue = self._signals.append
-        self._drop_queue = self._signals.remove
+        # message framing, encoding, serial numbers, reply and signal matching
+        self._proto = Protocol(stats=stats, log=self.log, unix_fd=self._take_fds is not None)
+        self._inprog  = self._proto.inprog # in progress method calls we made.  {sn:Future()|callback}
+        self._signals = self._proto.matchers # registered signal matches we might receive.  [SignalQueue()]
 
-        from .proxy import MethodDispatch
-        self._methods = MethodDispatch(self)
-        # delegate some of our methods to dispatcher
-        self.attach = self._methods.attach
-        self.detach = self._methods.detach
+        self._add_queue = self._signals.append
+        self._signal_held = 0 # approximate bytes of messages in all SignalQueues
+        self._raw_subs = 0 # number of Subscriptions with raw=True
+
+        # exported objects.  MethodDispatch created on first attach()
+        self._methods = None
+        # handlers for method calls with undecoded bodies.  {'/path'|None:callable}
+        self._raw_handlers = None
+        # chunked calls in progress.  chunks._Chunks created on first use
+        self._chunks = None
+        # peers which lack org.dbucket.Batch.  set() created on first use
+        self._no_batch = None
+        #: CallCache, or None.  cf. enable_cache()
+        self.cache = None
 
         # keep track of match expressions registered with the daemon
-        self._match_lock = asyncio.Lock(loop=loop)
+        self._match_lock = asyncio.Lock()
         self._matches = {} # {'match=expr':[Interested]}
 
-        self._nextsn = 1 #TODO: randomize?
+        # outgoing messages waiting for space in the transport buffer. [[msg, ...], ...]
+        self._lanes = tuple([deque() for L in LANES])
+        self._lane_count = 0 # total messages waiting in all lanes
+        self._lane_bytes = 0 # total bytes waiting in all lanes
+        self._lane_sent = [0]*len(LANES) # messages written to transport
+        self._lane_total = [0]*len(LANES) # messages written to transport, or waiting in a lane
+        self._lane_waiters = tuple([deque() for L in LANES]) # [(total, Future)] from _lane_written()
+        self._lane_held = [0]*len(LANES) # messages which had to wait in a lane
+        self._lane_T = None # task flushing lanes
+        # outgoing messages waiting for the executor to finish encoding an earlier message
+        self._tx_order = deque() # [Future([msg])|[msg]]
+        self._W.transport.set_write_buffer_limits(high=self.send_hwm)
+
+        # installed tracers, and their callbacks for each trace point
+        self._tracers = []
+        self._trace_send, self._trace_recv, self._trace_done = (), (), ()
+        self._trace_handler = ()
+
         self._RX = self._loop.create_task(self._recv())
 
         # my primary bus name, and the set of well known names I have acquired
         self._name, self._names = None, set()
 
         # special-ness here since we don't have to call AddMatch to get daemon messages
-        self._bus_signals = self.new_queue(qsize=20)
+        self._bus_signals = Subscription(self, self._bus_sig)
         C = Condition(remove=False, sender=DBUS, path=DBUS_PATH, interface=DBUS)
         self._bus_signals._cond.append(C)
 
         self._signals.append(self._bus_signals)
 
-        self._SIGS = self._loop.create_task(self._bus_sig())
-
     def close(self):
         """close out connection.
 
@@ -170,6 +290,7 @@ class Connection(object):
             # non-blocking parts of shutdown
 
             if self._running:
+                self._flush_lanes(force=True)
                 self._W.close()
             self._running = False
 
@@ -178,27 +299,54 @@ class Connection(object):
             self._cancel_pending()
 
             # start blocking parts of shudown
-            self._closed = ensure_future(self._close(), loop=self._loop)
+            self._closed = self._loop.create_task(self._close())
 
             if not self._lost.done():
                 self._lost.set_result(None)
 
         return self._closed
 
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, A, B, C):
+        await self.close()
+
     def _cancel_pending(self):
+        # stop streaming calls, made and answered
+        if self._chunks is not None:
+            self._chunks.close()
         # fail pending method calls
-        for act in self._inprog.values():
-            if not act.done():
-                act.set_exception(NoReply())
+        for act in self._proto.cancel_replies():
+            if isinstance(act, asyncio.Future):
+                if not act.done():
+                    act.set_exception(NoReplyError())
+            else:
+                self._reply_cb(act, None, NoReplyError())
+        # and waits for lanes to flush
+        for Q in self._lane_waiters:
+            while Q:
+                Q.popleft()[1].cancel()
 
-        self._inprog.clear()
+    def _reply_cb(self, CB, result, error):
+        try:
+            CB(result, error)
+        except:
+            self.log.exception("Error in reply callback %s", CB)
 
-    @asyncio.coroutine
-    def _close(self):
+    async def _close(self):
 
         # join receiver task, unless we are called from it
-        if asyncio.Task.current_task() is not self._RX:
-            yield from self._RX
+        if asyncio.current_task() is not self._RX:
+            try:
+                await self._RX
+            except asyncio.CancelledError:
+                # cancelled before it started
+                if not self._RX.cancelled():
+                    raise
+
+        if self._lane_T is not None:
+            self._lane_T.cancel()
 
         self._W.close()
 
@@ -208,15 +356,12 @@ class Connection(object):
         F = list([M.close() for M in self._signals])
 
         # wait for notification to be delivered
-        yield from asyncio.gather(*F, loop=self._loop, return_exceptions=True)
-
-        # join daemon signal task
-        yield from self._SIGS
+        await asyncio.gather(*F, return_exceptions=True)
 
         # paranoia, wait for all currently pending callbacks to be run
         # intended to help with a clean shutdown when used
         # like 'loop.run_until_complete(conn.close())'
-        yield from _loop_sync(self._loop)
+        await _loop_sync(self._loop)
         self.log.debug("Closed")
 
     @property
@@ -234,19 +379,118 @@ class Connection(object):
         'Connected?'
         return self._running
 
+    @property
+    def unix_fd(self):
+        'File descriptor passing negotiated?  If so, type \'h\' values are :py:class:`.UnixFD`'
+        return self._proto.unix_fd
+
     @property
     def loop(self):
         'The event loop passed to the ctor'
         return self._loop
 
+    def add_tracer(self, on_send=None, on_recv=None, on_dispatch_done=None, on_handler=None):
+        """Install tracing callbacks.  See :py:class:`Tracer` for arguments.
+
+        Exceptions from tracing callbacks are logged and otherwise ignored.
+        With no tracers installed, the cost is one test per trace point.
+
+        :returns: Tracer to be passed to remove_tracer()
+        """
+        T = Tracer(on_send, on_recv, on_dispatch_done, on_handler)
+        self._tracers.append(T)
+        self._update_tracers()
+        return T
+
+    def remove_tracer(self, T):
+        """Remove tracer returned by add_tracer()
+        """
+        self._tracers.remove(T)
+        self._update_tracers()
+
+    def _update_tracers(self):
+        self._trace_send = tuple([T.on_send for T in self._tracers if T.on_send is not None])
+        self._trace_recv = tuple([T.on_recv for T in self._tracers if T.on_recv is not None])
+        self._trace_done = tuple([T.on_dispatch_done for T in self._tracers if T.on_dispatch_done is not None])
+        self._trace_handler = tuple([T.on_handler for T in self._tracers if T.on_handler is not None])
+
+    def _traced_send(self, S):
+        ts = self.clock()
+        for i in range(0, len(S), 3):
+            header = S[i]
+            SN, = struct.unpack_from('<I' if header[0]==ord(b'l') else '>I', header, 8)
+            size = len(header)+len(S[i+1])+len(S[i+2])
+            for fn in self._trace_send:
+                try:
+                    fn(self, header[1], SN, size, ts, S[i:i+3])
+                except:
+                    self.log.exception("Error in tracer %s", fn)
+
+    def _traced_recv(self, evt, size, data):
+        ts = self.clock()
+        for fn in self._trace_recv:
+            try:
+                fn(self, evt, size, ts, data)
+            except:
+                self.log.exception("Error in tracer %s", fn)
+
+    def _traced_done(self, evt, start):
+        end = self.clock()
+        for fn in self._trace_done:
+            try:
+                fn(self, evt, start, end)
+            except:
+                self.log.exception("Error in tracer %s", fn)
+
+    def _traced_handler(self, evt, coro):
+        for fn in self._trace_handler:
+            try:
+                coro = fn(self, evt, coro)
+            except:
+                self.log.exception("Error in tracer %s", fn)
+        return coro
+
+    def _over_budget(self):
+        if self._budget.over(self):
+            self._budget.rejected += 1
+            return True
+        return False
+
+    def memory(self):
+        """Approximate memory held for this connection.
+
+        :returns: A dict from :py:meth:`MemoryBudget.usage`, or None if no budget= was given
+        """
+        if self._budget is not None:
+            return self._budget.usage(self)
+
+    def stats(self):
+        """Snapshot of connection metrics.
+
+        :returns: A dict, or None if not enabled (cf. stats= ctor argument)
+        """
+        if self._stats is not None:
+            return self._stats.snapshot(self)
+
+    @property
+    def send_stats(self):
+        """Counters of outgoing messages for each priority lane.
+
+        :returns: {'reply':{'sent':#, 'held':#, 'queued':#}, 'call':{...}, 'signal':{...}}
+
+        'sent' counts messages written to the transport.  'held' counts those which
+        first had to wait in a lane.  'queued' is the number presently waiting.
+        """
+        return dict([(name, {'sent':self._lane_sent[i], 'held':self._lane_held[i], 'queued':len(self._lanes[i])})
+                     for i, name in enumerate(LANES)])
+
     def _log_err(self, F):
         try:
             F.result()
         except:
             self.log.exception("Unexpected error")
 
-    @asyncio.coroutine
-    def AddMatch(self, obj, expr):
+    async def AddMatch(self, obj, expr):
         '''Register match expression with dbus daemon and associate it with *obj*.
         
         A match expression will not be removed until every associated *obj*
@@ -254,20 +498,20 @@ class Connection(object):
         '''
         if not self._running:
             raise ConnectionClosed()
-        with (yield from self._match_lock):            
+        async with self._match_lock:
             try:
                 self._matches[expr].add(obj)
             except KeyError:
-                yield from self.daemon.AddMatch(expr)
-                I = self._matches[expr] = set([obj])
+                if not self.peer: # a peer sends us everything
+                    await self.daemon.AddMatch(expr)
+                self._matches[expr] = set([obj])
 
-    @asyncio.coroutine
-    def RemoveMatch(self, obj, expr):
+    async def RemoveMatch(self, obj, expr):
         '''Remove match expression association
         '''
         if not self._running:
             return
-        with (yield from self._match_lock):            
+        async with self._match_lock:
             try:
                 I = self._matches[expr]
                 I.remove(obj)
@@ -276,7 +520,8 @@ class Connection(object):
             else:
                 if len(I)==0:
                     del self._matches[expr]
-                    yield from self.daemon.RemoveMatch(expr)
+                    if not self.peer:
+                        await self.daemon.RemoveMatch(expr)
 
     def new_queue(self, **kws):
         '''Create are return a new :py:class:`.SignalQueue`.
@@ -285,6 +530,103 @@ class Connection(object):
         self._signals.append(Q)
         return Q
 
+    def _drop_queue(self, Q):
+        self._signals.remove(Q)
+        if Q.raw:
+            self._raw_subs -= 1
+
+    async def subscribe(self, callback, *, raw=False, **kws):
+        '''Register a callback to be invoked for each matching signal.
+
+        Keyword arguments are passed to :py:meth:`.Subscription.add`.
+        'callback(evt)' is run synchronously from the receiver task
+        with a :py:class:`.BusEvent`.  So it must not block.
+
+        With raw=True, evt.raw is a :py:class:`.RawBody`, and the body is
+        not decoded unless some other consumer needs it.  eg. to forward signals.
+
+        A coroutine yielding a :py:class:`.Subscription`.
+        Call 'await sub.close()' to unsubscribe.
+        '''
+        S = Subscription(self, callback, raw=raw)
+        self._signals.append(S)
+        if raw:
+            self._raw_subs += 1
+        try:
+            await S.add(**kws)
+        except:
+            self._drop_queue(S)
+            raise
+        return S
+
+    def attach(self, obj, *, path='/'):
+        """Export the @Method()s of *obj* at *path*.  See :py:meth:`.MethodDispatch.attach`
+        """
+        if self._methods is None:
+            from .proxy import MethodDispatch
+            self._methods = MethodDispatch(self)
+        self._methods.attach(obj, path=path)
+
+    def detach(self, path):
+        """Remove an object previously attach()'d
+        """
+        if self._methods is not None:
+            self._methods.detach(path)
+
+    def attach_raw(self, handler, *, path=None):
+        """Handle method calls to *path* without decoding them.
+
+        'handler(evt)' is passed a :py:class:`.BusEvent` with .raw set to a
+        :py:class:`.RawBody` and .body None.  It returns a RawBody for the reply,
+        or None for an empty reply, or a coroutine or Future which results in one of these.
+        A RemoteError raised is sent as an error reply.
+
+        With path=None, the handler receives calls to any path without an attach()'d object.
+        """
+        if self._raw_handlers is None:
+            self._raw_handlers = {}
+        elif path in self._raw_handlers:
+            raise RuntimeError("Path %s is already handled by %s"%(path, self._raw_handlers[path]))
+        self._raw_handlers[path] = handler
+
+    def detach_raw(self, path=None):
+        """Remove a handler previously attach_raw()'d
+        """
+        if self._raw_handlers is not None:
+            self._raw_handlers.pop(path, None)
+
+    def _raw_handler(self, evt):
+        H = self._raw_handlers.get(evt.path)
+        if H is None and (self._methods is None or evt.path not in self._methods._dispatch):
+            H = self._raw_handlers.get(None)
+        return H
+
+    def _want_raw(self, evt, shed=False):
+        """Should this body be passed on undecoded?
+
+        :param bool shed: This signal will be dropped by SignalQueues, which then do not need the body.
+        :returns: None to decode, True to skip decoding, or False to decode and also keep the raw body.
+        """
+        if evt.type==METHOD_RETURN:
+            if isinstance(self._inprog.get(evt._return_sn), _RawReply):
+                return True
+        elif evt.type==METHOD_CALL:
+            if self._raw_handlers and self._raw_handler(evt) is not None:
+                return True
+        elif evt.type==SIGNAL and (self._raw_subs or shed):
+            raw = decoded = False
+            for M in self._signals:
+                if M._done==0:
+                    R = M._match(evt, decoded=False)
+                    if R is None:
+                        decoded = True # arg0 conditions need the body to decide
+                    elif R and M.raw:
+                        raw = True
+                    elif R and not (shed and isinstance(M, SignalQueue)):
+                        decoded = True
+            if raw or (shed and not decoded):
+                return not decoded
+
     def proxy(self, **kws):
         '''A coroutine yielding a new client proxy object
         '''
@@ -292,21 +634,157 @@ class Connection(object):
         return createProxy(self, **kws)
 
     def get_sn(self):
-        SN = self._nextsn
-        self._nextsn = (SN+1)&0xffffffff
-        return SN
-
-    def _send(self, header, body):
-        M = len(header)%8
-        pad = b'\0'*(8-M) if M else b''
-        S = [header, pad, body]
-        # seems that with python 3.4.2 underlying .write() can't fail
-        # other than OoM
-        # TCP half-closed isn't supported.
-        # we only find out about close from read side.
-        self._W.writelines(S)
+        return self._proto.get_sn()
+
+    def _send_msg(self, msg):
+        """Encode and send a prepared :py:class:`.protocol.Message` or :py:class:`.protocol.ManyMessage`.
+
+        Large bodies are encoded in the executor.  Messages sent afterwards
+        wait in _tx_order, so that the wire order matches the order of sending.
+        """
+        P, many = self._proto, isinstance(msg, ManyMessage)
+        if self.offload_size is not None and msg.sig is not None and _size_hint(msg.body)>=self.offload_size:
+            F = self._loop.run_in_executor(self.executor, _timed, self._stats,
+                                           P._encode_many if many else P._encode, msg)
+            self._tx_order.append(F)
+            F.add_done_callback(self._tx_ready)
+            if msg.type==METHOD_CALL:
+                F.add_done_callback(partial(self._encode_failed, msg.serial))
+        else:
+            self._sendv(P.encode_many(msg) if many else P.encode(msg))
+
+    def _tx_ready(self, _F):
+        """Send messages completed by the executor, in order
+        """
+        Q = self._tx_order
+        while Q:
+            S = Q[0]
+            if isinstance(S, asyncio.Future):
+                if not S.done():
+                    return
+                elif S.cancelled() or S.exception() is not None:
+                    S = None
+                else:
+                    S, dt = S.result()
+                    if dt is not None:
+                        self._stats.encode_time += dt
+            elif callable(S):
+                # from _lane_written()
+                Q.popleft()
+                S()
+                continue
+            Q.popleft()
+            if S is not None and self._running:
+                self._write(S)
+
+    def _encode_failed(self, SN, F):
+        if F.cancelled() or F.exception() is None:
+            return
+        self.log.error("Error encoding method call: %s", F.exception())
+        act = self._proto.forget_reply(SN)
+        if act is None:
+            return
+        elif isinstance(act, asyncio.Future):
+            if not act.done():
+                act.set_exception(F.exception())
+        else:
+            self._reply_cb(act, None, F.exception())
+
+    def _sendv(self, S):
+        if self._tx_order:
+            # wait behind a message being encoded by the executor
+            self._tx_order.append(S)
+        else:
+            self._write(S)
+
+    def _lane_written(self, name):
+        """A Future which completes once all messages already sent in the named lane
+        have been written to the transport.  eg. so that a reply does not overtake them.
+        Cancelled if the connection is lost first.
+        """
+        F, lane = self._loop.create_future(), LANES.index(name)
+        if self._tx_order:
+            # some may still be waiting for the executor
+            self._tx_order.append(partial(self._lane_wait, lane, F))
+        else:
+            self._lane_wait(lane, F)
+        return F
+
+    def _lane_wait(self, lane, F):
+        if F.done():
+            pass
+        elif self._lane_sent[lane]>=self._lane_total[lane]:
+            F.set_result(None)
+        else:
+            self._lane_waiters[lane].append((self._lane_total[lane], F))
+
+    def _write(self, S):
+        # S is [header, pad, body]*N with all messages of the same type
+        lane = _lane_of[S[0][1]]
+        self._lane_total[lane] += len(S)//3
         if self.debug_net:
             self.log.debug("send message serialized %s", S)
+        if self._stats is not None:
+            self._stats._sent(S)
+        if self._trace_send:
+            self._traced_send(S)
+
+        if self._lane_count==0 and self._W.transport.get_write_buffer_size()<=self.send_hwm:
+            # fast path.  nothing waiting
+            # seems that with python 3.4.2 underlying .write() can't fail
+            # other than OoM
+            # TCP half-closed isn't supported.
+            # we only find out about close from read side.
+            self._lane_sent[lane] += len(S)//3
+            self._W.writelines(S)
+        else:
+            self._lanes[lane].append(S)
+            self._lane_count += 1
+            self._lane_bytes += sum(map(len, S))
+            self._lane_held[lane] += len(S)//3
+            if self._lane_T is None:
+                self._lane_T = self._loop.create_task(self._drain_lanes())
+
+    def _flush_lanes(self, force=False):
+        """Move messages from lanes to the transport in priority order.
+        Stops when the transport buffer is over send_hwm, unless force=True.
+        """
+        W, T = self._W, self._W.transport
+        while self._lane_count:
+            wrote = False
+            for lane, (Q, N) in enumerate(zip(self._lanes, self.lane_weights)):
+                for i in range(min(N, len(Q))):
+                    S = Q.popleft()
+                    self._lane_count -= 1
+                    self._lane_bytes -= sum(map(len, S))
+                    self._lane_sent[lane] += len(S)//3
+                    W.writelines(S)
+                    wrote = True
+                    if self._lane_waiters[lane]:
+                        self._lane_wake(lane)
+                if wrote and not force and T.get_write_buffer_size()>self.send_hwm:
+                    return
+
+    def _lane_wake(self, lane):
+        Q, sent = self._lane_waiters[lane], self._lane_sent[lane]
+        while Q and Q[0][0]<=sent:
+            F = Q.popleft()[1]
+            if not F.done():
+                F.set_result(None)
+
+    async def _drain_lanes(self):
+        try:
+            while self._lane_count and self._running:
+                # wait for transport to resume writing
+                await self._W.drain()
+                self._flush_lanes()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            # connection lost.  _recv() will notice
+            self.log.debug("Lane flush stops: %s", e)
+        finally:
+            self._lane_T = None
  
     def call(self, *, path=None, interface=None, member=None, destination=None, sig=None, body=None,
              future=None):
@@ -315,171 +793,174 @@ class Connection(object):
         :returns: A Future which completes with the result value.  If future==None then a new Future is allocated.
         :throws: RemoteError if call results in an Error response.
         '''
-        assert path is not None, "Method calls require path="
-        assert member is not None, "Method calls require member="
-        assert sig is None or isinstance(sig, str), "Signature must be str (or None)"
-
-        ret = asyncio.Future(loop=self._loop)
-
         if not self._running:
+            ret = future or self._loop.create_future()
             ret.set_exception(NoReplyError())
             return ret
         elif self._closed is not None:
             raise ConnectionClosed()
 
-        self.log.debug('call %s', (path, interface, member, destination, sig, body))
+        ret = future or self._loop.create_future()
+        if self._budget is not None and self._budget.reject_calls and self._over_budget():
+            ret.set_exception(RemoteError("Memory budget exceeded", name=LimitsExceed))
+            return ret
+        self._call(ret, path, interface, member, destination, sig, body)
+        return ret
 
-        opts = [
-            (1, Object(path)),
-            (3, member),
-        ]
-        if interface is not None:
-            opts.append((2, interface))
-        if destination is not None:
-            opts.append((6, destination))
+    def call_cb(self, callback, *, path=None, interface=None, member=None, destination=None, sig=None, body=None):
+        '''Call remote method, and pass the result to a callback.
 
-        if sig is not None:
-            bodystr = encode(sig.encode('ascii'), body)
-            opts.append((8, Signature(sig)))
-        else:
-            bodystr = b''
+        When the reply arrives, or the connection is lost, *callback* is
+        invoked as 'callback(result, None)' or 'callback(None, RemoteError())'.
+        The callback is run directly from the receiver task,
+        avoiding the allocation of a Future and a task wakeup per call.
+        A callback must not block.
+        '''
+        if not self._running:
+            self._loop.call_soon(callback, None, NoReplyError())
+            return
+        elif self._closed is not None:
+            raise ConnectionClosed()
+        elif self._budget is not None and self._budget.reject_calls and self._over_budget():
+            self._loop.call_soon(callback, None, RemoteError("Memory budget exceeded", name=LimitsExceed))
+            return
 
-        SN = self.get_sn()
-        req = (ord(_sys_L), METHOD_CALL, 0, 1,   len(bodystr), SN,   opts)
-        self.log.debug("call message %s %s", req, bodystr)
-        header = encode(b'yyyyuua(yv)', req)
+        return self._call(callback, path, interface, member, destination, sig, body)
 
-        ret = future or asyncio.Future(loop=self._loop)
-        self._inprog[SN] = ret
-        self._send(header, bodystr)
-        return ret
+    async def call_batch(self, calls, *, destination=None):
+        """Call several methods of one peer with a single message.
+
+        Uses the org.dbucket.Batch interface exported by dbucket peers.
+        When the peer lacks it, the calls are instead sent pipelined,
+        as individual messages without waiting for replies.
+
+        eg. 'await conn.call_batch([{'path':'/a', 'interface':'foo.bar', 'member':'Get'}, ...], destination=...)'
+
+        :param calls: A list of dicts of 'path', 'interface', 'member', 'sig', and 'body', as for :py:meth:`call`.
+                      As with call(), 'interface' may be omitted.
+        :param str destination: The peer
+        :returns: A list of results, in the order of calls.  An error is returned as a RemoteError instance.
+        """
+        from .xcode import encode, decode
+        if destination not in (self._no_batch or ()):
+            entries = []
+            for C in calls:
+                sig = (C.get('sig') or '').encode('ascii')
+                body = encode(sig, C.get('body'), lsb=True) if sig else b''
+                entries.append((C['path'], C.get('interface') or '', C['member'], sig, body))
+            try:
+                R = await self.call(destination=destination, path='/', interface=BATCH, member='Call',
+                                    sig='a(ossgay)', body=entries)
+            except RemoteError as e:
+                if e.name not in (UnknownMethod, UnknownInterface, UnknownObject):
+                    raise
+                if self._no_batch is None:
+                    self._no_batch = set()
+                self._no_batch.add(destination)
+            else:
+                ret = []
+                for name, sig, body in R:
+                    if name:
+                        ret.append(RemoteError(decode(b's', bytes(body), lsb=True), name=name))
+                    else:
+                        ret.append(decode(sig, bytes(body), lsb=True) if sig else None)
+                return ret
+
+        return list(await asyncio.gather(*[self.call(destination=destination, **C) for C in calls],
+                                         return_exceptions=True))
+
+    def enable_cache(self, *, ttl=1.0, max_entries=1024):
+        """Enable single-flight calls and a reply cache.  cf. :py:mod:`dbucket.cache`
+
+        Proxy methods marked cacheable then go through the cache.
+
+        :returns: The :py:class:`.CallCache`, also available as .cache
+        """
+        if self.cache is None:
+            from .cache import CallCache
+            self.cache = CallCache(self, ttl=ttl, max_entries=max_entries)
+        return self.cache
+
+    def call_stream(self, *, path=None, interface=None, member=None, destination=None, sig=None, body=None, window=16):
+        '''Call a streaming remote method.  cf. :py:mod:`dbucket.chunks`
+
+        :param int window: Maximum number of chunks sent before being taken from the iterator.
+        :returns: A :py:class:`.ChunkStream`, an async iterator over the chunks.
+        '''
+        from .chunks import ChunkStream
+        S = ChunkStream(self, destination, path, window)
+        SN = self.call_cb(_RawCallback(S._finish), path=path, interface=interface, member=member,
+                          destination=destination, sig=sig, body=body)
+        if SN is not None:
+            self._chunk_state().streams[SN] = S
+            S._start(SN)
+        return S
+
+    def _chunk_state(self):
+        if self._chunks is None:
+            from .chunks import _Chunks
+            self._chunks = _Chunks(self)
+        return self._chunks
+
+    def call_raw(self, *, path=None, interface=None, member=None, destination=None, sig='', body=b'', lsb=_sys_lsb):
+        '''Call remote method with an already encoded body.  The reply is not decoded.
+
+        :param str sig: Signature of body.  '' for an empty body.
+        :param body: Encoded body.  bytes, bytearray, or memoryview.  Written to the transport without copying.
+        :param bool lsb: Byte order of body.  True for little endian.
+        :returns: A Future which completes with a :py:class:`.RawBody` of the reply.
+        :throws: RemoteError if call results in an Error response.
+        '''
+        F = self._loop.create_future()
+        self.call_cb(_RawReply(F), path=path, interface=interface, member=member, destination=destination,
+                     sig=sig or None, body=RawBody(sig, body, lsb))
+        return F
+
+    def _call(self, pending, path, interface, member, destination, sig, body):
+        msg = self._proto.prepare_call(path=path, interface=interface, member=member,
+                                       destination=destination, sig=sig, body=body)
+        self._send_msg(msg)
+        self._proto.expect_reply(msg.serial, pending, interface, member)
+        return msg.serial
 
     def signal(self, *, path=None, interface=None, member=None, destination=None, sig=None, body=None):
         '''Emit a signal
         '''
         if not self._running:
             return # silently drop when not conected
-        self.log.debug('signal %s', (path, interface, member, destination, sig, body))
-
-        opts = [
-            (1, Object(path)),
-            (2, interface),
-            (3, member),
-        ]
-        if destination is not None:
-            opts.append((6, destination))
-
-        if sig is not None:
-            bodystr = encode(sig.encode('ascii'), body)
-            opts.append((8, Signature(sig)))
-        else:
-            bodystr = b''
+        self._send_msg(self._proto.prepare_signal(path=path, interface=interface, member=member,
+                                                  destination=destination, sig=sig, body=body))
 
-        req = (ord(_sys_L), SIGNAL, 0, 1,  len(bodystr), self.get_sn(),   opts)
-        self.log.debug("signal message %s %s", req, bodystr)
-        header = encode(b'yyyyuua(yv)', req)
-        self._send(header, bodystr)
+    def signal_raw(self, *, path=None, interface=None, member=None, destination=None, sig='', body=b'', lsb=_sys_lsb):
+        '''Emit a signal with an already encoded body.  cf. :py:meth:`call_raw`
+        '''
+        self.signal(path=path, interface=interface, member=member, destination=destination,
+                    sig=sig or None, body=RawBody(sig, body, lsb))
+
+    def signal_many(self, destinations, *, path=None, interface=None, member=None, sig=None, body=None):
+        '''Emit the same unicast signal to each of several destinations
 
+        The body, and the common part of the header, are encoded only once.
+        All messages are passed to the transport with a single write.
+        File descriptors (type 'h') can not be sent this way.
+        '''
+        if not self._running or not destinations:
+            return # silently drop when not conected
+        self._send_msg(self._proto.prepare_signal_many(destinations, path=path, interface=interface,
+                                                       member=member, sig=sig, body=body))
 
     def _method_return(self, event, sig, body):
-        self.log.debug("return %s %s %s", event, sig, body)
         if not self._running:
             return # silently drop when not conected
-        opts = [
-            (5, Variant(b'u', event.serial)),
-            (6, event.sender), # destination
-        ]
-        if body is not None:
-            if sig is None:
-                raise ValueError("body w/o sig")
-            opts.append((8, Signature(sig)))
-            bodystr = encode(sig.encode('ascii'), body)
-        else:
-            bodystr = b''
-        if not self._running:
-            return
-
-        msg = (ord(_sys_L), METHOD_RETURN, 0, 1,   len(bodystr), self.get_sn(),   opts)
-        self.log.debug("return message %s %s", msg, bodystr)
-        header = encode(b'yyyyuua(yv)', msg)
-        self._send(header, bodystr)
+        self._send_msg(self._proto.prepare_return(event, sig, body))
 
     def _error(self, event, name, msg):
-        self.log.debug("error %s %s %s", event, name, msg)
         if not self._running:
             return # silently drop when not conected
-        if not is_interface(name):
-            self.log.warn('Invalid error name "%s"', name)
-            name = 'dbucket.InvalidErrorName'
-        msg = str(msg or name)
-        opts = [
-            (4, str(name)), # error name
-            (5, Variant(b'u', event.serial)),
-            (6, event.sender), # destination
-            (8, Signature('s')),
-        ]
-        if not self._running:
-            return
-
-        body = encode(b's', msg)
-        msg = (ord(_sys_L), ERROR, 0, 1,   len(body), self.get_sn(),   opts)
-        self.log.debug("error message %s %s", msg, body)
-        header = encode(b'yyyyuua(yv)', msg)
-        self._send(header, body)
-
-    @asyncio.coroutine
-    def _recv_msg(self):
-        '''Receive one dbus message
-        '''
-        # full message spec is
-        #   yyyyuua(yv) ...body...
-        # Treat the first part as
-        #   yyyyuuu
-        # to get body and header array sizes to compute the size of the complete message
-        head = yield from self._R.readexactly(16)
-        #self.log.debug("Header %s", repr(head))
-
-        # validate byte order and version
-        if head[0] not in (ord(b'l'), ord(b'B')) or head[3]!=1:
-            raise RuntimeError('Invalid header %s'%head)
-
-        mtype, flags = head[1], head[2]
-        lsb = head[0]==ord(b'l')
-        L = '<' if lsb else '>'
-
-        blen, sn, hlen = struct.unpack(L+'III', head[4:])
-
-        # dbus spec puts arbitrary upper bounds on message and header sizes
-        if hlen+blen>2**27 or hlen>=2**26:
-            raise RuntimeError('Message too big %s %s'%(hlen, blen))
-
-        # header is padded so the body starts on an 8 byte boundary
-        bstart = ((hlen+7)&~7)
-        # no padding after body
-        fullsize = bstart + blen
-        #self.log.debug('Remainder hlen=%d bstart=%d blen=%d, fullsize=%d', hlen, bstart, blen, fullsize)
-
-        rest = yield from self._R.readexactly(fullsize)
-        if self.debug_net:
-            self.log.debug("recv message %s", rest)
-        headers, body = head+rest[:hlen], rest[bstart:]
-        #self.log.debug('Raw Headers=%s body=%s', headers, body)
-
-        # decode full header, but discard parts already handled
-        fullheaders = decode(b'yyyyuua(yv)', headers, lsb=lsb)
-        headers = fullheaders[-1]
-
-        evt = BusEvent(mtype, sn, headers)
-
-        # decode body if provided
-        if len(body):
-            evt.body = decode(evt.sig, body, lsb=lsb)
-
-        self.log.debug('recv message %s %s', fullheaders, evt.body)
-
-        return evt
+        self._send_msg(self._proto.prepare_error(event, name, msg))
 
     def _evt_return(self, evt, sig, F):
+        self._handlers -= 1
         try:
             val = F.result()
         except asyncio.CancelledError:
@@ -493,56 +974,117 @@ class Connection(object):
         else:
             self._method_return(evt, sig, val)
 
-    @asyncio.coroutine
-    def _recv(self):
+    def _dispatch(self, evt, shed=False):
+        # tracers may be added/removed during dispatch
+        T0 = self.clock() if self._trace_done else None
+
+        if evt.type==SIGNAL:
+            if not self._proto.route_signal(evt, shed=shed):
+                # this may happen naturally due to races with RemoveMatch
+                self.log.debug("Ignored signal %s", evt)
+
+        elif evt.type in (METHOD_RETURN, ERROR):
+            F = self._proto.take_reply(evt)
+            if F is None:
+                pass
+            elif not isinstance(F, asyncio.Future):
+                if evt.type==METHOD_RETURN:
+                    self._reply_cb(F, evt.body if evt.raw is None else evt.raw, None)
+                else:
+                    self._reply_cb(F, None, RemoteError(evt.body, name=evt._error))
+            elif not F.cancelled():
+                if evt.type==METHOD_RETURN:
+                    F.set_result(evt.body)
+                else:
+                    F.set_exception(RemoteError(evt.body, name=evt._error))
+            else:
+                self.log.debug("Ignore reply to cancelled call %s", evt)
+
+        elif evt.type==METHOD_CALL and self._budget is not None and self._budget.reply_limits \
+                and self._budget.over(self):
+            if not evt._flags&NO_REPLY_EXPECTED:
+                self._budget.replied += 1
+                self._error(evt, LimitsExceed, "Memory budget exceeded")
+
+        elif evt.type==METHOD_CALL:
+            try:
+                if evt.raw is not None:
+                    ret, sig = self._raw_handler(evt)(evt), None
+                elif self._methods is None:
+                    raise RemoteError('No path', name=UnknownObject)
+                else:
+                    ret, sig = self._methods.handle(evt)
+                if asyncio.iscoroutine(ret):
+                    if self._trace_handler:
+                        ret = self._traced_handler(evt, ret)
+                    ret = self._loop.create_task(ret)
+                if inspect.isasyncgen(ret):
+                    # streaming method.  replies after the last chunk
+                    self._chunk_state().produce(evt, sig, ret)
+                elif isinstance(ret, asyncio.Future):
+                    self._handlers += 1
+                    ret.add_done_callback(partial(self._evt_return, evt, sig))
+                    #TODO: keep track and cancel on dis-connect
+                else:
+                    self._method_return(evt, sig, ret)
+            except RemoteError as e:
+                self._error(evt, e.name, repr(e))
+            except Exception as e:
+                self.log.exception("Error calling method %s", evt)
+                name = "%s.%s"%(e.__class__.__module__, e.__class__.__name__)
+                self._error(evt, name, repr(e))
+
+        else:
+            self.log.debug('Ignoring unknown dbus message type %s', evt.type)
+
+        if T0 is not None:
+            self._traced_done(evt, T0)
+
+    async def _recv(self):
+        P = self._proto
         try:
             while True:
-                evt = yield from self._recv_msg()
-
-                if evt.type==SIGNAL:
-                    used = False
-                    for M in self._signals:
-                        used |= M._emit(evt)
-                    if not used:
-                        # this may happen naturally due to races with RemoveMatch
-                       self.log.debug("Ignored signal %s", evt)
-
-                elif evt.type in (METHOD_RETURN, ERROR): 
-                    rsn = evt._return_sn
-                    try:
-                        F = self._inprog.pop(rsn)
-                    except KeyError:
-                        self.log.warn('Received reply/error with unknown S/N %s', rsn)
+                data = await self._R.read(self.read_size)
+                if not data:
+                    if self._running:
+                        self.log.error("Remote Close")
+                    break
+                if self._take_fds is not None:
+                    P.receive_fds(self._take_fds())
+                P.receive_data(data)
+
+                while True:
+                    M = P.next_message()
+                    if M is None:
+                        break
+                    evt, body, lsb, raw = M
+                    if self._stats is not None:
+                        self._stats._received(evt.type, evt._size)
+                    if self.debug_net:
+                        self.log.debug("recv message %s", raw)
+                    if self._trace_recv:
+                        # before decoding, so that undecodable messages are seen
+                        self._traced_recv(evt, evt._size, (raw,))
+
+                    # decided before decoding, so that dropped signals are not decoded
+                    shed = evt.type==SIGNAL and self._budget is not None and self._budget._shedding(self, evt)
+                    keep = self._want_raw(evt, shed)
+                    if keep is not None:
+                        evt.raw = RawBody((evt.sig or b'').decode('ascii'), body, lsb)
+                    if keep is True:
+                        pass # passed through undecoded
+                    elif self.offload_size is not None and len(body)>=self.offload_size:
+                        # we don't take the next message until this one is decoded
+                        _evt, dt = await self._loop.run_in_executor(self.executor, _timed, self._stats,
+                                                                    P._decode_body, evt, body, lsb)
+                        if dt is not None:
+                            self._stats.decode_time += dt
                     else:
-                        if not F.cancelled():
-                            if evt.type==METHOD_RETURN:
-                                F.set_result(evt.body)
-                            else:
-                                F.set_exception(RemoteError(evt.body, name=evt._error))
-                        else:
-                            self.log.debug("Ignore reply to cancelled call %s", evt)
-
-                elif evt.type==METHOD_CALL:
-                    try:
-                        ret, sig = self._methods.handle(evt)
-                        if asyncio.iscoroutine(ret):
-                            ret = ensure_future(ret)
-                        if isinstance(ret, asyncio.Future):
-                            ret.add_done_callback(partial(self._evt_return, evt, sig))
-                            #TODO: keep track and cancel on dis-connect
-                        else:
-                            self._method_return(evt, sig, ret)
-                    except RemoteError as e:
-                        self._error(evt, e.name, repr(e))
-                    except Exception as e:
-                        self.log.exception("Error calling method %s", evt)
-                        name = "%s.%s"%(e.__module__, e.__class__.__name__)
-                        self._error(evt, name, repr(e))
+                        P.decode_body(evt, body, lsb)
 
-                else:
-                    self.log.debug('Ignoring unknown dbus message type %s', evt.type)
+                    self._dispatch(evt, shed)
 
-        except (asyncio.IncompleteReadError, asyncio.CancelledError) as e:
+        except asyncio.CancelledError as e:
             if self._running:
                 self.log.exception("Remote Close")
             else:
@@ -560,45 +1102,39 @@ class Connection(object):
         if not self._lost.done():
             self._lost.set_result(None)
 
-    @asyncio.coroutine
-    def _bus_sig(self):
+    def _bus_sig(self, event):
         """Handle signals sender='org.freedesktop.DBus' (aka signals from the bus daemon)
+
+        Run synchronously from the receiver task.
         """
-        last_state = SignalQueue.NORMAL
-        while True:
-            try:
-                event, state = yield from self._bus_signals.recv(throw_done=False)
-                if state==SignalQueue.DONE:
-                    return
-                elif state==SignalQueue.OFLOW:
-                    if last_state==SignalQueue.NORMAL:
-                        self.log.warn('Missed some dbus daemon signals')
-                last_state = state
-
-                if event.member=='NameAcquired':
-                    if self._name is None:
-                        self._name = event.body
-                    self.log.debug("NameAcquired: %s", event.body)
-                    self._names.add(event.body)
-
-                elif event.member=='NameLost':
-                    if event.body not in self._names:
-                        self.log.warn("I've lost a name (%s) I didn't think I head?", event.body)
-                    self._names.discard(event.body)
+        if event.member=='NameAcquired':
+            if self._name is None:
+                self._name = event.body
+            self.log.debug("NameAcquired: %s", event.body)
+            self._names.add(event.body)
 
-                else:
-                    self.log.info("daemon signal %s", event)
-            except GeneratorExit:
-                raise
-            except:
-                self.log.exception("Error handling dbus daemon signal")
-                yield from asyncio.sleep(10)
+        elif event.member=='NameLost':
+            if event.body not in self._names:
+                self.log.warn("I've lost a name (%s) I didn't think I head?", event.body)
+            self._names.discard(event.body)
+
+        else:
+            self.log.info("daemon signal %s", event)
+
+    def setup_peer(self):
+        '''Post connection setup for a direct peer connection.
+        Called by .auth.connect_peer() and .server.Server
 
-    @asyncio.coroutine
-    def setup(self):
+        There is no bus daemon, so no Hello, and no bus name.
+        Messages need no destination, and signal matching is only local.
+        '''
+        self.peer = True
+        self.log = self._proto.log = logging.getLogger(__name__+'.peer')
+
+    async def setup(self):
         '''Post connection setup.  Called by .auth.connect_bus()
         '''
-        hello = yield from self.call(
+        hello = await self.call(
             path='/org/freedesktop/DBus',
             member='Hello',
             interface='org.freedesktop.DBus',
@@ -609,11 +1145,20 @@ class Connection(object):
         assert self._name in (hello, None), (self._name, hello)
         self._name = hello
 
-        self.log = logging.getLogger(__name__+hello)
-
-        from .proxy import createProxy
-        self.daemon = yield from createProxy(self,
-                               destination=DBUS,
-                               path=DBUS_PATH,
-                               interface=DBUS,
-        )
+        self.log = self._proto.log = logging.getLogger(__name__+hello)
+
+        # connections to the same bus share one daemon proxy class, built from
+        # the Introspection data of the first connection.  The class holds no
+        # per-connection or per-loop state, so may be used from any thread.
+        klass = Connection._daemon_proxies.get(self.guid)
+        if klass is None:
+            from .proxy import createProxy
+            self.daemon = await createProxy(self,
+                                   destination=DBUS,
+                                   path=DBUS_PATH,
+                                   interface=DBUS,
+            )
+            if self.guid is not None:
+                Connection._daemon_proxies.setdefault(self.guid, self.daemon.__class__)
+        else:
+            self.daemon = await klass(self, destination=DBUS, path=DBUS_PATH).setup()
@@ -0,0 +1,197 @@
+"""Connections sharded across several event loop threads
+
+One event loop runs on one core.  A :py:class:`ConnectionGroup` holds N
+Connections to the same bus, each owned by its own event loop in its own
+thread (a :py:class:`LoopThread`).  Work is placed onto a loop by the hash
+of a key, eg. the destination of a call, so that all traffic for one key
+stays in order on one Connection.
+
+On free-threaded Python builds the loops run in parallel.
+With the GIL, they still overlap socket I/O.
+
+  G = ConnectionGroup(get_session_infos(), 4).start()
+  F = G.call(destination='org.example', path='/', interface='org.example', member='Get')
+  F.result() # from any thread
+  ret = await G.acall(...) # from a coroutine in any loop
+  G.close()
+
+Methods return concurrent.futures.Future, which are thread safe.
+start() and close() block, and so must not be called from within one of the group's loops.
+"""
+import logging
+_log = logging.getLogger(__name__)
+
+import os, threading, zlib
+import asyncio
+import concurrent.futures
+
+from .auth import connect_bus
+
+__all__ = [
+    'LoopThread',
+    'ConnectionGroup',
+]
+
+async def _close(conn):
+    await conn.close()
+
+class LoopThread(object):
+    """An asyncio event loop run by a daemon thread.
+    """
+    def __init__(self, name=None):
+        self.loop = asyncio.new_event_loop()
+        self._T = threading.Thread(target=self._run, name=name, daemon=True)
+        self._T.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+            self.loop.close()
+
+    @property
+    def in_thread(self):
+        'Is the caller running in this thread?'
+        return threading.current_thread() is self._T
+
+    def submit(self, coro):
+        """Run a coroutine in this loop.
+
+        :returns: concurrent.futures.Future
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def call_soon(self, fn, *args):
+        'Run fn(*args) in this loop.  Thread safe.'
+        self.loop.call_soon_threadsafe(fn, *args)
+
+    def stop(self, timeout=None):
+        """Stop the loop, and join the thread.
+        """
+        if self._T.is_alive():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._T.join(timeout)
+
+class ConnectionGroup(object):
+    """N Connections to one bus, each with its own :py:class:`LoopThread`.
+
+    :param infos: Bus address(es), as for :py:func:`.connect_bus`
+    :param int nthreads: Number of loops and Connections.  Default is the number of CPUs.
+    :param kws: Passed to :py:func:`.connect_bus`
+    """
+    def __init__(self, infos, nthreads=None, **kws):
+        self._infos, self._kws = list(infos), kws
+        self.nthreads = nthreads or os.cpu_count() or 1
+        self.threads, self.connections = [], []
+
+    def start(self, timeout=None):
+        """Start the threads and connect.  Blocks until all are connected.
+
+        :returns: self
+        """
+        try:
+            for i in range(self.nthreads):
+                self.threads.append(LoopThread(name='dbucket-%d'%i))
+            futs = [LT.submit(connect_bus(self._infos, **self._kws)) for LT in self.threads]
+            for F in futs:
+                self.connections.append(F.result(timeout))
+        except:
+            self.close(timeout)
+            raise
+        return self
+
+    def close(self, timeout=None):
+        """Close all Connections, and stop the threads.  Blocks.
+        """
+        conns, threads = self.connections, self.threads
+        self.connections, self.threads = [], []
+        futs = [LT.submit(_close(C)) for C, LT in zip(conns, threads)]
+        for F in futs:
+            try:
+                F.result(timeout)
+            except Exception:
+                _log.exception("Error closing group Connection")
+        for LT in threads:
+            LT.stop(timeout)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, A, B, C):
+        self.close()
+
+    def shard(self, key):
+        """Index of the loop for key.  Stable across processes for str and bytes.
+        """
+        if isinstance(key, str):
+            key = key.encode('utf-8')
+        if isinstance(key, bytes):
+            return zlib.crc32(key)%self.nthreads
+        return hash(key)%self.nthreads
+
+    def connection(self, key):
+        'The Connection for key.  Only to be used from its own loop.  cf. submit()'
+        return self.connections[self.shard(key)]
+
+    def loop_for(self, key):
+        'The LoopThread for key'
+        return self.threads[self.shard(key)]
+
+    def submit(self, key, fn, *args):
+        """Run 'fn(conn, *args)' in the loop for key.  fn may be a coroutine function.
+
+        :returns: concurrent.futures.Future
+        """
+        i = self.shard(key)
+        conn = self.connections[i]
+        async def run():
+            ret = fn(conn, *args)
+            if asyncio.iscoroutine(ret):
+                ret = await ret
+            return ret
+        return self.threads[i].submit(run())
+
+    def call(self, *, key=None, **kws):
+        """Call a remote method through the Connection for key, or destination if key is None.
+        Thread safe.
+
+        Keyword arguments are passed to :py:meth:`.Connection.call`.
+
+        :returns: concurrent.futures.Future which completes with the result.
+        """
+        i = self.shard(kws.get('destination') if key is None else key)
+        conn = self.connections[i]
+        F = concurrent.futures.Future()
+
+        def done(result, error):
+            if error is None:
+                F.set_result(result)
+            else:
+                F.set_exception(error)
+
+        def start():
+            # no Task per call.  The reply callback completes F
+            if F.set_running_or_notify_cancel():
+                try:
+                    conn.call_cb(done, **kws)
+                except Exception as e:
+                    F.set_exception(e)
+
+        self.threads[i].call_soon(start)
+        return F
+
+    async def acall(self, *, key=None, **kws):
+        """As call(), from a coroutine in any event loop.
+        """
+        return await asyncio.wrap_future(self.call(key=key, **kws))
+
+    def subscribe(self, key, callback, **kws):
+        """Subscribe to signals with the Connection for key.
+        'callback(evt)' is run in the thread of that loop.  cf. :py:meth:`.Connection.subscribe`
+
+        :returns: concurrent.futures.Future which completes with the :py:class:`.Subscription`.
+                  Close it with 'group.submit(key, lambda conn: sub.close())'
+        """
+        return self.submit(key, lambda conn: conn.subscribe(callback, **kws))
@@ -0,0 +1,138 @@
+"""Event loop lag monitor, and detector of slow handlers
+"""
+import logging
+_log = logging.getLogger(__name__)
+
+import sys, time, threading, traceback
+from collections import deque, namedtuple
+
+__all__ = [
+    'LoopMonitor',
+    'SlowReport',
+]
+
+#: kind is one of 'stall', 'method_call', 'signal', 'method_return', 'error', or 'consumer'.
+#: interface, member, and path describe the message, or are None.
+#: consumer describes the slow SignalQueue consumer, or is None.
+SlowReport = namedtuple('SlowReport', ['kind', 'duration', 'interface', 'member', 'path', 'stack', 'consumer'])
+
+_kinds = {1:'method_call', 2:'method_return', 3:'error', 4:'signal'}
+
+class LoopMonitor(object):
+    """Measures event loop lag, and the time taken to handle each received message.
+
+    :param float threshold: Report handlers, signal consumers, and loop stalls taking longer than this (seconds).
+    :param float interval: Lag sampling period (seconds).
+    :param int keep: Number of reports to keep.
+
+    A watchdog thread samples the stack of the event loop thread when the loop
+    has stalled for longer than threshold.  The sample is attached to the
+    report of the handler which was running at the time.
+
+    eg. 'M = LoopMonitor(threshold=0.05); M.start(); M.watch(conn)'
+    """
+    def __init__(self, *, threshold=0.1, interval=0.05, keep=100, loop=None):
+        self.threshold, self.interval = threshold, interval
+        self._loop = loop
+        #: Recent :py:class:`SlowReport` s.  Newest last.
+        self.reports = deque(maxlen=keep)
+        #: Last and maximum observed loop lag (seconds)
+        self.lag_last, self.lag_max = 0.0, 0.0
+        self._lag_sum, self._lag_count = 0.0, 0
+        self._conns = {}
+        self._H = None # next tick
+        self._thread, self._stop = None, threading.Event()
+        self._beat = time.monotonic()
+        self._stack = None # sampled by watchdog during current stall
+        self._claimed = False # current stall already reported as slow handler
+
+    def start(self):
+        'Start lag measurement and the watchdog thread'
+        import asyncio
+        if self._thread is not None:
+            return
+        self._loop = self._loop or asyncio.get_event_loop()
+        self._loop_thread = threading.get_ident()
+        self._stop.clear()
+        self._beat = time.monotonic()
+        self._H = self._loop.call_later(self.interval, self._tick, self._beat+self.interval)
+        self._thread = threading.Thread(target=self._watchdog, name='dbucket-watchdog', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        'Stop lag measurement and un-watch all connections'
+        for conn in list(self._conns):
+            self.unwatch(conn)
+        if self._H is not None:
+            self._H.cancel()
+            self._H = None
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def watch(self, conn):
+        'Measure the time taken to handle each message received by a Connection'
+        self._conns[conn] = conn.add_tracer(on_dispatch_done=self._on_done)
+
+    def unwatch(self, conn):
+        conn.remove_tracer(self._conns.pop(conn))
+
+    def watch_queue(self, Q):
+        'Measure the time a SignalQueue consumer spends between calls to recv()'
+        Q.monitor = self
+
+    def snapshot(self):
+        """:returns: {'lag_last':#, 'lag_max':#, 'lag_mean':#, 'reports':[SlowReport, ...]}
+        """
+        return {
+            'lag_last':self.lag_last,
+            'lag_max':self.lag_max,
+            'lag_mean':self._lag_sum/self._lag_count if self._lag_count else 0.0,
+            'reports':list(self.reports),
+        }
+
+    def _tick(self, expect):
+        now = time.monotonic()
+        lag = max(0.0, now-expect)
+        self.lag_last, self.lag_max = lag, max(self.lag_max, lag)
+        self._lag_sum += lag
+        self._lag_count += 1
+        if lag>self.threshold and not self._claimed:
+            self._report('stall', lag, None, self._stack)
+        self._beat, self._stack, self._claimed = now, None, False
+        self._H = self._loop.call_later(self.interval, self._tick, now+self.interval)
+
+    def _watchdog(self):
+        while not self._stop.wait(self.threshold/2.0):
+            if self._stack is None and time.monotonic()-self._beat > self.interval+self.threshold:
+                frame = sys._current_frames().get(self._loop_thread)
+                if frame is not None:
+                    self._stack = ''.join(traceback.format_stack(frame))
+
+    def _on_done(self, conn, evt, start, end):
+        if end-start>self.threshold:
+            self._report(_kinds.get(evt.type, 'unknown'), end-start, evt, self._stack)
+            self._claimed = True
+
+    def _consumer_next(self, Q):
+        T = getattr(Q, '_mon_ret', None)
+        if T is not None:
+            dur = time.monotonic()-T
+            if dur>self.threshold:
+                self._report('consumer', dur, None, None, consumer=repr(Q))
+
+    def _consumer_got(self, Q):
+        Q._mon_ret = time.monotonic()
+
+    def _report(self, kind, dur, evt, stack, consumer=None):
+        if evt is not None:
+            R = SlowReport(kind, dur, evt.interface, evt.member, evt.path, stack, None)
+        else:
+            R = SlowReport(kind, dur, None, None, None, stack, consumer)
+        self.reports.append(R)
+        if consumer is not None:
+            _log.warning("Slow %s %.3f s %s", kind, dur, consumer)
+        else:
+            _log.warning("Slow %s %.3f s %s.%s on %s%s", kind, dur, R.interface, R.member, R.path,
+                         '\n'+stack if stack else '')
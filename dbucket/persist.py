@@ -6,16 +6,21 @@ from .conn import ConnectionClosed, DBUS, DBUS_PATH
 from .auth import connect_bus
 
 class PersistentConnection(object):
-    def __init__(self, infofn, *, loop=None, name=None):
+    def __init__(self, infofn, *, loop=None, name=None, stats=None):
         self._infofn = infofn
+        if stats is True:
+            from .stats import Stats
+            stats = Stats()
+        # accumulates across re-connects
+        self._stats = stats
         self._log = logging.getLogger(name or __name__)
         self._loop = loop or asyncio.get_event_loop()
         self._conn = None
-        self._connect_F = asyncio.Future(loop=self._loop)
-        self._disconnect_F = asyncio.Future(loop=self._loop)
+        self._connect_F = self._loop.create_future()
+        self._disconnect_F = self._loop.create_future()
         self._disconnect_F.set_result(self)
 
-        self._connnect_T = asyncio.async(self._connect_task(), loop=self._loop)
+        self._connnect_T = self._loop.create_task(self._connect_task())
 
         self._close_F = None
 
@@ -24,16 +29,16 @@ class PersistentConnection(object):
         self.daemon = None
 
         self._signals = {}
+        self._signal_held = 0 # bytes in SignalQueues created by new_queue()
 
-    @asyncio.coroutine
-    def _connect_task(self):
+    async def _connect_task(self):
         conn = None
         try:
             retry = 0.1
             while self._close_F is None:
                 try:
                     self._log.debug("Connecting")
-                    conn = yield from connect_bus(self._infofn(), loop=self._loop)
+                    conn = await connect_bus(self._infofn(), loop=self._loop, stats=self._stats)
                     self.damon = conn.daemon
                     # daemon calls will not be queued
                 except:
@@ -43,7 +48,7 @@ class PersistentConnection(object):
                     self._log.debug("Connected")
 
                     # mark ourselves as connected
-                    self._disconnect_F = asyncio.Future(loop=self._loop)
+                    self._disconnect_F = self._loop.create_future()
                     self._connect_F.set_result(self)
                     self._conn = conn
 
@@ -58,30 +63,28 @@ class PersistentConnection(object):
                     self._call_Q = []
 
                     self._log.debug("Issue queued method calls")
-                    yield from asyncio.gather(*Fs,
-                                            loop=self._loop,
-                                            return_exceptions=True)
+                    await asyncio.gather(*Fs, return_exceptions=True)
                     self._log.debug("queued method calls complete")
 
                     try:
                         self._log.debug("Wait for dis-connect")
-                        yield from conn._lost
+                        await conn._lost
                         self._log.debug("Dis-connect")
-                        yield from conn.close()
+                        await conn.close()
                         self._log.debug("Closed")
                     except:
                         self._log.exception("Error while waiting for disconnect")
                     finally:
                         conn = self._conn = None
                         self.damon = None
-                        self._connect_F = asyncio.Future(loop=self._loop)
+                        self._connect_F = self._loop.create_future()
                         self._disconnect_F.set_result(self)
 
                 if self._close_F is not None:
                     break
 
                 self._log.debug("Retry wait %s", retry)
-                yield from asyncio.sleep(retry)
+                await asyncio.sleep(retry)
                 if retry<15.0:
                     retry*=1.5
         except:
@@ -89,11 +92,11 @@ class PersistentConnection(object):
             if not self._disconnect_F.done():
                 self._disconnect_F.set_result(self)
             if self._connect_F.done():
-                self._connect_F = asyncio.Future(loop=self._loop)
+                self._connect_F = self._loop.create_future()
         finally:
             self.daemon = None
             if conn:
-                yield from conn.close()
+                await conn.close()
 
     def close(self):
         if self._close_F is None:
@@ -101,16 +104,15 @@ class PersistentConnection(object):
 
             self._connnect_T.cancel()
             
-            for C in self._call_Q:
-                if not C.done():
-                    C.set_result(ConnectionClosed())
+            for K in self._call_Q:
+                if not K['future'].done():
+                    K['future'].set_exception(ConnectionClosed())
 
-            self._close_F = asyncio.async(self._close_task(), loop=self._loop)
+            self._close_F = self._loop.create_task(self._close_task())
         return self._close_F
 
-    @asyncio.coroutine
-    def _close_task(self):
-        yield from self._connnect_T
+    async def _close_task(self):
+        await self._connnect_T
         self._log.debug("Closed")
 
     @property
@@ -129,6 +131,16 @@ class PersistentConnection(object):
         else:
             return []
 
+    def stats(self):
+        """Snapshot of connection metrics.
+
+        :returns: A dict, or None if not enabled (cf. stats= ctor argument)
+        """
+        if self._conn is not None:
+            return self._conn.stats()
+        elif self._stats is not None:
+            return self._stats.snapshot()
+
     @property
     def running(self):
         'Connected?'
@@ -157,7 +169,7 @@ class PersistentConnection(object):
             raise ConnectionClosed()
 
         elif self._conn is None:
-            F = asyncio.Future(loop=self._loop)
+            F = self._loop.create_future()
             K = {'future':F}
             K.update(kws)
             self._call_Q.append(K)
@@ -179,16 +191,14 @@ class PersistentConnection(object):
             self._conn._add_queue(Q)
         return Q
 
-    @asyncio.coroutine
-    def AddMatch(self, obj, expr):
+    async def AddMatch(self, obj, expr):
         if self._close_F is not None:
             raise ConnectionClosed()
         if self._conn is not None:
-            yield from self._conn.AddMatch(obj, expr)
+            await self._conn.AddMatch(obj, expr)
         self._signals[expr].add(obj)
 
-    @asyncio.coroutine
-    def RemoveMatch(self, obj, expr):
+    async def RemoveMatch(self, obj, expr):
         if self._close_F is not None:
             return
         S = self._signals[expr]
@@ -196,4 +206,4 @@ class PersistentConnection(object):
         if len(S)==0:
             del self._signals[expr]
         if self._conn is not None:
-            yield from self._conn.AddMatch(obj, expr)
+            await self._conn.AddMatch(obj, expr)
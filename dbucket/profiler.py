@@ -0,0 +1,209 @@
+"""On-demand profiling of a running process, controlled over the bus.
+
+Opt-in by attaching a Profiler.  eg.
+
+  conn.attach(Profiler(conn), path=PROFILER_PATH)
+
+then from another process
+
+  stats = await fetch_profile(client, destination=name, duration=10.0)
+  stats.sort_stats('cumulative').print_stats(20)
+"""
+import logging
+_log = logging.getLogger(__name__)
+
+import asyncio, cProfile, marshal, os, pstats, tempfile, tracemalloc, types
+
+from .conn import RemoteError
+from .proxy import Interface, Method
+
+__all__ = [
+    'Profiler',
+    'fetch_profile',
+    'load_stats',
+]
+
+#: Interface name of exported profiler object
+PROFILER='org.dbucket.Profiler'
+#: Default path of exported profiler object
+PROFILER_PATH='/org/dbucket/Profiler'
+
+_Busy = PROFILER+'.Error.Busy'
+_NoData = PROFILER+'.Error.NoData'
+_NotSupported = 'org.freedesktop.DBus.Error.NotSupported'
+_InvalidArgs = 'org.freedesktop.DBus.Error.InvalidArgs'
+
+@Interface(PROFILER)
+class Profiler(object):
+    """Exported object to start/stop cProfile and tracemalloc.
+
+    :param conn: Connection whose message dispatch may be selectively profiled.
+    :param str save_dir: Directory in which Save() writes.  None disables Save().
+    """
+    #: Upper limit on profiling duration (seconds)
+    max_duration = 600.0
+
+    def __init__(self, conn, *, save_dir=None):
+        self._conn = conn
+        self._save_dir = save_dir
+        self._prof, self._result = None, None
+        self._H, self._T = None, None
+        self._ifaces = None
+
+    @Method()
+    def Start(self, duration:'d', interfaces:'as'):
+        """Start profiling for at most duration seconds.
+
+        If interfaces is not empty, only the dispatch of messages
+        with these interfaces is profiled, including each step of
+        asynchronous method handlers.
+        """
+        if self._prof is not None:
+            raise RemoteError("Profiler already running", name=_Busy)
+        self._prof, self._result = cProfile.Profile(), None
+
+        if len(interfaces):
+            self._ifaces = set(interfaces)
+            self._T = self._conn.add_tracer(on_recv=self._on_recv, on_dispatch_done=self._on_done,
+                                            on_handler=self._on_handler)
+        else:
+            self._prof.enable()
+
+        self._H = self._conn.loop.call_later(min(duration, self.max_duration), self._stop)
+        _log.info("Start profiling for %s sec. %s", duration, interfaces or '')
+
+    @Method()
+    def Stop(self) -> 'ay':
+        """Stop profiling if running, and return the results
+        in the pstats file format (marshal'd).
+        """
+        self._stop()
+        if self._result is None:
+            raise RemoteError("No profile data", name=_NoData)
+        return self._result
+
+    @Method()
+    def Save(self, name:str) -> str:
+        """Stop profiling if running, and write the results to a file
+        in the save_dir given to the ctor.
+
+        :param name: File name, without any directory part.  An existing file is replaced.
+        :returns: Full path of the file written.
+        """
+        if self._save_dir is None:
+            raise RemoteError("Save not enabled", name=_NotSupported)
+        elif not name or name in ('.', '..') or os.path.basename(name)!=name:
+            raise RemoteError("Invalid file name %r"%name, name=_InvalidArgs)
+        raw = self.Stop()
+        path = os.path.join(self._save_dir, name)
+        # don't follow a symlink out of save_dir
+        fd = os.open(path, os.O_WRONLY|os.O_CREAT|os.O_TRUNC|os.O_NOFOLLOW, 0o600)
+        with os.fdopen(fd, 'wb') as F:
+            F.write(raw)
+        return path
+
+    @Method()
+    def TracemallocStart(self, nframes:'u'):
+        'Start tracing memory allocations.  cf. tracemalloc.start()'
+        tracemalloc.start(max(1, nframes))
+
+    @Method()
+    def TracemallocSnapshot(self, key:str, limit:'u') -> str:
+        """Take a snapshot of traced allocations.
+
+        :param key: Grouping.  'filename', 'lineno', or 'traceback'.
+        :param limit: Number of entries to return.
+        :returns: The largest entries, one per line.
+        """
+        if not tracemalloc.is_tracing():
+            raise RemoteError("tracemalloc not started", name=_NoData)
+        S = tracemalloc.take_snapshot().statistics(key or 'lineno')
+        lines = []
+        for stat in S[:limit or 10]:
+            lines.append(str(stat))
+            if key=='traceback':
+                lines.extend(stat.traceback.format())
+        return '\n'.join(lines)
+
+    @Method()
+    def TracemallocStop(self):
+        tracemalloc.stop()
+
+    def _on_recv(self, conn, evt, size, ts, data):
+        if evt.interface in self._ifaces:
+            self._prof.enable()
+
+    def _on_done(self, conn, evt, start, end):
+        if evt.interface in self._ifaces:
+            self._prof.disable()
+
+    def _on_handler(self, conn, evt, coro):
+        if evt.interface in self._ifaces:
+            coro = _profiled(self, self._prof, coro)
+        return coro
+
+    def _stop(self):
+        if self._prof is None:
+            return
+        if self._T is not None:
+            self._conn.remove_tracer(self._T)
+            self._T = None
+        if self._H is not None:
+            self._H.cancel()
+            self._H = None
+        self._prof.disable()
+        self._prof.create_stats()
+        self._result = marshal.dumps(self._prof.stats)
+        self._prof = None
+        _log.info("Stop profiling")
+
+@types.coroutine
+def _profile_steps(P, prof, coro):
+    # run coro, with profiling enabled for each step until the Profiler stops
+    value, exc = None, None
+    while True:
+        on = P._prof is prof
+        if on:
+            prof.enable()
+        try:
+            if exc is None:
+                F = coro.send(value)
+            else:
+                F = coro.throw(exc)
+        except StopIteration as e:
+            return e.value
+        finally:
+            if on:
+                prof.disable()
+        try:
+            value, exc = (yield F), None
+        except BaseException as e:
+            value, exc = None, e
+
+async def _profiled(P, prof, coro):
+    return await _profile_steps(P, prof, coro)
+
+def load_stats(raw):
+    """Load profile data returned by Profiler.Stop()
+
+    :param raw: bytes or list of ints
+    :rtype: pstats.Stats
+    """
+    fd, fname = tempfile.mkstemp(suffix='.pstats')
+    try:
+        with os.fdopen(fd, 'wb') as F:
+            F.write(bytes(raw))
+        return pstats.Stats(fname)
+    finally:
+        os.remove(fname)
+
+async def fetch_profile(conn, *, destination=None, path=PROFILER_PATH, duration=1.0, interfaces=[]):
+    """Profile a remote process for a time, and return the results
+
+    A coroutine yielding a pstats.Stats
+    """
+    kws = {'destination':destination, 'path':path, 'interface':PROFILER}
+    await conn.call(member='Start', sig='das', body=(duration, interfaces), **kws)
+    await asyncio.sleep(duration)
+    raw = await conn.call(member='Stop', **kws)
+    return load_stats(raw)
@@ -0,0 +1,604 @@
+"""D-Bus message protocol, without I/O
+
+:py:class:`Protocol` handles framing, encoding and decoding, serial numbers,
+matching of replies to method calls, and routing of signals.
+It does no I/O.  Received bytes are passed to receive_data(),
+and complete messages taken with next_message().  Methods which send
+return a list of buffers to be written, in order, to a transport.
+
+:py:class:`.Connection` adapts a Protocol to asyncio streams.
+"""
+import logging
+_log = logging.getLogger(__name__)
+
+import sys, struct
+from collections import namedtuple, deque
+
+from .xcode import encode, decode, Encoder, Object, Signature, Variant, UnixFD
+from .valid import is_interface
+from .signal import SignalQueue
+
+METHOD_CALL = 1
+METHOD_RETURN = 2
+ERROR = 3
+SIGNAL = 4
+
+# message header flags
+NO_REPLY_EXPECTED = 1
+
+_sys_lsb = sys.byteorder=='little'
+_sys_L   = b'l' if _sys_lsb else b'B'
+
+class BusEvent(object):
+    """Representation of a METHOD_CALL or SIGNAL message
+    """
+    #: Message type.  METHOD_CALL or SIGNAL
+    type=None
+    #: Bus Path string
+    path=None
+    #: Interface name.  May be None for METHOD_CALL
+    interface=None
+    #: Destination.  May be None
+    destination=None
+    #: Member name (aka method name)
+    member=None
+    #: Originator of the message.  Will be a unique name or DBUS
+    sender=None
+    #: Body signature.  Used only if body is not None
+    sig=None
+    #: Body value.  None if only the raw body is provided.
+    body=None
+    #: Undecoded body as a :py:class:`RawBody`, when delivered to a raw consumer.  Otherwise None.
+    raw=None
+    _size=0 # bytes on the wire
+    _flags=0 # message header flags.  eg. NO_REPLY_EXPECTED
+    _unix_fds=0 # number of file descriptors sent with the message
+    _fds=() # [UnixFD] received with the message
+    _dattrs = ('sender', 'interface', 'member', 'path', 'destination', 'type', '_error', '_return_sn', 'sig')
+    def __init__(self, mtype, sn, headers, body=None):
+        self.type, self.serial, self.body = mtype, sn, body
+        for code, val in headers:
+            if code==1:
+                self.path = val
+            elif code==2:
+                self.interface = val
+            elif code==3:
+                self.member = val
+            elif code==4:
+                self._error = val
+            elif code==5:
+                self._return_sn = val
+            elif code==6:
+                self.destination = val
+            elif code==7:
+                self.sender = val
+            elif code==8:
+                self.sig = val
+            elif code==9:
+                self._unix_fds = val
+
+    @classmethod
+    def build(klass, mtype, sn, **kws):
+        evt = klass(mtype, sn, [], body=kws.pop('body', None))
+        for N in klass._dattrs:
+            if N in kws:
+                setattr(evt, N, kws.pop(N))
+        assert len(kws)==0, kws
+        return evt
+
+    def __repr__(self):
+        S = ','.join(["%s='%s'"%(K,getattr(self, K, None)) for K in self._dattrs+('body',)])
+        return "%s(%s)"%(self.__class__.__name__, S)
+
+def _reply_opts(event):
+    opts = [(5, Variant(b'u', event.serial))]
+    if event.sender is not None:
+        # no sender, so no destination, on a peer to peer connection
+        opts.append((6, event.sender))
+    return opts
+
+class _HeaderTemplate(object):
+    """Message header encoded once and re-used for several recipients.
+
+    The common header fields are encoded up front.  build() appends the
+    per-recipient fields (eg. destination) and patches in the serial number
+    and header array length.
+    """
+    def __init__(self, mtype, opts, blen, lsb=_sys_lsb):
+        self._lsb, self._L = lsb, '<' if lsb else '>'
+        endian = ord(b'l') if lsb else ord(b'B')
+        header = encode(b'yyyyuua(yv)', (endian, mtype, 0, 1,   blen, 0,   opts), lsb=lsb)
+        # header[8:16] is the serial number and header array length
+        self._prefix, self._fields = header[:8], header[16:]
+
+    def build(self, sn, opts):
+        E = Encoder(16+len(self._fields), self._lsb)
+        for O in opts:
+            E.encode(b'(yv)', (O,))
+        tail = b''.join(E.bufs)
+        alen = len(self._fields)+len(tail)
+        return b''.join([self._prefix, struct.pack(self._L+'II', sn, alen), self._fields, tail])
+
+class RawBody(object):
+    """An encoded message body, passed through without decoding or encoding.
+
+    May be given as the body of an outgoing message, in which case the
+    sig argument is ignored.  The header of such a message is encoded with
+    the same byte order as the body, so the body buffer is written as is.
+
+    :param str sig: Body signature.  '' for an empty body.
+    :param data: Encoded body.  bytes, bytearray, or memoryview
+    :param bool lsb: Byte order of data.  True for little endian.
+    """
+    __slots__ = ('sig', 'data', 'lsb')
+    def __init__(self, sig, data, lsb=_sys_lsb):
+        self.sig, self.data, self.lsb = sig, data, lsb
+
+    def decode(self):
+        'Decode into a python value'
+        if not len(self.data):
+            return None
+        return decode(self.sig.encode('ascii'), self.data, lsb=self.lsb)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __repr__(self):
+        return 'RawBody(%r, <%d bytes>, lsb=%s)'%(self.sig, len(self.data), self.lsb)
+
+#: An outgoing message, prepared but not yet encoded.  See Protocol.encode()
+Message = namedtuple('Message', ['type', 'opts', 'sig', 'body', 'serial'])
+
+#: The same message to several recipients.  See Protocol.encode_many()
+#: recipients is [(serial, [(code, value)])] of the per-recipient header fields.
+ManyMessage = namedtuple('ManyMessage', ['type', 'opts', 'sig', 'body', 'recipients'])
+
+def _no_fds(sig):
+    if sig is not None and 'h' in sig:
+        raise ValueError("File descriptors can not be sent to several recipients")
+
+def _frame(header, body):
+    M = len(header)%8
+    pad = b'\0'*(8-M) if M else b''
+    return [header, pad, body]
+
+_U32 = {True:struct.Struct('<I').unpack_from, False:struct.Struct('>I').unpack_from}
+
+def _header_fields(raw, end, lsb):
+    """Decode the header field array, a(yv), of a message starting at raw[0]
+    and with header ending at raw[end].  A fast path for the variant types of the
+    standard fields ('s', 'o', 'g', 'u').
+
+    :returns: [(code, value)] as decode() would, or None for anything unexpected.
+    """
+    U = _U32[lsb]
+    ret, pos = [], 16
+    try:
+        while pos<end:
+            pos = (pos+7)&~7
+            code, slen, T = raw[pos], raw[pos+1], raw[pos+2]
+            if slen!=1:
+                return None
+            pos += 4
+            if T==0x73 or T==0x6f: # 's' or 'o'
+                N, = U(raw, pos)
+                val = raw[pos+4:pos+4+N].decode('utf-8')
+                pos += 5+N
+            elif T==0x67: # 'g'
+                N = raw[pos]
+                val = raw[pos+1:pos+1+N]
+                pos += 2+N
+            elif T==0x75: # 'u'
+                val, = U(raw, pos)
+                pos += 4
+            else:
+                return None
+            ret.append((code, val))
+    except (IndexError, struct.error, UnicodeDecodeError):
+        return None
+    return ret if pos==end else None
+
+class _FDFrame(list):
+    """[header, pad, body] of a message with file descriptors attached.
+    The descriptors (UnixFD) must be passed with the first byte.
+    """
+    __slots__ = ('fds',)
+    def __init__(self, S, fds):
+        list.__init__(self, S)
+        self.fds = fds
+
+class Protocol(object):
+    """D-Bus message protocol state machine.
+
+    :param stats: A :py:class:`.Stats` in which encode and decode time is accumulated, or None.
+    :param log: A logging.Logger
+    :param bool unix_fd: File descriptor passing negotiated.  Type 'h' is then decoded as
+                         :py:class:`.UnixFD`, and encoded from an int or an object with fileno().
+                         Outgoing messages with descriptors are returned as a list with an
+                         added attribute 'fds', which must be sent with the first byte (SCM_RIGHTS).
+
+    eg. to answer method calls
+
+      P.receive_data(data)
+      while True:
+          evt = P.next_event()
+          if evt is None:
+              break
+          elif evt.type==METHOD_CALL:
+              transport.writelines(P.method_return(evt, 's', 'hello'))
+    """
+    def __init__(self, *, stats=None, log=None, unix_fd=False):
+        self.log = log or _log
+        self._stats = stats
+        self.unix_fd = unix_fd
+        self._rxbuf, self._rxpos = bytearray(), 0
+        self._rxfds = deque() # [UnixFD] received, not yet claimed by a message
+        self._nextsn = 1 #TODO: randomize?
+        #: Method calls waiting for a reply.  {serial:pending}
+        self.inprog = {}
+        #: Signal consumers.  [SignalQueue|Subscription]
+        self.matchers = []
+
+    # receiving
+
+    def receive_data(self, data):
+        """Append bytes read from the transport to the receive buffer
+        """
+        if self._rxpos:
+            del self._rxbuf[:self._rxpos]
+            self._rxpos = 0
+        self._rxbuf += data
+
+    def receive_fds(self, fds):
+        """Append file descriptors received from the transport.
+        The Protocol takes ownership.
+        """
+        self._rxfds.extend([UnixFD(fd) for fd in fds])
+
+    @property
+    def buffered(self):
+        'Number of received bytes not yet taken by next_message()'
+        return len(self._rxbuf)-self._rxpos
+
+    def next_message(self):
+        """Take the next complete message from the receive buffer.
+
+        The header is decoded, the body is not.  cf. decode_body()
+
+        :returns: (BusEvent, body, lsb, raw) or None if no complete message is buffered.
+                  raw is the complete message, as bytes, and body is a memoryview of the encoded body within raw.
+        :throws: RuntimeError if the message is not valid.
+        """
+        buf, pos = self._rxbuf, self._rxpos
+        if len(buf)-pos<16:
+            return None
+
+        # full message spec is
+        #   yyyyuua(yv) ...body...
+        # Treat the first part as
+        #   yyyyuuu
+        # to get body and header array sizes to compute the size of the complete message
+
+        # validate byte order and version
+        if buf[pos] not in (ord(b'l'), ord(b'B')) or buf[pos+3]!=1:
+            raise RuntimeError('Invalid header %s'%bytes(buf[pos:pos+16]))
+
+        mtype = buf[pos+1]
+        lsb = buf[pos]==ord(b'l')
+
+        blen, sn, hlen = struct.unpack_from('<III' if lsb else '>III', buf, pos+4)
+
+        # dbus spec puts arbitrary upper bounds on message and header sizes
+        if hlen+blen>2**27 or hlen>=2**26:
+            raise RuntimeError('Message too big %s %s'%(hlen, blen))
+
+        # header is padded so the body starts on an 8 byte boundary
+        bstart = 16+((hlen+7)&~7)
+        # no padding after body
+        size = bstart + blen
+        if len(buf)-pos<size:
+            return None
+
+        # the only copy.  body is a view of it
+        raw = bytes(memoryview(buf)[pos:pos+size])
+        self._rxpos = pos+size
+
+        if self._stats is not None:
+            T0 = self._stats.clock()
+
+        # decode header fields, but not the parts already handled
+        fields = _header_fields(raw, 16+hlen, lsb)
+        if fields is None:
+            fields = decode(b'yyyyuua(yv)', raw[:16+hlen], lsb=lsb)[-1]
+
+        evt = BusEvent(mtype, sn, fields)
+        evt._size, evt._flags = size, raw[2]
+
+        if evt._unix_fds:
+            # descriptors are sent with the first byte of their message, so must already be here
+            if len(self._rxfds)<evt._unix_fds:
+                raise RuntimeError('Message with %d file descriptors, but %d received'%(evt._unix_fds, len(self._rxfds)))
+            evt._fds = [self._rxfds.popleft() for i in range(evt._unix_fds)]
+
+        if self._stats is not None:
+            self._stats.decode_time += self._stats.clock()-T0
+
+        self.log.debug('recv message %s', fields)
+        return evt, memoryview(raw)[bstart:], lsb, raw
+
+    def decode_body(self, evt, body, lsb):
+        """Decode a body returned by next_message() into evt.body
+        """
+        if self._stats is None:
+            return self._decode_body(evt, body, lsb)
+        T0 = self._stats.clock()
+        self._decode_body(evt, body, lsb)
+        self._stats.decode_time += self._stats.clock()-T0
+        return evt
+
+    def _decode_body(self, evt, body, lsb):
+        # does not touch stats, so may be run by another thread
+        if len(body):
+            evt.body = decode(evt.sig, body, lsb=lsb, fds=evt._fds if self.unix_fd else None)
+        return evt
+
+    def next_event(self):
+        """Take and decode the next complete message.
+
+        :returns: A :py:class:`BusEvent` or None
+        """
+        M = self.next_message()
+        if M is not None:
+            return self.decode_body(*M[:3])
+
+    # reply matching
+
+    def expect_reply(self, SN, pending, interface=None, member=None):
+        """Associate an object with the serial number of a method call.
+        It will be returned by take_reply() when the reply arrives.
+        """
+        self.inprog[SN] = pending
+        if self._stats is not None:
+            self._stats._call_start(SN, interface, member)
+
+    def take_reply(self, evt):
+        """Find the method call to which a METHOD_RETURN or ERROR replies.
+
+        :returns: The pending object passed to expect_reply(), or None if no call is waiting.
+        """
+        rsn = evt._return_sn
+        if self._stats is not None:
+            self._stats._call_done(rsn)
+        try:
+            return self.inprog.pop(rsn)
+        except KeyError:
+            self.log.warning('Received reply/error with unknown S/N %s', rsn)
+
+    def forget_reply(self, SN):
+        """Stop waiting for a reply.
+
+        :returns: The pending object, or None
+        """
+        if self._stats is not None:
+            self._stats._call_forget(SN)
+        return self.inprog.pop(SN, None)
+
+    def cancel_replies(self):
+        """Stop waiting for all replies.  eg. when the connection is lost.
+
+        :returns: A list of the pending objects.
+        """
+        pending = list(self.inprog.values())
+        self.inprog.clear()
+        if self._stats is not None:
+            self._stats._reset_calls()
+        return pending
+
+    # signal routing
+
+    def route_signal(self, evt, *, shed=False):
+        """Deliver a received SIGNAL to matching consumers.
+
+        :param bool shed: Drop instead of queueing.  Matching SignalQueues enter the OFLOW state.
+                          Subscription callbacks are still made.
+        :returns: True if any consumer matched, including SignalQueues which dropped it.
+        """
+        used = False
+        for M in self.matchers:
+            if shed and isinstance(M, SignalQueue):
+                if M._done==0 and M._match(evt):
+                    M._overflow()
+                    used = True
+            else:
+                used |= M._emit(evt)
+        return used
+
+    # sending
+
+    def get_sn(self):
+        SN = self._nextsn
+        self._nextsn = (SN+1)&0xffffffff
+        return SN
+
+    def encode(self, msg):
+        """Encode a complete message.
+
+        :param Message msg: From one of the prepare_*() methods
+        :returns: [header, pad, body]
+        """
+        if self._stats is None:
+            return self._encode(msg)
+        T0 = self._stats.clock()
+        S = self._encode(msg)
+        self._stats.encode_time += self._stats.clock()-T0
+        return S
+
+    def _encode(self, msg):
+        # does not touch stats, so may be run by another thread
+        mtype, opts, sig, body, SN = msg
+        lsb, fds = _sys_lsb, None
+        if isinstance(body, RawBody):
+            sig, bodystr, lsb = body.sig, body.data, body.lsb
+            if sig:
+                opts.append((8, Signature(sig)))
+        elif sig is not None:
+            fds = [] if self.unix_fd else None
+            bodystr = encode(sig.encode('ascii'), body, fds=fds)
+            opts.append((8, Signature(sig)))
+            if fds:
+                opts.append((9, Variant(b'u', len(fds))))
+        else:
+            bodystr = b''
+
+        header = (ord(b'l') if lsb else ord(b'B'), mtype, 0, 1,   len(bodystr), SN,   opts)
+        self.log.debug("send message %s %s", header, bodystr)
+        S = _frame(encode(b'yyyyuua(yv)', header, lsb=lsb), bodystr)
+        if fds:
+            S = _FDFrame(S, fds)
+        return S
+
+    def prepare_call(self, *, path=None, interface=None, member=None, destination=None, sig=None, body=None):
+        assert path is not None, "Method calls require path="
+        assert member is not None, "Method calls require member="
+        assert sig is None or isinstance(sig, str), "Signature must be str (or None)"
+
+        self.log.debug('call %s', (path, interface, member, destination, sig, body))
+
+        opts = [
+            (1, Object(path)),
+            (3, member),
+        ]
+        if interface is not None:
+            opts.append((2, interface))
+        if destination is not None:
+            opts.append((6, destination))
+
+        return Message(METHOD_CALL, opts, sig, body, self.get_sn())
+
+    def prepare_signal(self, *, path=None, interface=None, member=None, destination=None, sig=None, body=None):
+        self.log.debug('signal %s', (path, interface, member, destination, sig, body))
+
+        opts = [
+            (1, Object(path)),
+            (2, interface),
+            (3, member),
+        ]
+        if destination is not None:
+            opts.append((6, destination))
+
+        return Message(SIGNAL, opts, sig, body, self.get_sn())
+
+    def prepare_return(self, event, sig, body):
+        self.log.debug("return %s %s %s", event, sig, body)
+        opts = _reply_opts(event)
+        if body is not None:
+            if sig is None and not isinstance(body, RawBody):
+                raise ValueError("body w/o sig")
+        else:
+            sig = None
+
+        return Message(METHOD_RETURN, opts, sig, body, self.get_sn())
+
+    def prepare_error(self, event, name, msg):
+        self.log.debug("error %s %s %s", event, name, msg)
+        if not is_interface(name):
+            self.log.warning('Invalid error name "%s"', name)
+            name = 'dbucket.InvalidErrorName'
+        msg = str(msg or name)
+        opts = [(4, str(name))] # error name
+        opts.extend(_reply_opts(event))
+
+        return Message(ERROR, opts, 's', msg, self.get_sn())
+
+    def call(self, pending, **kws):
+        """Encode a method call, and expect_reply(pending).
+        Keyword arguments are those of :py:meth:`.Connection.call`.
+
+        :returns: (serial, [buffers])
+        """
+        msg = self.prepare_call(**kws)
+        S = self.encode(msg)
+        self.expect_reply(msg.serial, pending, kws.get('interface'), kws.get('member'))
+        return msg.serial, S
+
+    def signal(self, **kws):
+        """Encode a signal
+        :returns: [buffers]
+        """
+        return self.encode(self.prepare_signal(**kws))
+
+    def method_return(self, event, sig, body):
+        """Encode the reply to a received METHOD_CALL
+        :returns: [buffers]
+        """
+        return self.encode(self.prepare_return(event, sig, body))
+
+    def error(self, event, name, msg):
+        """Encode an ERROR reply to a received METHOD_CALL
+        :returns: [buffers]
+        """
+        return self.encode(self.prepare_error(event, name, msg))
+
+    def prepare_signal_many(self, destinations, *, path=None, interface=None, member=None, sig=None, body=None):
+        self.log.debug('signal_many %s', (path, interface, member, destinations, sig, body))
+        _no_fds(sig)
+        opts = [
+            (1, Object(path)),
+            (2, interface),
+            (3, member),
+        ]
+        return ManyMessage(SIGNAL, opts, sig, body, [(self.get_sn(), [(6, dest)]) for dest in destinations])
+
+    def prepare_return_many(self, events, sig, body):
+        self.log.debug("return many %s %s %s", events, sig, body)
+        if body is not None:
+            if sig is None:
+                raise ValueError("body w/o sig")
+            _no_fds(sig)
+        else:
+            sig = None
+        return ManyMessage(METHOD_RETURN, [], sig, body, [(self.get_sn(), _reply_opts(E)) for E in events])
+
+    def encode_many(self, msg):
+        """Encode the same message to several recipients.
+        The body, and the common part of the header, are encoded only once.
+
+        :param ManyMessage msg: From prepare_signal_many() or prepare_return_many()
+        :returns: [header, pad, body]*N
+        """
+        if self._stats is None:
+            return self._encode_many(msg)
+        T0 = self._stats.clock()
+        S = self._encode_many(msg)
+        self._stats.encode_time += self._stats.clock()-T0
+        return S
+
+    def _encode_many(self, msg):
+        mtype, opts, sig, body, recipients = msg
+        if sig is not None:
+            bodystr = encode(sig.encode('ascii'), body)
+            opts = opts+[(8, Signature(sig))] # msg may be encoded again
+        else:
+            bodystr = b''
+
+        T = _HeaderTemplate(mtype, opts, len(bodystr))
+        S = []
+        for SN, ropts in recipients:
+            S.extend(_frame(T.build(SN, ropts), bodystr))
+        return S
+
+    def signal_many(self, destinations, **kws):
+        """Encode the same unicast signal to each of several destinations.
+        Keyword arguments are those of :py:meth:`signal`.
+
+        :returns: [buffers]
+        """
+        return self.encode_many(self.prepare_signal_many(destinations, **kws))
+
+    def method_return_many(self, events, sig, body):
+        """Encode the same reply to several received METHOD_CALLs.
+        eg. to answer identical calls which arrived while the result was being computed.
+
+        :returns: [buffers]
+        """
+        return self.encode_many(self.prepare_return_many(events, sig, body))
@@ -6,8 +6,8 @@ from collections import defaultdict
 import asyncio, functools, inspect
 import xml.etree.ElementTree as ET
 
-from .conn import Variant, RemoteError, UnknownMethod
-from .xcode import sigsplit
+from .conn import RemoteError, UnknownMethod, BATCH
+from .xcode import Variant, sigsplit, encode, decode
 
 INTROSPECTABLE='org.freedesktop.DBus.Introspectable'
 PROPERTIES = 'org.freedesktop.DBus.Properties'
@@ -17,6 +17,7 @@ IDOCTYPE = '''<!DOCTYPE node PUBLIC "-//freedesktop//DTD D-BUS Object Introspect
 
 UNKNOWNMETHOD = "org.freedesktop.DBus.Error.UnknownMethod"
 UNKNOWNOBJECT = "org.freedesktop.DBus.Error.UnknownObject"
+INVALIDARGS = "org.freedesktop.DBus.Error.InvalidArgs"
 
 class SimpleProxy(object):
     """Simple proxy object around a connection for a single (destination, path, interface)
@@ -28,8 +29,7 @@ class SimpleProxy(object):
         self.conn = conn
         self._name, self._path, self._interface = name, path, interface
 
-    @asyncio.coroutine
-    def AddMatch(self, **kws):
+    async def AddMatch(self, **kws):
         Q = self.conn.new_queue()
         args = {
             'sender':self._name,
@@ -37,7 +37,7 @@ class SimpleProxy(object):
             'interface':self._interface,
         }
         args.update(kws)
-        yield from Q.add(**args)
+        await Q.add(**args)
         return Q
 
     def call(self, **kws):
@@ -71,8 +71,7 @@ class ProxyBase(object):
         """
         return self.proxy(path)
 
-    @asyncio.coroutine
-    def setup(self):
+    async def setup(self):
         for name, iface, doc in self._dbus_signals:
             M = SignalManager(self, iface, name)
             M.__doc__ = doc
@@ -85,10 +84,28 @@ class ProxyBase(object):
                                  self._dbus_path)
     __str__ = __repr__
 
-def makeCall(iface, mname, sig, nargs):
-    if nargs==0:
+def _caller(conn, iface, mname):
+    C = getattr(conn, 'cache', None)
+    if C is not None and (iface, mname) in C.marked:
+        return C.call
+    return conn.call
+
+def makeCall(iface, mname, sig, nargs, chunked=False):
+    if chunked:
+        # streaming method.  returns an async iterator
+        def meth(self, *args):
+            assert len(args)==nargs, "signature: "+sig
+            return self._dbus_connection.call_stream(
+                destination=self._dbus_destination,
+                path=self._dbus_path,
+                interface=iface,
+                member=mname,
+                sig=sig or None,
+                body=args or None,
+            )
+    elif nargs==0:
         def meth(self):
-            return self._dbus_connection.call(
+            return _caller(self._dbus_connection, iface, mname)(
                 destination=self._dbus_destination,
                 path=self._dbus_path,
                 interface=iface,
@@ -97,7 +114,7 @@ def makeCall(iface, mname, sig, nargs):
     else:
         def meth(self, *args):
             assert len(args)==nargs, "signature: "+sig
-            return self._dbus_connection.call(
+            return _caller(self._dbus_connection, iface, mname)(
                 destination=self._dbus_destination,
                 path=self._dbus_path,
                 interface=iface,
@@ -108,15 +125,15 @@ def makeCall(iface, mname, sig, nargs):
     meth._dbus_method = mname
     meth._dbus_sig = sig
     meth._dbus_nargs = nargs
+    meth._dbus_chunked = chunked
     return meth
 
 class SignalManager(object):
     def __init__(self, proxy, iface, signame):
         self.proxy, self.interface, self.signame = proxy, iface, signame
-    @asyncio.coroutine
-    def connect(self, Q=None):
+    async def connect(self, Q=None):
         Q = Q or self.proxy._dbus_connection.new_queue()
-        yield from Q.add(
+        await Q.add(
             #sender=self.proxy._dbus_destination, #TODO track well-known names and check this?
             path=self.proxy._dbus_path,
             interface=self.interface,
@@ -128,9 +145,8 @@ class PropertyAccessor(object):
     def __init__(self, sig, iface, name):
         self._sig, self._iface, self._name = sig, iface, name
 
-    @asyncio.coroutine
-    def __get__(self, inst, klass):
-        return (yield from inst._dbus_connection.call(
+    async def __get__(self, inst, klass):
+        return (await inst._dbus_connection.call(
             destination = inst._dbus_destination,
             path = inst._dbus_path,
             interface = PROPERTIES,
@@ -139,9 +155,8 @@ class PropertyAccessor(object):
             body = (self._iface or inst._dbus_interface, self._name),
         ))
 
-    @asyncio.coroutine
-    def __set__(self, inst, value):
-        return (yield from inst._dbus_connection.call(
+    async def __set__(self, inst, value):
+        return (await inst._dbus_connection.call(
             destination = inst._dbus_destination,
             path = inst._dbus_path,
             interface = PROPERTIES,
@@ -182,7 +197,8 @@ def buildProxy(xml, *, interface=None):
                 elif argnode.attrib['direction']=='out':
                     ret.append(argnode.attrib['type'])
 
-            meth = makeCall(iname, name, ''.join(sig), len(sig))
+            chunked = mnode.find("annotation[@name='org.dbucket.Chunked']") is not None
+            meth = makeCall(iname, name, ''.join(sig), len(sig), chunked)
             meth.__name__ = name
             meth.__doc__ = '{ret} = {iface}.{name}({arg})\n========================\n{xml}'.format(
                 ret = ', '.join(ret),
@@ -216,9 +232,8 @@ def buildProxy(xml, *, interface=None):
 
     return type(klassname, (ProxyBase,), klass)
 
-@asyncio.coroutine
-def createProxy(conn, *, destination=None, path=None, interface=None):
-    raw = yield from conn.call(
+async def createProxy(conn, *, destination=None, path=None, interface=None):
+    raw = await conn.call(
         destination=destination,
         path=path,
         interface=INTROSPECTABLE,
@@ -232,7 +247,7 @@ def createProxy(conn, *, destination=None, path=None, interface=None):
             raise RuntimeError("No Introspection data")
         klass = buildProxy(root, interface=interface)
 
-        return (yield from klass(conn, destination=destination, path=path).setup())
+        return (await klass(conn, destination=destination, path=path).setup())
     except Exception as e:
         raise RuntimeError("%s while building proxy for %s %s %s"%(e, destination, path, interface))
 
@@ -281,6 +296,14 @@ def Method(*, name=None, interface=None):
         return a,b
 
     All result in a signature "ii = meth(ii)"
+
+    An async generator streams its result.  The return annotation
+    is then the type of each chunk yielded.  cf. :py:mod:`dbucket.chunks`
+
+    @Method()
+    async def meth(n:int) -> str:
+        for i in range(n):
+            yield str(i)
     """
     def decorate(meth):
 
@@ -318,6 +341,8 @@ def Method(*, name=None, interface=None):
             ET.SubElement(node, 'arg', direction='in', type=S.decode('ascii'))
         for S in sigsplit(ret.encode('ascii')):
             ET.SubElement(node, 'arg', direction='out', type=S.decode('ascii'))
+        if inspect.isasyncgenfunction(meth):
+            ET.SubElement(node, 'annotation', name='org.dbucket.Chunked', value='true')
         meth._dbus_xml = ET.tostring(node)
 
         meth.__doc__ = meth.__doc__ or 'No doc'
@@ -428,10 +453,19 @@ class ExportNode(dict):
         intero = ET.SubElement(root, 'interface', name=INTROSPECTABLE)
         intero = ET.SubElement(intero, 'method', name='Introspect')
         ET.SubElement(intero, 'arg', dir='out', type='s')
+        if self.fullpath=='/':
+            # Connection.call_batch() calls the root path
+            batch = ET.SubElement(root, 'interface', name=BATCH)
+            batch = ET.SubElement(batch, 'method', name='Call')
+            ET.SubElement(batch, 'arg', direction='in', type='a(ossgay)')
+            ET.SubElement(batch, 'arg', direction='out', type='a(sgay)')
 
         methods = {
             (INTROSPECTABLE, 'Introspect'):self.Introspect,
         }
+        members = {
+            'Introspect':self.Introspect,
+        }
         # our test code assumes stable iteration order of members
         for K,V in inspect.getmembers(obj):
             if not hasattr(V, '_dbus_xml'):
@@ -453,24 +487,53 @@ class ExportNode(dict):
             assert iface is not None, (K,V)
 
             methods[(iface, mname)] = V
+            members.setdefault(mname, V) # for calls without an interface, first found wins
 
         self.node_xml = IDOCTYPE+ET.tostring(root).decode('ascii')
 
-        self.methods = methods
+        self.methods, self.members = methods, members
         self.obj = obj
 
     def detach(self):
         if self.obj is not None:
             del self.obj._dbus_connection
             del self.obj._dbus_path
-        self.obj = self.methods = None
+        self.obj = self.methods = self.members = None
         #if len(self)==0 and self.parent is not None:
         #    del self.parent[self]
 
         self.xml = None
         self.node_xml = '<node></node>'
 
+class _BatchEntry(object):
+    # stand in for BusEvent passed to MethodDispatch.handle()
+    __slots__ = ('path', 'interface', 'member', 'body')
+    def __init__(self, path, interface, member, body):
+        self.path, self.interface, self.member, self.body = path, interface, member, body
+
+def _batch_result(sig, ret):
+    if not sig or ret is None:
+        return ('', b'', b'')
+    sig = sig.encode('ascii')
+    return ('', sig, encode(sig, ret, lsb=True))
+
+def _batch_error(log, e):
+    if isinstance(e, RemoteError):
+        name = e.name
+    else:
+        log.exception("Error calling batched method")
+        name = "%s.%s"%(e.__class__.__module__, e.__class__.__name__)
+    return (name, b's', encode(b's', repr(e), lsb=True))
+
 class MethodDispatch(object):
+    """Dispatches method calls to attached objects.
+
+    Also handles org.dbucket.Batch.Call at any path, which executes an array
+    of (path, interface, member, sig, body) method calls, and returns an array
+    of (error name, sig, body).  Error name is '' on success.
+    An empty interface name is treated as for a METHOD_CALL without an interface.
+    Each body is encoded little endian.  cf. :py:meth:`.Connection.call_batch`
+    """
     Node = ExportNode
 
     def __init__(self, conn):
@@ -510,12 +573,19 @@ class MethodDispatch(object):
     def handle(self, evt):
         """Call method and return (value, 'sig')
         """
+        if evt.interface==BATCH and evt.member=='Call':
+            return self._batch(evt.body), 'a(sgay)'
+
         node = self._dispatch.get(evt.path)
         if node is None:
             raise RemoteError('No path', name=UNKNOWNOBJECT)
 
         try:
-            M = node.methods[(evt.interface, evt.member)]
+            if evt.interface:
+                M = node.methods[(evt.interface, evt.member)]
+            else:
+                # no interface given, so any method of this name
+                M = node.members[evt.member]
         except KeyError:
             raise RemoteError("Unknown method %s.%s"%(evt.interface, evt.member), name=UnknownMethod)
 
@@ -525,3 +595,35 @@ class MethodDispatch(object):
             return M(evt.body), M._dbus_return
         else:
             return M(*evt.body), M._dbus_return
+
+    def _batch(self, entries):
+        log = self.conn.log
+        results, pending = [], []
+        for path, iface, member, sig, body in entries:
+            try:
+                if iface==BATCH:
+                    raise RemoteError("Batches may not be nested", name=INVALIDARGS)
+                # 'ay' within a struct decodes as a list
+                args = decode(sig, bytes(body), lsb=True) if sig else None
+                ret, rsig = self.handle(_BatchEntry(path, iface, member, args))
+                if inspect.isasyncgen(ret):
+                    raise RemoteError("Streaming method %s.%s not allowed in batch"%(iface, member), name=INVALIDARGS)
+                elif asyncio.iscoroutine(ret) or isinstance(ret, asyncio.Future):
+                    pending.append((len(results), rsig, asyncio.ensure_future(ret)))
+                    results.append(None)
+                else:
+                    results.append(_batch_result(rsig, ret))
+            except Exception as e:
+                results.append(_batch_error(log, e))
+
+        if not pending:
+            return results
+
+        async def complete():
+            for i, rsig, F in pending:
+                try:
+                    results[i] = _batch_result(rsig, await F)
+                except Exception as e:
+                    results[i] = _batch_error(log, e)
+            return results
+        return complete()
@@ -0,0 +1,134 @@
+"""Flight recorder keeping recent raw messages for post-mortem analysis
+"""
+import logging
+_log = logging.getLogger(__name__)
+
+import struct, time
+
+__all__ = [
+    'FlightRecorder',
+    'dump_on_signal',
+]
+
+#: pcap link type for raw D-Bus messages
+LINKTYPE_DBUS = 231
+
+class _Ring(object):
+    """Fixed size ring of (timestamp, [buffers], size)
+    """
+    def __init__(self, maxmsgs, maxbytes):
+        self.maxmsgs, self.maxbytes = maxmsgs, maxbytes
+        # preallocate
+        self._ts, self._data, self._size = [0.0]*maxmsgs, [None]*maxmsgs, [0]*maxmsgs
+        self._head = 0 # next slot to fill
+        self.count, self.nbytes = 0, 0
+        self.oversize = 0 # messages larger than maxbytes, not kept
+
+    def add(self, ts, data, size):
+        if self.maxbytes is not None and size>self.maxbytes:
+            self.oversize += 1
+            return
+        if self.count==self.maxmsgs:
+            self._drop()
+        if self.maxbytes is not None:
+            while self.count and self.nbytes+size>self.maxbytes:
+                self._drop()
+        H = self._head
+        self._ts[H], self._data[H], self._size[H] = ts, data, size
+        self._head = (H+1)%self.maxmsgs
+        self.count += 1
+        self.nbytes += size
+
+    def _drop(self):
+        # release oldest entry
+        T = (self._head-self.count)%self.maxmsgs
+        self.nbytes -= self._size[T]
+        self._data[T] = None
+        self.count -= 1
+
+    def __iter__(self):
+        for i in range(self.count):
+            T = (self._head-self.count+i)%self.maxmsgs
+            yield self._ts[T], self._data[T]
+
+class FlightRecorder(object):
+    """Keeps references to the last messages sent and received by a Connection.
+
+    :param conn: The Connection to record
+    :param int maxmsgs: Maximum number of messages kept in each direction.
+    :param int maxbytes: If not None, maximum number of message bytes kept in each direction.
+                         A single message larger than this is not kept.
+
+    Uses the tracing hooks of the Connection.  The buffers sent and received
+    are kept by reference, not copied.  Received messages are recorded before
+    their bodies are decoded, so messages which fail to decode are included.
+    """
+    def __init__(self, conn, *, maxmsgs=256, maxbytes=None):
+        if maxmsgs<1:
+            raise ValueError("maxmsgs must be at least 1, not %r"%maxmsgs)
+        self.conn = conn
+        self._tx, self._rx = _Ring(maxmsgs, maxbytes), _Ring(maxmsgs, maxbytes)
+        self._T = conn.add_tracer(on_send=self._on_send, on_recv=self._on_recv)
+
+    def close(self):
+        'Stop recording'
+        if self._T is not None:
+            self.conn.remove_tracer(self._T)
+            self._T = None
+
+    def _on_send(self, conn, mtype, sn, size, ts, data):
+        self._tx.add(ts, data, size)
+
+    def _on_recv(self, conn, evt, size, ts, data):
+        self._rx.add(ts, data, size)
+
+    def messages(self, direction=None):
+        """Recorded messages in time order.
+
+        :param str direction: 'tx', 'rx', or None for both.
+        :returns: [(timestamp, 'tx'|'rx', bytes), ...]
+        """
+        R = []
+        if direction in (None, 'tx'):
+            R.extend([(ts, 'tx', b''.join(data)) for ts, data in self._tx])
+        if direction in (None, 'rx'):
+            R.extend([(ts, 'rx', b''.join(data)) for ts, data in self._rx])
+        R.sort(key=lambda M:M[0])
+        return R
+
+    def dump(self, fname, direction=None):
+        """Write recorded messages to a pcap file (link type DBUS).
+
+        Sent and received messages are interleaved in time order.
+        The direction can be inferred from the sender and destination header fields.
+
+        :param str fname: Output file name
+        :param str direction: 'tx', 'rx', or None for both.
+        :returns: Number of messages written
+        """
+        msgs = self.messages(direction)
+        with open(fname, 'wb') as F:
+            # magic, version 2.4, UTC, sigfigs, snaplen, link type
+            F.write(struct.pack('=IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 2**27, LINKTYPE_DBUS))
+            for ts, _dir, raw in msgs:
+                sec = int(ts)
+                F.write(struct.pack('=IIII', sec, int((ts-sec)*1e6), len(raw), len(raw)))
+                F.write(raw)
+        _log.info("Wrote %d messages to %s", len(msgs), fname)
+        return len(msgs)
+
+def dump_on_signal(recorder, pattern='dbucket-%(name)s-%(time)d.pcap', *, signum=None, loop=None):
+    """Dump a FlightRecorder to a file when the process receives a signal (default SIGUSR1).
+
+    :param str pattern: File name pattern.  May include %(name)s (bus name) and %(time)d (unix time).
+    """
+    import signal, asyncio
+    loop = loop or asyncio.get_event_loop()
+    signum = signal.SIGUSR1 if signum is None else signum
+    def handler():
+        name = (recorder.conn.name or 'unknown').replace(':', '')
+        try:
+            recorder.dump(pattern%{'name':name, 'time':time.time()})
+        except:
+            _log.exception("Failed to write flight recorder")
+    loop.add_signal_handler(signum, handler)
@@ -0,0 +1,286 @@
+"""Direct peer to peer connections, without a bus daemon
+
+A :py:class:`Server` listens on a unix socket, and performs the server side
+of the SASL exchange (EXTERNAL, checked against SO_PEERCRED).  Each client,
+connected with :py:func:`.connect_peer`, becomes a :py:class:`.Connection`
+with the usual dispatch and proxy machinery.  Messages take one socket hop,
+with no routing by the daemon.
+
+  def on_connect(conn):
+      conn.attach(obj, path='/foo')
+  server = await Server(on_connect, path='/run/user/1000/example').start()
+
+  conn = await connect_peer([server.info])
+  ret = await conn.call(path='/foo', interface='...', member='...')
+
+:py:func:`socketpair` creates a connected pair within one process.
+"""
+import logging
+_log = logging.getLogger(__name__)
+
+import os, socket, struct
+import asyncio
+
+from .auth import ConnectionFactory, hexdecode
+from .unixfd import FDStream
+
+__all__ = [
+    'Server',
+    'socketpair',
+]
+
+_PEERCRED = struct.Struct('3i') # pid, uid, gid
+
+class _AuthError(Exception):
+    pass
+
+class _Lines(object):
+    # read lines during authentication.  Reads through an FDStream so that
+    # descriptors sent with the first message, just after BEGIN, are kept.
+    limit = 16*1024
+
+    def __init__(self, S, sock, loop):
+        self.S, self.sock, self.loop, self.buf = S, sock, loop, b''
+
+    async def fill(self):
+        data = await self.S.read(4096)
+        if not data:
+            raise _AuthError('Connection closed during authentication')
+        self.buf += data
+
+    async def readline(self):
+        while True:
+            idx = self.buf.find(b'\r\n')
+            if idx>=0:
+                L, self.buf = self.buf[:idx], self.buf[idx+2:]
+                return L
+            elif len(self.buf)>self.limit:
+                raise _AuthError('Line too long')
+            await self.fill()
+
+    async def send(self, line):
+        await self.loop.sock_sendall(self.sock, line+b'\r\n')
+
+async def _server_auth(S, sock, loop, *, guid, uids, unix_fd):
+    """Server side of the SASL exchange, reading through FDStream S.
+
+    :returns: ((pid, uid, gid), fd passing agreed, bytes read after BEGIN)
+    """
+    pid, uid, gid = creds = _PEERCRED.unpack(sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, _PEERCRED.size))
+    L = _Lines(S, sock, loop)
+
+    await L.fill()
+    if L.buf[:1]!=b'\0':
+        raise _AuthError('Missing leading nil byte')
+    L.buf = L.buf[1:]
+
+    ok, fds = False, False
+    for attempt in range(16):
+        cmd, _sep, arg = (await L.readline()).partition(b' ')
+
+        if cmd==b'AUTH' and not ok:
+            mech, _sep, resp = arg.partition(b' ')
+            if mech!=b'EXTERNAL':
+                await L.send(b'REJECTED EXTERNAL')
+                continue
+            if not resp:
+                await L.send(b'DATA')
+                cmd, _sep, resp = (await L.readline()).partition(b' ')
+                if cmd!=b'DATA':
+                    await L.send(b'REJECTED EXTERNAL')
+                    continue
+            try:
+                # an empty response means the identity of the socket
+                claimed = int(hexdecode(resp).decode('ascii')) if resp else uid
+            except ValueError:
+                claimed = None
+            if claimed==uid and (uids is None or uid in uids):
+                ok = True
+                await L.send(b'OK '+guid)
+            else:
+                _log.warning("Reject peer pid=%d uid=%d claiming %s", pid, uid, claimed)
+                await L.send(b'REJECTED EXTERNAL')
+
+        elif cmd in (b'CANCEL', b'ERROR') and not ok:
+            await L.send(b'REJECTED EXTERNAL')
+
+        elif cmd==b'NEGOTIATE_UNIX_FD' and ok:
+            if unix_fd:
+                fds = True
+                await L.send(b'AGREE_UNIX_FD')
+            else:
+                await L.send(b'ERROR "Unix FD passing not enabled"')
+
+        elif cmd==b'BEGIN' and ok:
+            return creds, fds, L.buf
+
+        else:
+            await L.send(b'ERROR "Unexpected command"')
+
+    raise _AuthError('Too many authentication commands')
+
+async def _streams(sock, loop, *, S=None, unix_fd=False, data=b''):
+    """(R, W) for an authenticated socket.
+    S is the FDStream used during authentication, if any.
+    data already read is returned first.
+    """
+    if unix_fd:
+        R = W = S or FDStream(sock, loop=loop)
+        W.unread(data)
+        return R, W
+    if S is not None:
+        for fd in S.take_fds(): # not agreed, so not expected
+            os.close(fd)
+    R = asyncio.StreamReader(loop=loop)
+    if data:
+        R.feed_data(data) # before any new data from the transport
+    P = asyncio.StreamReaderProtocol(R, loop=loop)
+    T, _P = await loop.create_unix_connection(lambda: P, sock=sock)
+    return R, asyncio.StreamWriter(T, P, R, loop)
+
+class Server(object):
+    """Listen on a unix socket for direct peer connections.
+
+    on_connect(conn) is called with each authenticated :py:class:`.Connection`.
+    It may return a coroutine, which is run as a task.  Connections are
+    closed with the Server.
+
+    :param str path: Filesystem path of the socket.
+    :param str abstract: Or a name in the abstract namespace (Linux).
+    :param uids: Peer user ids allowed.  Default is the uid of this process.  None allows any.
+    :param bool unix_fd: Agree to file descriptor passing if requested.
+    :param float auth_timeout: Seconds allowed to complete authentication.
+    :param kws: Passed to the Connection factory.
+    """
+    def __init__(self, on_connect, *, path=None, abstract=None, uids=(os.getuid(),), unix_fd=True,
+                 auth_timeout=10.0, factory=ConnectionFactory, loop=None, **kws):
+        if (path is None)==(abstract is None):
+            raise ValueError("Server requires one of path= or abstract=")
+        self._on_connect, self._factory, self._kws = on_connect, factory, kws
+        self._path, self._abstract = path, abstract
+        self.uids = None if uids is None else frozenset(uids)
+        self.unix_fd, self.auth_timeout = unix_fd, auth_timeout
+        self._loop = loop or asyncio.get_event_loop()
+        self.guid = os.urandom(16).hex().encode('ascii')
+        self.connections = set()
+        self._sock, self._T, self._tasks = None, None, set()
+
+    @property
+    def info(self):
+        'Address of this Server, as accepted by :py:func:`.connect_peer`'
+        if self._abstract is not None:
+            return {'unix:abstract':self._abstract, 'guid':self.guid.decode('ascii')}
+        return {'unix:path':self._path, 'guid':self.guid.decode('ascii')}
+
+    @property
+    def address(self):
+        "Address string of this Server.  eg. 'unix:abstract=NAME,guid=...'"
+        return ','.join(['%s=%s'%KV for KV in self.info.items()])
+
+    async def start(self):
+        """Bind and start listening.
+
+        :returns: self
+        """
+        S = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            S.bind(self._path if self._abstract is None else '\0'+self._abstract)
+            S.listen(64)
+            S.setblocking(False)
+        except:
+            S.close()
+            raise
+        self._sock = S
+        self._T = self._loop.create_task(self._accept())
+        return self
+
+    async def close(self):
+        """Stop listening, and close all Connections.
+        """
+        if self._sock is None:
+            return
+        self._T.cancel()
+        for T in list(self._tasks):
+            T.cancel()
+        self._sock.close()
+        self._sock = None
+        if self._abstract is None:
+            try:
+                os.unlink(self._path)
+            except FileNotFoundError:
+                pass
+        await asyncio.gather(self._T, *self._tasks, return_exceptions=True)
+        await asyncio.gather(*[C.close() for C in list(self.connections)], return_exceptions=True)
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, A, B, C):
+        await self.close()
+
+    def _spawn(self, coro):
+        T = self._loop.create_task(coro)
+        self._tasks.add(T)
+        T.add_done_callback(self._tasks.discard)
+
+    async def _accept(self):
+        while True:
+            S, _addr = await self._loop.sock_accept(self._sock)
+            S.setblocking(False)
+            self._spawn(self._handshake(S))
+
+    async def _handshake(self, S):
+        try:
+            FS = FDStream(S, loop=self._loop)
+            creds, fds, data = await asyncio.wait_for(
+                _server_auth(FS, S, self._loop, guid=self.guid, uids=self.uids, unix_fd=self.unix_fd),
+                self.auth_timeout)
+            R, W = await _streams(S, self._loop, S=FS, unix_fd=fds, data=data)
+        except (_AuthError, OSError, asyncio.TimeoutError) as e:
+            _log.debug("Peer authentication failed: %s", e)
+            S.close()
+            return
+        except:
+            S.close()
+            raise
+        await self._connected(R, W, creds)
+
+    async def _connected(self, R, W, creds):
+        # after authentication.  creds is (pid, uid, gid)
+        conn = self._factory(W, R, self.info, loop=self._loop, **self._kws)
+        conn.setup_peer()
+        conn.peer_uid = creds[1]
+        self.connections.add(conn)
+        conn._lost.add_done_callback(lambda _F: self.connections.discard(conn))
+
+        try:
+            ret = self._on_connect(conn)
+            if asyncio.iscoroutine(ret):
+                await ret
+        except:
+            _log.exception("Error in on_connect for %s", conn)
+            await conn.close()
+
+async def socketpair(*, unix_fd=False, factory=ConnectionFactory, loop=None, **kws):
+    """Create two Connections joined by a socketpair, within one process.
+    No authentication.  eg. for tests, or between threads.
+
+    :param bool unix_fd: Enable file descriptor passing.
+    :returns: (Connection, Connection)
+    """
+    loop = loop or asyncio.get_event_loop()
+    pair = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+    ret = []
+    try:
+        for S in pair:
+            R, W = await _streams(S, loop, unix_fd=unix_fd)
+            C = factory(W, R, {'socketpair':True}, loop=loop, **kws)
+            C.setup_peer()
+            ret.append(C)
+    except:
+        for C in ret:
+            C.close()
+        for S in pair[len(ret):]:
+            S.close()
+        raise
+    return tuple(ret)
@@ -17,8 +17,9 @@ class Condition(object):
     :param str|None member: 'signal' or None
     :param str|None path: 'signal' or None
     :param str|None path_namespace: 'signal' or None
+    :param str|None arg0: First argument, which must be a string
     """
-    cattrs = set(['type', 'sender', 'interface', 'member', 'path', 'path_namespace', 'destination'])
+    cattrs = set(['type', 'sender', 'interface', 'member', 'path', 'path_namespace', 'destination', 'arg0'])
     def __init__(self, **kws):
         from .conn import DBUS
         self._remove = kws.pop('remove', True)
@@ -40,44 +41,42 @@ class Condition(object):
 
         self.expr = ','.join(expr)
 
-    def test(self, evt):
+    def test(self, evt, decoded=True):
+        """Test a signal against this Condition.
+
+        :param bool decoded: False if evt.body is not (yet) decoded.
+        :returns: True or False.  None when decoded=False and the result depends on the body.
+        """
+        ret = True
         for K, V in self._cond:
-            if K=='path_namespace' and not evt.path.startswith(V):
-                return False
+            if K=='path_namespace':
+                if not evt.path.startswith(V):
+                    return False
+            elif K=='arg0':
+                if not decoded:
+                    ret = None
+                    continue
+                B = evt.body
+                if (B[0] if isinstance(B, tuple) else B)!=V:
+                    return False
             elif getattr(evt, K)!=V:
                 return False
-        return True
+        return ret
 
     def __repr__(self):
         return "%s(%s)"%(self.__class__.__name__, self.expr)
 
-class SignalQueue(object):
-    """Handles Signal matching condition(s) and a Queue of received signals.
-
-    :param int qsize: Maximum capacity of signal queue.
+class SignalMatcher(object):
+    """Base class holding the match Conditions of a signal consumer
     """
-    #: Normal operation (not overflow)
-    NORMAL = 0
-    #: Queue overflowed.  Some signals lost before this one
-    OFLOW = 1
-    #: close() was called
-    DONE = 2
-
     Condition = Condition
-    def __init__(self, conn, *, qsize=4):
+    #: Deliver undecoded bodies.  cf. Subscription
+    raw = False
+    def __init__(self, conn):
         self.conn, self._cond = conn, []
-        self._done, self._oflow = 0, self.NORMAL
-        self._Q = asyncio.Queue(maxsize=qsize, loop=conn._loop)
-        if not hasattr(self._Q, 'task_done'):
-            # added in python 3.4.4
-            self._Q.task_done = lambda:None
-        # delgate Q state info
-        self.empty, self.full, self.qsize = self._Q.empty, self._Q.full, self._Q.qsize
+        self._done = 0
 
-    @asyncio.coroutine
-    def add(self, **kws):
-        if self._done>0:
-            raise RuntimeError("close() called")
+    async def add(self, **kws):
         """Add a new matching Condition
         
         :param str|None type: 'signal' or None
@@ -87,6 +86,7 @@ class SignalQueue(object):
         :param str|None member: 'signal' or None
         :param str|None path: 'signal' or None
         :param str|None path_namespace: 'signal' or None
+        :param str|None arg0: First argument, which must be a string
         :returns: Condition
         """
         if self._done>0:
@@ -97,14 +97,13 @@ class SignalQueue(object):
 
         if C._remove:
             try:
-                yield from self.conn.AddMatch(C, C.expr)
+                await self.conn.AddMatch(C, C.expr)
             except:
                 self._cond.remove(C)
                 raise
         return C
 
-    @asyncio.coroutine
-    def remove(self, C):
+    async def remove(self, C):
         """Removes a Condition returned by add()
         
         :param Condition C: Condition to remove
@@ -119,10 +118,67 @@ class SignalQueue(object):
 
         self._cond.remove(C)
         if C._remove:
-            yield from self.conn.RemoveMatch(C, C.expr)
+            await self.conn.RemoveMatch(C, C.expr)
+
+    async def _remove_all(self):
+        conds, self._cond = self._cond, []
+        await asyncio.gather(*[self.conn.RemoveMatch(C, C.expr) for C in conds if C._remove],
+                             return_exceptions=True)
+
+    def _match(self, evt, decoded=True):
+        ok = False
+        for C in self._cond:
+            R = C.test(evt, decoded)
+            if R:
+                return True
+            elif R is None:
+                ok = None
+        return ok
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, A, B, C):
+        await self.close()
+
+    def __repr__(self):
+        return "%s(%s)"%(self.__class__.__name__, self._cond)
+
+class SignalQueue(SignalMatcher):
+    """Handles Signal matching condition(s) and a Queue of received signals.
+
+    :param int qsize: Maximum capacity of signal queue.
+    :param str name: Label used in statistics.  Defaults to the match expressions.
+
+    An async iterator, and an async context manager which close()s on exit.
+    """
+    #: Normal operation (not overflow)
+    NORMAL = 0
+    #: Queue overflowed.  Some signals lost before this one
+    OFLOW = 1
+    #: close() was called
+    DONE = 2
 
-    @asyncio.coroutine
-    def close(self):
+    #: If set, a :py:class:`.LoopMonitor` measuring the consumer of this queue
+    monitor = None
+
+    def __init__(self, conn, *, qsize=4, name=None):
+        SignalMatcher.__init__(self, conn)
+        self._oflow = self.NORMAL
+        self.name = name
+        #: Number of times this queue has entered the overflow state
+        self.overflows = 0
+        self._held = 0 # approximate bytes of queued messages
+        self._Q = asyncio.Queue(maxsize=qsize)
+        # delgate Q state info
+        self.empty, self.full, self.qsize = self._Q.empty, self._Q.full, self._Q.qsize
+
+    @property
+    def label(self):
+        'Name used in statistics'
+        return self.name or ' | '.join([C.expr for C in self._cond]) or repr(self)
+
+    async def close(self):
         """Remove all Conditions and push DONE to the queue.
 
         This coroutine completes after all matches are removed
@@ -138,14 +194,11 @@ class SignalQueue(object):
         self.conn._drop_queue(self)
 
         # remove out matches
-        conds, self._cond = self._cond, []
-        yield from asyncio.gather(*[self.conn.RemoveMatch(C, C.expr) for C in conds],
-                                  loop=self.conn._loop, return_exceptions=True)
+        await self._remove_all()
 
-        yield from self._Q.put((None, self.DONE)) # waits if _Q is full
+        await self._Q.put((None, self.DONE)) # waits if _Q is full
 
-    @asyncio.coroutine
-    def recv(self, *, throw_done=True):
+    async def recv(self, *, throw_done=True):
         """coroutine yielding the next bus event
 
         :param bool throw_done: If False then returns (None, DONE). If True then ConnectionClosed is thrown.
@@ -156,13 +209,20 @@ class SignalQueue(object):
     
         A coroutine
         """
+        if self.monitor is not None:
+            self.monitor._consumer_next(self)
         if self._done<2:
-            evt, sts = yield from self._Q.get()
+            evt, sts = await self._Q.get()
             self._Q.task_done()
             if sts==self.DONE:
                 self._done=2
+            else:
+                self._held -= evt._size
+                self.conn._signal_held -= evt._size
         else:
             evt, sts = None, self.DONE
+        if self.monitor is not None:
+            self.monitor._consumer_got(self)
         if throw_done and sts==self.DONE:
             from .conn import ConnectionClosed
             raise ConnectionClosed()
@@ -178,37 +238,94 @@ class SignalQueue(object):
             self._Q.task_done()
             if sts==self.DONE:
                 self._done=2
+            else:
+                self._held -= evt._size
+                self.conn._signal_held -= evt._size
         else:
             evt, sts = None, self.DONE
         if throw_done and sts==self.DONE:
+            from .conn import ConnectionClosed
             raise ConnectionClosed()
         return evt, sts
 
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        """Iteration yields (:py:class:`.BusEvent`, NORMAL|OFLOW) until close()
+
+        eg. 'async for evt, sts in Q:'
+        """
+        evt, sts = await self.recv(throw_done=False)
+        if sts==self.DONE:
+            raise StopAsyncIteration()
+        return evt, sts
 
     def _emit(self, evt):
         if self._done>0:
             return False
 
         # check match conditions
-        ok = False
-        for C in self._cond:
-            ok |= C.test(evt)
-        if not ok:
+        if not self._match(evt):
             return False
 
         self.conn.log.debug("Match %s %s", self, evt)
         try:
             self._Q.put_nowait((evt, self._oflow))
+            self._held += evt._size
+            self.conn._signal_held += evt._size
             if self._oflow == self.OFLOW:
                 self.conn.log.debug("%s %s leaves overflow state", self.__class__.__name__, self._cond)
             self._oflow = self.NORMAL
             return True
         except asyncio.QueueFull:
-            if self._oflow != self.OFLOW:
-                self.conn.log.debug("%s %s enters overflow state", self.__class__.__name__, self._cond)
-            self._oflow = self.OFLOW
+            self._overflow()
             return False
 
-    def __repr__(self):
-        return "%s(%s)"%(self.__class__.__name__, self._cond)
+    def _overflow(self):
+        # a matching signal was dropped
+        if self._oflow != self.OFLOW:
+            self.conn.log.debug("%s %s enters overflow state", self.__class__.__name__, self._cond)
+            self.overflows += 1
+        self._oflow = self.OFLOW
+
+class Subscription(SignalMatcher):
+    """Handles Signal matching condition(s) and a callback invoked for each received signal.
+
+    The callback is run synchronously from the Connection receiver task,
+    and so must not block.  Returned by :py:meth:`Connection.subscribe`.
+
+    With raw=True, the callback is passed a BusEvent with .raw set
+    to a :py:class:`.RawBody`.  .body is None, unless some other
+    consumer of the same signal required it to be decoded.
+    """
+    def __init__(self, conn, callback, *, raw=False):
+        SignalMatcher.__init__(self, conn)
+        self._cb = callback
+        self.raw = raw
+
+    async def close(self):
+        """Unsubscribe.  Remove all Conditions.
+
+        No further callbacks will be made.
+        This coroutine completes after all matches are removed.
+        """
+        if self._done>0:
+            return
+        self._done = 1
+        _log.debug("Closing signal Subscription")
+
+        self.conn._drop_queue(self)
+
+        await self._remove_all()
+
+    def _emit(self, evt):
+        if self._done>0 or not self._match(evt):
+            return False
+
+        try:
+            self._cb(evt)
+        except:
+            self.conn.log.exception("Error in signal callback %s for %s", self._cb, evt)
+        return True
 
@@ -0,0 +1,207 @@
+"""Connection metrics
+
+Collection is enabled by passing a :py:class:`Stats` to a Connection
+(eg. 'connect_bus(..., stats=Stats())').  When not enabled,
+the cost to a Connection is one test per message.
+"""
+import logging
+_log = logging.getLogger(__name__)
+
+from bisect import bisect_left
+import time
+
+from .proxy import Interface, Method
+
+__all__ = [
+    'Stats',
+    'Histogram',
+    'StatsExport',
+    'prometheus',
+]
+
+#: Interface name of exported statistics object
+STATS='org.dbucket.Stats'
+#: Default path of exported statistics object
+STATS_PATH='/org/dbucket/Stats'
+
+#: Upper bounds (seconds) of call latency histogram buckets
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+#: Names of message types.  Index by type code.
+MSG_TYPES = (None, 'method_call', 'method_return', 'error', 'signal')
+
+class Histogram(object):
+    """Count observations in buckets
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0]*(len(buckets)+1) # last is +Inf
+        self.count, self.sum = 0, 0.0
+
+    def observe(self, val):
+        self.counts[bisect_left(self.buckets, val)] += 1
+        self.count += 1
+        self.sum += val
+
+    def snapshot(self):
+        """:returns: {'count':#, 'sum':#, 'buckets':[(le, cumulative count), ...]}
+        """
+        B, N = [], 0
+        for le, C in zip(self.buckets+(float('inf'),), self.counts):
+            N += C
+            B.append((le, N))
+        return {'count':self.count, 'sum':self.sum, 'buckets':B}
+
+class Stats(object):
+    """Metrics of one Connection.
+
+    May be passed to successive Connections (cf. PersistentConnection)
+    to accumulate.
+    """
+    #: Monotonic clock used for all timing
+    clock = time.perf_counter
+
+    def __init__(self):
+        # index by message type code
+        self.msg_in, self.bytes_in = [0]*5, [0]*5
+        self.msg_out, self.bytes_out = [0]*5, [0]*5
+        self.encode_time, self.decode_time = 0.0, 0.0
+        self._calls = {} # in progress method calls.  {sn:(start, interface, member)}
+        self.latency = {} # {(interface, member):Histogram()}
+
+    def _sent(self, S):
+        for i in range(0, len(S), 3):
+            T = S[i][1]
+            self.msg_out[T] += 1
+            self.bytes_out[T] += len(S[i])+len(S[i+1])+len(S[i+2])
+
+    def _received(self, mtype, size):
+        if not 0<mtype<5:
+            return # unknown type
+        self.msg_in[mtype] += 1
+        self.bytes_in[mtype] += size
+
+    def _call_start(self, sn, interface, member):
+        self._calls[sn] = (self.clock(), interface, member)
+
+    def _call_done(self, sn):
+        try:
+            T0, iface, member = self._calls.pop(sn)
+        except KeyError:
+            return
+        try:
+            H = self.latency[(iface, member)]
+        except KeyError:
+            H = self.latency[(iface, member)] = Histogram()
+        H.observe(self.clock()-T0)
+
+    def _call_forget(self, sn):
+        self._calls.pop(sn, None)
+
+    def _reset_calls(self):
+        self._calls.clear()
+
+    def snapshot(self, conn=None):
+        """Current values as a dictionary.
+
+        :param conn: If provided, also includes gauges of this Connection.
+        """
+        R = {
+            'messages_in':dict(zip(MSG_TYPES[1:], self.msg_in[1:])),
+            'bytes_in':dict(zip(MSG_TYPES[1:], self.bytes_in[1:])),
+            'messages_out':dict(zip(MSG_TYPES[1:], self.msg_out[1:])),
+            'bytes_out':dict(zip(MSG_TYPES[1:], self.bytes_out[1:])),
+            'encode_seconds':self.encode_time,
+            'decode_seconds':self.decode_time,
+            'call_latency':dict([('%s.%s'%K, H.snapshot()) for K, H in self.latency.items()]),
+        }
+        if conn is not None:
+            R['inprog'] = len(conn._inprog)
+            R['send_lanes'] = conn.send_stats
+            Qs = R['signal_queues'] = {}
+            queues = [Q for Q in conn._signals if hasattr(Q, 'qsize')]
+            labels = [Q.label for Q in queues]
+            for Q, L in zip(queues, labels):
+                if labels.count(L)>1:
+                    L = '%s #%x'%(L, id(Q)) # keep queues with the same label apart
+                Qs[L] = {'depth':Q.qsize(), 'overflows':Q.overflows}
+        return R
+
+def _escape(s):
+    return str(s).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+def prometheus(snap, *, prefix='dbucket_', labels=None):
+    """Format a snapshot from :py:meth:`Stats.snapshot` in the Prometheus text exposition format.
+
+    :param dict labels: Extra labels added to every sample.  eg. {'conn':':1.42'}
+    :rtype: str
+    """
+    extra = ['%s="%s"'%(K, _escape(V)) for K, V in sorted((labels or {}).items())]
+    def lbl(**kws):
+        S = ','.join(extra+['%s="%s"'%(K, _escape(V)) for K, V in sorted(kws.items())])
+        return '{%s}'%S if S else ''
+
+    out = []
+    def metric(name, kind, samples):
+        out.append('# TYPE %s%s %s'%(prefix, name, kind))
+        for suffix, L, V in samples:
+            out.append('%s%s%s%s %s'%(prefix, name, suffix, L, repr(float(V)) if isinstance(V, float) else V))
+
+    for key in ('messages_in', 'bytes_in', 'messages_out', 'bytes_out'):
+        metric(key+'_total', 'counter', [('', lbl(type=T), V) for T, V in sorted(snap[key].items())])
+    metric('encode_seconds_total', 'counter', [('', lbl(), snap['encode_seconds'])])
+    metric('decode_seconds_total', 'counter', [('', lbl(), snap['decode_seconds'])])
+
+    samples = []
+    for name, H in sorted(snap['call_latency'].items()):
+        iface, _sep, member = name.rpartition('.')
+        for le, N in H['buckets']:
+            samples.append(('_bucket', lbl(interface=iface, member=member, le='+Inf' if le==float('inf') else repr(le)), N))
+        samples.append(('_sum', lbl(interface=iface, member=member), H['sum']))
+        samples.append(('_count', lbl(interface=iface, member=member), H['count']))
+    metric('call_latency_seconds', 'histogram', samples)
+
+    if 'inprog' in snap:
+        metric('calls_in_progress', 'gauge', [('', lbl(), snap['inprog'])])
+        metric('send_lane_queued', 'gauge', [('', lbl(lane=K), V['queued']) for K, V in sorted(snap['send_lanes'].items())])
+        metric('send_lane_held_total', 'counter', [('', lbl(lane=K), V['held']) for K, V in sorted(snap['send_lanes'].items())])
+        metric('signal_queue_depth', 'gauge', [('', lbl(queue=K), V['depth']) for K, V in sorted(snap['signal_queues'].items())])
+        metric('signal_queue_overflows_total', 'counter', [('', lbl(queue=K), V['overflows']) for K, V in sorted(snap['signal_queues'].items())])
+
+    return '\n'.join(out)+'\n'
+
+def _flatten(D, prefix, out):
+    for K, V in D.items():
+        if isinstance(V, dict):
+            _flatten(V, prefix+K+'.', out)
+        elif isinstance(V, (int, float)):
+            out[prefix+K] = float(V)
+    return out
+
+@Interface(STATS)
+class StatsExport(object):
+    """Export the statistics of a Connection on the bus.
+
+    eg. 'conn.attach(StatsExport(conn), path=STATS_PATH)'
+    """
+    def __init__(self, conn):
+        self._conn = conn
+
+    @Method()
+    def Get(self) -> 'a{sd}':
+        'Snapshot as a flat mapping of name to value'
+        snap = self._conn.stats() or {}
+        latency = snap.pop('call_latency', {})
+        R = _flatten(snap, '', {})
+        for name, H in latency.items():
+            R['call_latency.%s.count'%name] = float(H['count'])
+            R['call_latency.%s.sum'%name] = H['sum']
+        return R
+
+    @Method()
+    def Prometheus(self) -> str:
+        'Snapshot in Prometheus text format'
+        snap = self._conn.stats()
+        if snap is None:
+            return ''
+        return prometheus(snap, labels={'conn':self._conn.name})
@@ -0,0 +1,341 @@
+"""Shared memory stream channels negotiated over D-Bus
+
+A single producer, single consumer ring buffer of records in a memfd
+shared between two processes.  D-Bus is only the control plane.
+The method call org.dbucket.Stream.Open passes the memfd, and two eventfds
+for wake ups, to the client (cf. connect_bus(unix_fd=True)).
+The records themselves never pass through a socket.
+
+Server side, export a :py:class:`StreamExport` with a callback which is
+given a :py:class:`Channel` for each client.
+
+  def on_open(name, chan):
+      conn.loop.create_task(feed(chan)) # calls 'await chan.write(b'...')'
+  conn.attach(StreamExport(on_open), path='/waveform')
+
+Client side
+
+  chan = await open_stream(conn, destination=..., path='/waveform')
+  async for rec in chan:
+      ...
+
+Linux only.  Requires Python >= 3.10 for os.eventfd.
+"""
+import logging
+_log = logging.getLogger(__name__)
+
+import os, struct, mmap
+import asyncio
+
+from .conn import RemoteError
+from .proxy import Interface, Method
+from .xcode import UnixFD
+
+__all__ = [
+    'STREAM',
+    'Channel',
+    'StreamExport',
+    'open_stream',
+]
+
+#: Interface name of StreamExport
+STREAM = 'org.dbucket.Stream'
+
+# ring header layout.  Producer and consumer fields on separate cache lines
+_MAGIC = 0x524b4244 # 'DBKR'
+_HDR = struct.Struct('=IIQ') # magic, version, capacity
+_HEAD = 64  # Q bytes written by producer (monotonic)
+_PWAIT = 72 # I producer waiting for space
+_TAIL = 128 # Q bytes consumed by consumer (monotonic)
+_CWAIT = 136 # I consumer waiting for data
+_CLOSED = 192 # I closed by either side
+_DATA = 256
+_Q, _I = struct.Struct('=Q'), struct.Struct('=I')
+
+def _wake(F):
+    if not F.done():
+        F.set_result(None)
+
+def new_ring(size):
+    """Allocate the shared memory and eventfds of a new ring buffer.
+
+    :param int size: Minimum data capacity in bytes.  Rounded up to a power of 2, at least 4096.
+    :returns: (memfd, data eventfd, space eventfd) as UnixFD
+    """
+    import fcntl
+    capacity = 4096
+    while capacity<size:
+        capacity *= 2
+
+    mem = UnixFD(os.memfd_create('dbucket-stream', os.MFD_CLOEXEC|os.MFD_ALLOW_SEALING))
+    try:
+        os.ftruncate(mem.fileno(), _DATA+capacity)
+        with mmap.mmap(mem.fileno(), _DATA) as M:
+            _HDR.pack_into(M, 0, _MAGIC, 1, capacity)
+        # neither side may change the size, as the other would SIGBUS
+        fcntl.fcntl(mem.fileno(), fcntl.F_ADD_SEALS, fcntl.F_SEAL_SHRINK|fcntl.F_SEAL_GROW|fcntl.F_SEAL_SEAL)
+
+        data = UnixFD(os.eventfd(0, os.EFD_CLOEXEC|os.EFD_NONBLOCK))
+        space = UnixFD(os.eventfd(0, os.EFD_CLOEXEC|os.EFD_NONBLOCK))
+    except:
+        mem.close()
+        raise
+    return mem, data, space
+
+class Channel(object):
+    """One end of a ring buffer of records.
+
+    The producer calls write(), and the consumer read().
+    Records are bytes, and are delivered in order.
+
+    Either side may close().  The consumer then reads any records remaining,
+    followed by None.  The producer gets BrokenPipeError.
+
+    The exit of the process at the other end is not detected.
+    Watch the D-Bus peer (eg. NameOwnerChanged) and close() if needed.
+
+    :param mem: memfd of the ring
+    :param data: eventfd signaled by the producer when data is added
+    :param space: eventfd signaled by the consumer when space is freed
+    :param bool producer: Which end this is
+    :throws: ValueError if mem is not a ring buffer, or its size is not sealed.
+    """
+    #: Waits re-check the ring at this interval (seconds).
+    #: A backstop against a wake up missed due to memory ordering between processes.
+    poll_interval = 0.1
+
+    def __init__(self, mem, data, space, *, producer, loop=None):
+        self._loop = loop or asyncio.get_event_loop()
+        self._mem, self._data, self._space = mem, data, space
+        self.producer = producer
+        # the other side, maybe another process, could otherwise truncate the memfd,
+        # and accesses to our mapping would SIGBUS
+        import fcntl
+        try:
+            seals = fcntl.fcntl(mem.fileno(), fcntl.F_GET_SEALS)
+        except OSError:
+            seals = 0
+        required = fcntl.F_SEAL_SHRINK|fcntl.F_SEAL_GROW
+        if seals&required!=required:
+            raise ValueError("Stream ring buffer size is not sealed")
+        size = os.fstat(mem.fileno()).st_size
+        if size<_DATA:
+            raise ValueError("Not a stream ring buffer")
+        self._M = mmap.mmap(mem.fileno(), size)
+        magic, version, self.capacity = _HDR.unpack_from(self._M, 0)
+        if magic!=_MAGIC or version!=1 or size!=_DATA+self.capacity or self.capacity&(self.capacity-1):
+            self._M.close()
+            raise ValueError("Not a stream ring buffer")
+        self._mask = self.capacity-1
+        self._closed = False
+
+    @classmethod
+    def pair(klass, size=2**20, loop=None):
+        """A connected (producer, consumer) in this process.  eg. for testing
+        """
+        mem, data, space = new_ring(size)
+        P = klass(mem, data, space, producer=True, loop=loop)
+        C = klass(mem.dup(), data.dup(), space.dup(), producer=False, loop=loop)
+        return P, C
+
+    def _q(self, off):
+        return _Q.unpack_from(self._M, off)[0]
+
+    @property
+    def closed(self):
+        'Closed by either side?'
+        return self._closed or _I.unpack_from(self._M, _CLOSED)[0]!=0
+
+    def _used(self):
+        return self._q(_HEAD)-self._q(_TAIL)
+
+    def _put(self, pos, data):
+        start = pos&self._mask
+        N = min(len(data), self.capacity-start)
+        self._M[_DATA+start:_DATA+start+N] = data[:N]
+        if N<len(data):
+            self._M[_DATA:_DATA+len(data)-N] = data[N:]
+
+    def _get(self, pos, N):
+        start = pos&self._mask
+        M = min(N, self.capacity-start)
+        ret = self._M[_DATA+start:_DATA+start+M]
+        if M<N:
+            ret += self._M[_DATA:_DATA+N-M]
+        return ret
+
+    @staticmethod
+    def _signal(evt):
+        try:
+            os.eventfd_write(evt.fileno(), 1)
+        except BlockingIOError:
+            pass # counter saturated.  already signaled
+
+    async def _wait(self, evt, flag, ready):
+        _I.pack_into(self._M, flag, 1)
+        try:
+            if ready() or self.closed:
+                return
+            F = self._loop.create_future()
+            fd = evt.fileno()
+            self._loop.add_reader(fd, _wake, F)
+            H = self._loop.call_later(self.poll_interval, _wake, F)
+            try:
+                await F
+            finally:
+                H.cancel()
+                self._loop.remove_reader(fd)
+            if self._closed:
+                return # by another task
+            try:
+                os.eventfd_read(fd)
+            except BlockingIOError:
+                pass
+        finally:
+            if not self._closed:
+                _I.pack_into(self._M, flag, 0)
+
+    def try_write(self, data):
+        """Append one record if there is space.
+
+        :returns: True if written, False if full.
+        :throws: BrokenPipeError if closed.  ValueError if larger than the ring.
+        """
+        if not self.producer:
+            raise RuntimeError("Consumer can't write")
+        elif self.closed:
+            raise BrokenPipeError("Stream closed")
+        need = 4+len(data)
+        if need>self.capacity:
+            raise ValueError("Record of %d bytes exceeds capacity %d"%(len(data), self.capacity))
+        head = self._q(_HEAD)
+        if self.capacity-(head-self._q(_TAIL))<need:
+            return False
+        self._put(head, _I.pack(len(data)))
+        self._put(head+4, data)
+        _Q.pack_into(self._M, _HEAD, head+need)
+        if _I.unpack_from(self._M, _CWAIT)[0]:
+            self._signal(self._data)
+        return True
+
+    async def write(self, data):
+        """Append one record, waiting for space if necessary.
+
+        :throws: BrokenPipeError if closed.  ValueError if larger than the ring.
+        """
+        need = 4+len(data)
+        while not self.try_write(data):
+            await self._wait(self._space, _PWAIT, lambda: self.capacity-self._used()>=need)
+
+    def try_read(self):
+        """Take the next record if available.
+
+        :returns: bytes, or False if empty, or None if empty and closed.
+        """
+        if self.producer:
+            raise RuntimeError("Producer can't read")
+        elif self._closed:
+            return None
+        tail = self._q(_TAIL)
+        if self._q(_HEAD)==tail:
+            return None if self.closed else False
+        N, = _I.unpack(self._get(tail, 4))
+        ret = self._get(tail+4, N)
+        _Q.pack_into(self._M, _TAIL, tail+4+N)
+        if _I.unpack_from(self._M, _PWAIT)[0]:
+            self._signal(self._space)
+        return ret
+
+    async def read(self):
+        """Take the next record, waiting if necessary.
+
+        :returns: bytes, or None after the stream is closed and drained.
+        """
+        while True:
+            ret = self.try_read()
+            if ret is not False:
+                return ret
+            await self._wait(self._data, _CWAIT, lambda: self._used()>0)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        ret = await self.read()
+        if ret is None:
+            raise StopAsyncIteration
+        return ret
+
+    def close(self):
+        """Close this end, and notify the other.
+        """
+        if self._closed:
+            return
+        _I.pack_into(self._M, _CLOSED, 1)
+        self._closed = True
+        self._signal(self._data)
+        self._signal(self._space)
+        self._M.close()
+        for F in (self._mem, self._data, self._space):
+            F.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, A, B, C):
+        self.close()
+
+@Interface(STREAM)
+class StreamExport(object):
+    """Accepts requests from :py:func:`open_stream`.  Attach to a Connection
+    which has unix_fd passing.
+
+    'on_open(name, chan)' is called with the name requested by the client,
+    and a :py:class:`Channel`.  The producer end when the client reads (mode='r'),
+    or the consumer when the client writes (mode='w').
+    It is called synchronously, and may start a task to service the Channel.
+    An exception raised is returned to the client as an error.
+
+    :param int max_size: Largest ring capacity which a client may request.
+    """
+    def __init__(self, on_open, *, max_size=64*2**20):
+        self._on_open, self.max_size = on_open, max_size
+
+    @Method()
+    def Open(self, name:str, mode:str, size:'u') -> ('h', 'h', 'h'):
+        """Create a new ring buffer.  Returns the memfd and the data and space eventfds.
+        """
+        if mode not in ('r', 'w'):
+            raise RemoteError("mode must be 'r' or 'w', not %r"%mode, name='org.freedesktop.DBus.Error.InvalidArgs')
+        elif size>self.max_size:
+            raise RemoteError("size %d exceeds %d"%(size, self.max_size), name='org.freedesktop.DBus.Error.LimitsExceeded')
+
+        mem, data, space = new_ring(size)
+        chan = Channel(mem, data, space, producer=mode=='r', loop=self._dbus_connection.loop)
+        try:
+            self._on_open(name, chan)
+        except:
+            chan.close()
+            raise
+        # duplicates are sent, so the channel keeps these open
+        return mem, data, space
+
+async def open_stream(conn, *, destination=None, path=None, name='', mode='r', size=2**20):
+    """Request a new :py:class:`Channel` from the :py:class:`StreamExport` at (destination, path)
+
+    :param conn: A Connection with unix_fd passing
+    :param str name: Passed to on_open()
+    :param str mode: 'r' to read records, 'w' to write
+    :param int size: Ring capacity in bytes
+    :returns: Channel
+    """
+    if not conn.unix_fd:
+        raise RuntimeError("open_stream() requires a Connection with unix_fd passing.  cf. connect_bus(unix_fd=True)")
+    mem, data, space = await conn.call(destination=destination, path=path, interface=STREAM,
+                                       member='Open', sig='ssu', body=(name, mode, size))
+    try:
+        return Channel(mem, data, space, producer=mode=='w', loop=conn.loop)
+    except:
+        for F in (mem, data, space):
+            F.close()
+        raise
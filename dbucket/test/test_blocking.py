@@ -0,0 +1,79 @@
+import unittest, logging
+_log = logging.getLogger(__name__)
+
+import threading, queue
+
+from ..conn import DBUS, DBUS_PATH, RemoteError
+from ..proxy import Interface, Method, Signal
+from ..blocking import BlockingConnection
+from .util import test_bus_info
+
+class TestBlocking(unittest.TestCase):
+    @Interface('foo.bar')
+    class Echo(object):
+        @Method()
+        def Echo(self, i:int) -> int:
+            return i
+        @Method()
+        async def Count(self, n:int) -> int:
+            for i in range(n):
+                yield i
+        @Signal()
+        def Tick(self, i:int):
+            pass
+
+    def setUp(self):
+        self.server = BlockingConnection(test_bus_info(), timeout=5.0)
+        self.obj = self.Echo()
+        self.server.run(lambda conn: conn.attach(self.obj, path='/echo'))
+        self.client = BlockingConnection(test_bus_info(), timeout=5.0)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.close()
+
+    def test_call(self):
+        self.assertEqual(self.client.call(destination=self.server.name, path='/echo', interface='foo.bar',
+                                          member='Echo', sig='i', body=4), 4)
+        with self.assertRaises(RemoteError):
+            self.client.call(destination=self.server.name, path='/echo', interface='foo.bar', member='Nope')
+
+        self.assertEqual(self.client.call(destination=DBUS, path=DBUS_PATH, interface=DBUS,
+                                          member='GetNameOwner', sig='s', body=self.server.name),
+                         self.server.name)
+
+    def test_threads(self):
+        out = {}
+        def worker(T):
+            out[T] = [self.client.call(destination=self.server.name, path='/echo', interface='foo.bar',
+                                       member='Echo', sig='i', body=T*100+i) for i in range(20)]
+        threads = [threading.Thread(target=worker, args=(T,)) for T in range(8)]
+        [T.start() for T in threads]
+        [T.join() for T in threads]
+        self.assertEqual(out, {T:[T*100+i for i in range(20)] for T in range(8)})
+
+    def test_batch_wakeup(self):
+        'Calls submitted while the loop is busy share one wake up'
+        busy = threading.Event()
+        self.client._LT.call_soon(busy.wait)
+        W0 = self.client.wakeups
+        futs = [self.client.call_async(destination=self.server.name, path='/echo', interface='foo.bar',
+                                       member='Echo', sig='i', body=i) for i in range(10)]
+        busy.set()
+        self.assertEqual([F.result(5.0) for F in futs], list(range(10)))
+        self.assertEqual(self.client.wakeups, W0+1)
+
+    def test_proxy(self):
+        P = self.client.proxy(destination=self.server.name, path='/echo', interface='foo.bar')
+        self.assertEqual(P.Echo(7), 7)
+        with P.Count(5) as S:
+            self.assertEqual(list(S), list(range(5)))
+        self.assertRaises(AttributeError, getattr, P, 'Nope')
+
+    def test_signals(self):
+        with self.client.signals(interface='foo.bar', member='Tick') as S:
+            for i in range(3):
+                self.server.run(lambda conn, i=i: self.obj.Tick(i))
+            self.assertEqual([S.get(timeout=2.0).body for i in range(3)], [0, 1, 2])
+            self.assertRaises(queue.Empty, S.get, timeout=0.01)
+        self.assertEqual(list(S), [])
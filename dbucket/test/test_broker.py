@@ -0,0 +1,220 @@
+import unittest, logging
+_log = logging.getLogger(__name__)
+
+import asyncio, os
+
+from ..conn import DBUS, DBUS_PATH, RemoteError, NoReplyError
+from ..auth import connect_bus
+from ..broker import Broker, parse_match, _Rule
+from ..protocol import BusEvent, SIGNAL
+from ..proxy import Interface, Method, Signal
+from ..unixfd import sealed_memfd
+from .util import inloop, test_bus_info
+
+@Interface('foo.bar')
+class Echo(object):
+    @Method()
+    def Echo(self, s:str) -> str:
+        return s+' world'
+    @Method()
+    def Size(self, fd:'h') -> 'u':
+        return os.fstat(fd.fileno()).st_size
+    @Signal()
+    def Tick(self, s:str):
+        pass
+
+class TestMatch(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(parse_match("type='signal',interface='foo.bar'"),
+                         {'type':'signal', 'interface':'foo.bar'})
+        self.assertEqual(parse_match(r"arg0='it'\''s',path=/a"), {'arg0':"it's", 'path':'/a'})
+        self.assertEqual(parse_match(""), {})
+        self.assertRaises(ValueError, parse_match, "type='signal")
+        self.assertRaises(ValueError, parse_match, "member='a',member='b'")
+        self.assertRaises(ValueError, _Rule, "bogus='x'")
+        self.assertRaises(ValueError, _Rule, "arg1namespace='x'")
+
+    def test_rule(self):
+        evt = BusEvent.build(SIGNAL, 1, sender=':1.4', path='/a/b', interface='foo.bar', member='Tick')
+        owner = {'org.example':':1.4'}.get
+        def T(expr, args=('x.y', '/p/q')):
+            return _Rule(expr).test(evt, owner, lambda: args)
+        self.assertTrue(T("type='signal',interface='foo.bar',member='Tick'"))
+        self.assertFalse(T("type='method_call'"))
+        self.assertTrue(T("path_namespace='/a'"))
+        self.assertTrue(T("path_namespace='/'"))
+        self.assertFalse(T("path_namespace='/a/c'"))
+        self.assertTrue(T("sender='org.example'"))
+        self.assertFalse(T("sender='org.other'"))
+        self.assertTrue(T("arg0='x.y'"))
+        self.assertTrue(T("arg0namespace='x'"))
+        self.assertFalse(T("arg0namespace='x.'"))
+        self.assertTrue(T("arg1path='/p/'"))
+        self.assertFalse(T("arg2='x'"))
+
+class TestBroker(unittest.TestCase):
+    timeout = 2.0
+
+    @inloop
+    async def setUp(self):
+        self.broker = await Broker(abstract='dbucket-broker-test-%d'%os.getpid()).start()
+        self.A = await connect_bus([self.broker.info], unix_fd=True)
+        self.B = await connect_bus([self.broker.info])
+
+    @inloop
+    async def tearDown(self):
+        await asyncio.gather(self.A.close(), self.B.close())
+        await self.broker.close()
+
+    @inloop
+    async def test_call(self):
+        self.assertNotEqual(self.A.name, self.B.name)
+        self.A.attach(Echo(), path='/echo')
+        self.assertEqual(await self.B.call(destination=self.A.name, path='/echo', interface='foo.bar',
+                                           member='Echo', sig='s', body='hello'), 'hello world')
+
+        with self.assertRaises(RemoteError) as E:
+            await self.B.call(destination='org.nobody', path='/', interface='foo.bar', member='Echo')
+        self.assertEqual(E.exception.name, 'org.freedesktop.DBus.Error.ServiceUnknown')
+
+        with self.assertRaises(RemoteError) as E:
+            await self.B.call(destination=DBUS, path='/', interface=DBUS, member='Nope')
+        self.assertEqual(E.exception.name, 'org.freedesktop.DBus.Error.UnknownMethod')
+
+        with self.assertRaises(RemoteError) as E:
+            await self.B.daemon.Hello()
+        self.assertEqual(E.exception.name, 'org.freedesktop.DBus.Error.Failed')
+
+        self.assertEqual(await self.B.daemon.GetConnectionUnixUser(self.A.name), os.getuid())
+        self.assertEqual(await self.B.daemon.GetId(), self.broker.guid.decode('ascii'))
+
+        # daemon proxy class is shared only between connections to the same bus
+        self.assertEqual(self.A.guid, self.broker.guid.decode('ascii'))
+        self.assertIs(self.A.daemon.__class__, self.B.daemon.__class__)
+        async with await connect_bus(test_bus_info()) as C:
+            self.assertNotEqual(C.guid, self.A.guid)
+            self.assertIsNot(C.daemon.__class__, self.A.daemon.__class__)
+
+    @inloop
+    async def test_names(self):
+        changes = asyncio.Queue()
+        async with await self.B.subscribe(changes.put_nowait, sender=DBUS, interface=DBUS,
+                                          member='NameOwnerChanged', arg0='org.example'):
+            D = self.A.daemon
+            self.assertEqual(await D.RequestName('org.example', 1), 1) # allow replacement
+            self.assertEqual(await D.RequestName('org.example', 1), 4) # already owner
+            self.assertEqual(await self.B.daemon.RequestName('org.example', 4), 3) # exists
+            self.assertEqual(await self.B.daemon.RequestName('org.example', 0), 2) # queued
+            self.assertEqual(await D.ListQueuedOwners('org.example'), [self.A.name, self.B.name])
+            self.assertIn('org.example', await D.ListNames())
+
+            self.assertEqual((await changes.get()).body, ('org.example', '', self.A.name))
+
+            self.A.attach(Echo(), path='/echo')
+            self.assertEqual(await self.B.call(destination='org.example', path='/echo', interface='foo.bar',
+                                               member='Echo', sig='s', body='hi'), 'hi world')
+
+            # B replaces A, which is queued
+            self.assertEqual(await self.B.daemon.RequestName('org.example', 2), 1)
+            self.assertEqual((await changes.get()).body, ('org.example', self.A.name, self.B.name))
+            self.assertEqual(await D.GetNameOwner('org.example'), self.B.name)
+
+            self.assertEqual(await D.ReleaseName('org.other'), 2) # non-existent
+            self.assertEqual(await self.B.daemon.ReleaseName('org.example'), 1)
+            self.assertEqual((await changes.get()).body, ('org.example', self.B.name, self.A.name))
+
+            # disconnect releases
+            await self.A.close()
+            self.assertEqual((await changes.get()).body, ('org.example', self.A.name, ''))
+            self.assertFalse(await self.B.daemon.NameHasOwner('org.example'))
+
+        with self.assertRaises(RemoteError) as E:
+            await self.B.daemon.RequestName(':1.99', 0)
+        self.assertEqual(E.exception.name, 'org.freedesktop.DBus.Error.InvalidArgs')
+
+    @inloop
+    async def test_signals(self):
+        obj = Echo()
+        self.A.attach(obj, path='/echo')
+        Q = asyncio.Queue()
+        S = await self.B.subscribe(Q.put_nowait, interface='foo.bar', member='Tick', arg0='yes')
+        try:
+            obj.Tick('no')
+            obj.Tick('yes')
+            evt = await Q.get()
+            self.assertEqual((evt.body, evt.sender, evt.path), ('yes', self.A.name, '/echo'))
+
+            # unicast needs no match
+            self.A.signal(destination=self.B.name, path='/x', interface='foo.bar', member='Tick', sig='s', body='yes')
+            self.assertEqual((await Q.get()).path, '/x')
+        finally:
+            await S.close()
+        self.assertEqual(self.broker._clients[self.B.name].rules, {})
+
+    @inloop
+    async def test_sender(self):
+        'A sender field set by the client is replaced'
+        calls, Q = [], asyncio.Queue()
+        self.A.attach_raw(calls.append, path='/raw')
+        S = await self.A.subscribe(Q.put_nowait, interface='foo.bar', member='Tick')
+        P = self.B._proto
+        prepare_call, prepare_signal = P.prepare_call, P.prepare_signal
+        def spoof(prepare):
+            def fn(**kws):
+                msg = prepare(**kws)
+                msg.opts.insert(0, (7, ':1.99'))
+                return msg
+            return fn
+        P.prepare_call, P.prepare_signal = spoof(prepare_call), spoof(prepare_signal)
+        try:
+            self.assertIsNone(await self.B.call(destination=self.A.name, path='/raw', interface='foo.bar',
+                                                member='Nothing'))
+            self.assertEqual(calls[0].sender, self.B.name)
+
+            self.B.signal(destination=self.A.name, path='/x', interface='foo.bar', member='Tick', sig='s', body='yes')
+            evt = await Q.get()
+            self.assertEqual((evt.sender, evt.body), (self.B.name, 'yes'))
+        finally:
+            P.prepare_call, P.prepare_signal = prepare_call, prepare_signal
+            self.A.detach_raw('/raw')
+            await S.close()
+
+    @inloop
+    async def test_invalid(self):
+        'A client sending an undecodable body is disconnected, without an error escaping'
+        errors, connected = [], self.broker._connected
+        async def check(*args):
+            try:
+                await connected(*args)
+            except BaseException as e:
+                errors.append(e)
+                raise
+        self.broker._connected = check
+        C = await connect_bus([self.broker.info])
+        name = C.name
+        try:
+            # AddMatch, with a string which is not utf-8
+            with self.assertRaises(NoReplyError):
+                await C.call_raw(destination=DBUS, path=DBUS_PATH, interface=DBUS, member='AddMatch',
+                                 sig='s', body=b'\x02\x00\x00\x00\xff\xfe\x00', lsb=True)
+        finally:
+            await C.close()
+        self.assertNotIn(name, self.broker._clients)
+        self.assertEqual(errors, [])
+        self.assertEqual(await self.A.daemon.NameHasOwner(name), False)
+
+    @inloop
+    async def test_unix_fd(self):
+        C = await connect_bus([self.broker.info], unix_fd=True)
+        try:
+            self.assertTrue(C.unix_fd)
+            C.attach(Echo(), path='/echo')
+            with sealed_memfd(b'x'*100) as fd:
+                self.assertEqual(await self.A.call(destination=C.name, path='/echo', interface='foo.bar',
+                                                   member='Size', sig='h', body=fd), 100)
+                with self.assertRaises(RemoteError) as E:
+                    await self.A.call(destination=self.B.name, path='/echo', interface='foo.bar',
+                                      member='Size', sig='h', body=fd)
+                self.assertEqual(E.exception.name, 'org.freedesktop.DBus.Error.NotSupported')
+        finally:
+            await C.close()
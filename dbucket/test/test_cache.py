@@ -0,0 +1,105 @@
+import unittest, logging
+_log = logging.getLogger(__name__)
+
+import asyncio
+
+from ..conn import RemoteError
+from ..auth import connect_bus
+from ..proxy import Interface, Method
+from .util import inloop, test_bus_info
+
+class TestCache(unittest.TestCase):
+    timeout = 2.0
+    servname = 'foo.bar'
+
+    @Interface(servname)
+    class Counter(object):
+        def __init__(self):
+            self.calls = 0
+        @Method()
+        async def Get(self, s:str) -> str:
+            self.calls += 1
+            N = self.calls
+            await asyncio.sleep(0.01)
+            if s=='fail':
+                raise RemoteError('oops', name='foo.bar.Oops')
+            return '%s%d'%(s, N)
+
+    @inloop
+    async def setUp(self):
+        self.client = await connect_bus(test_bus_info())
+        self.server = await connect_bus(test_bus_info())
+        self.serverobj = self.Counter()
+        self.server.attach(self.serverobj, path='/counter')
+        self.assertEqual(await self.server.daemon.RequestName(self.servname, 4), 1)
+        self.cache = self.client.enable_cache(ttl=10.0, max_entries=2)
+
+    @inloop
+    async def tearDown(self):
+        await self.cache.close()
+        await asyncio.gather(self.client.close(), self.server.close())
+
+    def get(self, s):
+        return self.cache.call(destination=self.servname, path='/counter', interface=self.servname,
+                               member='Get', sig='s', body=s)
+
+    @inloop
+    async def test_single_flight(self):
+        ret = await asyncio.gather(*[self.get('a') for i in range(5)])
+        self.assertEqual(ret, ['a1']*5)
+        self.assertEqual((self.cache.misses, self.cache.shared), (1, 4))
+
+        # not marked, so not cached
+        self.assertEqual(await self.get('a'), 'a2')
+
+        ret = await asyncio.gather(*[self.get('fail') for i in range(2)], return_exceptions=True)
+        self.assertEqual([E.name for E in ret], ['foo.bar.Oops']*2)
+        self.assertEqual(self.serverobj.calls, 3)
+
+    @inloop
+    async def test_ttl(self):
+        self.cache.mark(self.servname, 'Get')
+        self.assertEqual(await self.get('a'), 'a1')
+        self.assertEqual(await self.get('a'), 'a1')
+        self.assertEqual(self.cache.hits, 1)
+
+        # LRU eviction of 'a'
+        self.assertEqual(await self.get('b'), 'b2')
+        self.assertEqual(await self.get('c'), 'c3')
+        self.assertEqual(await self.get('a'), 'a4')
+
+        self.cache.mark(self.servname, 'Get', ttl=0.01)
+        self.assertEqual(await self.get('d'), 'd5')
+        await asyncio.sleep(0.02)
+        self.assertEqual(await self.get('d'), 'd6')
+
+    @inloop
+    async def test_owner_change(self):
+        self.cache.mark(self.servname, 'Get')
+        self.assertEqual(await self.get('a'), 'a1')
+
+        await self.server.daemon.ReleaseName(self.servname)
+        for i in range(100):
+            if not self.cache._entries:
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual(len(self.cache._entries), 0)
+
+    @inloop
+    async def test_invalidate_inprog(self):
+        'A result in progress when all are invalidated is not kept'
+        self.cache.mark(self.servname, 'Get')
+        F = asyncio.ensure_future(self.get('a'))
+        await asyncio.sleep(0.005)
+        self.cache.invalidate()
+        self.assertEqual(await F, 'a1')
+        self.assertEqual(await self.get('a'), 'a2')
+
+    @inloop
+    async def test_proxy(self):
+        obj = await self.client.proxy(destination=self.servname, path='/counter', interface=self.servname)
+        self.assertEqual(await asyncio.gather(obj.Get('a'), obj.Get('a')), ['a1', 'a2'])
+
+        self.cache.mark(self.servname, 'Get')
+        self.assertEqual(await asyncio.gather(obj.Get('a'), obj.Get('a')), ['a3', 'a3'])
+        self.assertEqual(await obj.Get('a'), 'a3')
@@ -0,0 +1,133 @@
+import unittest, logging
+_log = logging.getLogger(__name__)
+
+import asyncio
+
+from ..conn import RemoteError
+from ..auth import connect_bus
+from ..proxy import Interface, Method
+from ..chunks import ChunkStream
+from .util import inloop, test_bus_info
+
+class TestChunks(unittest.TestCase):
+    timeout = 2.0
+
+    @Interface('foo.bar')
+    class Rows(object):
+        def __init__(self):
+            self.produced, self.closed = 0, False
+        @Method()
+        async def Count(self, n:int) -> str:
+            try:
+                for i in range(n):
+                    self.produced += 1
+                    yield str(i)
+            finally:
+                self.closed = True
+        @Method()
+        async def Pairs(self, n:'u') -> ('s', 'u'):
+            for i in range(n):
+                yield ('x'*i, i)
+        @Method()
+        async def Fail(self) -> str:
+            yield 'one'
+            raise RemoteError('oops', name='foo.bar.Oops')
+        @Method()
+        async def Big(self, n:'u', size:'u') -> 'ay':
+            for i in range(n):
+                yield bytes([i%256])*size
+        @Method()
+        async def BigFail(self, n:'u', size:'u') -> 'ay':
+            for i in range(n):
+                yield bytes([i%256])*size
+            raise RemoteError('oops', name='foo.bar.Oops')
+        @Method()
+        def Plain(self) -> 'i':
+            return 5
+
+    @inloop
+    async def setUp(self):
+        self.client = await connect_bus(test_bus_info())
+        self.server = await connect_bus(test_bus_info())
+        self.serverobj = self.Rows()
+        self.server.attach(self.serverobj, path='/rows')
+        self.obj = await self.client.proxy(destination=self.server.name, path='/rows',
+                                           interface='foo.bar')
+
+    @inloop
+    async def tearDown(self):
+        await asyncio.gather(self.client.close(), self.server.close())
+
+    @inloop
+    async def test_proxy(self):
+        S = self.obj.Count(100)
+        self.assertIsInstance(S, ChunkStream)
+        out = [R async for R in S]
+        self.assertEqual(out, [str(i) for i in range(100)])
+        self.assertTrue(self.serverobj.closed)
+        self.assertEqual(self.server._chunks.producers, {})
+        self.assertEqual(self.client._chunks.streams, {})
+
+        out = [R async for R in self.obj.Pairs(3)]
+        self.assertEqual(out, [('', 0), ('x', 1), ('xx', 2)])
+
+    @inloop
+    async def test_not_streaming(self):
+        'The integer result of a method which does not stream is not taken as a chunk count'
+        S = self.client.call_stream(destination=self.server.name, path='/rows', interface='foo.bar',
+                                    member='Plain')
+        self.assertEqual([R async for R in S], [])
+        self.assertEqual(self.client._chunks.streams, {})
+
+    @inloop
+    async def test_window(self):
+        'The producer runs at most one window ahead of the consumer'
+        S = self.client.call_stream(destination=self.server.name, path='/rows', interface='foo.bar',
+                                    member='Count', sig='i', body=1000, window=4)
+        self.assertEqual(await S.__anext__(), '0')
+        await asyncio.sleep(0.1)
+        self.assertLessEqual(self.serverobj.produced, 6)
+
+        out = [R async for R in S]
+        self.assertEqual(len(out), 999)
+
+    @inloop
+    async def test_congested(self):
+        'The reply, sent in the reply lane, may overtake chunks waiting in the signal lane'
+        S = self.client.call_stream(destination=self.server.name, path='/rows', interface='foo.bar',
+                                    member='Big', sig='uu', body=(40, 200000), window=16)
+        out = [R async for R in S]
+        self.assertGreater(self.server.send_stats['signal']['held'], 0)
+        self.assertEqual(len(out), 40)
+        self.assertEqual([R[0] for R in out], list(range(40)))
+        self.assertEqual(self.client._chunks.streams, {})
+
+        S = self.client.call_stream(destination=self.server.name, path='/rows', interface='foo.bar',
+                                    member='BigFail', sig='uu', body=(40, 200000), window=16)
+        out = []
+        with self.assertRaisesRegex(RemoteError, 'oops'):
+            async for R in S:
+                out.append(R)
+        self.assertEqual(len(out), 40)
+
+    @inloop
+    async def test_error(self):
+        S = self.client.call_stream(destination=self.server.name, path='/rows', interface='foo.bar',
+                                    member='Fail')
+        self.assertEqual(await S.__anext__(), 'one')
+        with self.assertRaisesRegex(RemoteError, 'oops'):
+            await S.__anext__()
+
+    @inloop
+    async def test_cancel(self):
+        async with self.obj.Count(10000) as S:
+            async for R in S:
+                if R=='2':
+                    break
+        for i in range(100):
+            if self.serverobj.closed:
+                break
+            await asyncio.sleep(0.01)
+        self.assertTrue(self.serverobj.closed)
+        self.assertLess(self.serverobj.produced, 100)
+        self.assertEqual(self.server._chunks.producers, {})
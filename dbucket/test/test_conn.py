@@ -0,0 +1,226 @@
+
+import unittest, asyncio
+
+from ..xcode import encode, Object, Signature, Variant
+from ..protocol import _HeaderTemplate, BusEvent
+from ..conn import Connection, MemoryBudget, RemoteError, SIGNAL, METHOD_CALL, METHOD_RETURN, ERROR
+from ..signal import Condition
+from .util import inloop
+
+class FakeTransport(object):
+    def __init__(self):
+        self.size = 0
+    def get_write_buffer_size(self):
+        return self.size
+    def set_write_buffer_limits(self, high=None, low=None):
+        pass
+
+class FakeWriter(object):
+    'Records the type of each message written'
+    def __init__(self, loop):
+        self.transport = FakeTransport()
+        self.sent = []
+        self.blens = []
+        self.resume = loop.create_future()
+    def writelines(self, S):
+        for i in range(0, len(S), 3):
+            self.sent.append(S[i][1])
+            self.blens.append(len(S[i+2]))
+        self.transport.size += sum(map(len, S))
+    async def drain(self):
+        await self.resume
+    def close(self):
+        pass
+
+class FakeReader(object):
+    def __init__(self, loop):
+        self.F = loop.create_future()
+    async def read(self, N):
+        await self.F # never completes
+
+class TestHeaderTemplate(unittest.TestCase):
+    'Patched header must match a fully encoded header'
+
+    def check(self, mtype, common, tail, blen, sn, lsb):
+        endian = ord(b'l') if lsb else ord(b'B')
+        expect = encode(b'yyyyuua(yv)', (endian, mtype, 0, 1,  blen, sn,  common+tail), lsb=lsb)
+        T = _HeaderTemplate(mtype, common, blen, lsb=lsb)
+        self.assertEqual(T.build(sn, tail), expect)
+
+    def test_signal(self):
+        common = [
+            (1, Object('/foo/bar')),
+            (2, 'foo.bar'),
+            (3, 'Testing'),
+            (8, Signature('s')),
+        ]
+        for lsb in (True, False):
+            for dest in (':1.1', ':1.42', ':1.1234', 'a.much.longer.name'):
+                self.check(SIGNAL, common, [(6, dest)], 12, 0x12345, lsb)
+
+    def test_return(self):
+        for lsb in (True, False):
+            for sn in (1, 300, 0xfffffff0):
+                self.check(METHOD_RETURN, [], [(5, Variant(b'u', sn)), (6, ':1.7')], 0, sn+1, lsb)
+
+class TestLanes(unittest.TestCase):
+    timeout = 1.0
+
+    @inloop
+    async def test_priority(self):
+        W = FakeWriter(self.loop)
+        conn = Connection(W, FakeReader(self.loop), {}, loop=self.loop)
+        try:
+            conn.send_hwm = 100
+
+            # fill the transport buffer
+            while W.transport.size<=conn.send_hwm:
+                conn.signal(path='/x', interface='foo.bar', member='Bulk')
+            nsent = len(W.sent)
+
+            # now held in lanes
+            for i in range(3):
+                conn.signal(path='/x', interface='foo.bar', member='Bulk')
+            written = conn._lane_written('signal')
+            conn.signal(path='/x', interface='foo.bar', member='Bulk') # not waited for
+            conn._method_return(BusEvent.build(METHOD_CALL, 42, sender=':1.2'), None, None)
+            self.assertEqual(len(W.sent), nsent)
+            self.assertFalse(written.done())
+
+            S = conn.send_stats
+            self.assertEqual(S['signal']['queued'], 4)
+            self.assertEqual(S['reply']['queued'], 1)
+            self.assertEqual(S['reply']['held'], 1)
+
+            # transport drained
+            W.transport.size = 0
+            W.resume.set_result(None)
+            await asyncio.sleep(0.01)
+
+            self.assertEqual(W.sent[nsent:], [METHOD_RETURN, SIGNAL, SIGNAL, SIGNAL, SIGNAL])
+            self.assertTrue(written.done())
+            self.assertTrue(conn._lane_written('signal').done())
+
+            S = conn.send_stats
+            self.assertEqual(S['signal'], {'sent':nsent+4, 'held':4, 'queued':0})
+            self.assertEqual(S['reply'], {'sent':1, 'held':1, 'queued':0})
+        finally:
+            await conn.close()
+
+class TestOffload(unittest.TestCase):
+    timeout = 1.0
+
+    @inloop
+    async def test_order(self):
+        W = FakeWriter(self.loop)
+        conn = Connection(W, FakeReader(self.loop), {}, loop=self.loop)
+        try:
+            conn.offload_size = 100
+
+            conn.signal(path='/x', interface='foo.bar', member='Big', sig='ai', body=list(range(1000)))
+            conn.signal(path='/x', interface='foo.bar', member='Small', sig='i', body=1)
+
+            # small message waits for the big one
+            self.assertEqual(W.blens, [])
+
+            while len(W.blens)<2:
+                await asyncio.sleep(0.01)
+
+            self.assertEqual(W.blens, [4+4*1000, 4])
+        finally:
+            await conn.close()
+
+def _signal_msg(sn, body='hello'):
+    if isinstance(body, bytes):
+        # pre-encoded, possibly invalid, string
+        body = encode(b'u', len(body), lsb=True)+body+b'\0'
+    else:
+        body = encode(b's', body, lsb=True)
+    header = encode(b'yyyyuua(yv)', (ord(b'l'), SIGNAL, 0, 1, len(body), sn, [
+        (1, Object('/x')),
+        (2, 'foo.bar'),
+        (3, 'Sig'),
+        (7, ':1.5'),
+        (8, Signature('s')),
+    ]), lsb=True)
+    return header+b'\0'*(-len(header)%8)+body
+
+class TestBudget(unittest.TestCase):
+    timeout = 1.0
+
+    @inloop
+    async def test_reject_call(self):
+        W = FakeWriter(self.loop)
+        conn = Connection(W, FakeReader(self.loop), {}, loop=self.loop,
+                          budget=MemoryBudget(1000, call_cost=100))
+        try:
+            self.assertEqual(conn.memory()['total'], 0)
+            F = conn.call(path='/x', member='Foo')
+            self.assertEqual(conn.memory()['inprog'], 100)
+            self.assertEqual(conn.memory()['total'], 100+W.transport.size)
+
+            W.transport.size = 2000
+            F = conn.call(path='/x', member='Foo')
+            with self.assertRaises(RemoteError) as ctxt:
+                await F
+            self.assertEqual(ctxt.exception.name, 'org.freedesktop.DBus.Error.LimitsExceeded')
+            self.assertEqual(conn._budget.rejected, 1)
+        finally:
+            await conn.close()
+
+    @inloop
+    async def test_shed_signals(self):
+        W = FakeWriter(self.loop)
+        R = asyncio.StreamReader()
+        conn = Connection(W, R, {}, loop=self.loop, budget=MemoryBudget(1000))
+        try:
+            Q = conn.new_queue(qsize=10)
+            Q._cond.append(Condition(remove=False, member='Sig'))
+
+            R.feed_data(_signal_msg(1, 'one'))
+            evt, sts = await Q.recv()
+            self.assertEqual((evt.body, sts), ('one', Q.NORMAL))
+            self.assertEqual(Q._held, 0)
+
+            W.transport.size = 2000 # over budget
+            # dropped without decoding, so an invalid body goes unnoticed
+            R.feed_data(_signal_msg(2, b'\xff\xfe'))
+            await asyncio.sleep(0.01)
+            self.assertTrue(Q.empty())
+            self.assertEqual(Q.overflows, 1)
+            self.assertEqual(conn._budget.shed, 1)
+
+            W.transport.size = 0
+            R.feed_data(_signal_msg(3, 'three'))
+            await asyncio.sleep(0.01)
+            self.assertGreater(Q._held, 0)
+            self.assertEqual(conn.memory()['signals'], Q._held)
+            evt, sts = await Q.recv()
+            self.assertEqual((evt.body, sts), ('three', Q.OFLOW))
+            self.assertEqual(conn.memory()['signals'], 0)
+        finally:
+            await conn.close()
+
+    @inloop
+    async def test_reply_limits(self):
+        W = FakeWriter(self.loop)
+        R = asyncio.StreamReader()
+        conn = Connection(W, R, {}, loop=self.loop, budget=MemoryBudget(1000))
+        try:
+            W.transport.size = 2000 # over budget
+            R.feed_data(_call_msg(1, flags=1)) # NO_REPLY_EXPECTED
+            R.feed_data(_call_msg(2))
+            await asyncio.sleep(0.01)
+            self.assertEqual(W.sent, [ERROR])
+            self.assertEqual(conn._budget.replied, 1)
+        finally:
+            await conn.close()
+
+def _call_msg(sn, flags=0):
+    header = encode(b'yyyyuua(yv)', (ord(b'l'), METHOD_CALL, flags, 1, 0, sn, [
+        (1, Object('/x')),
+        (2, 'foo.bar'),
+        (3, 'Meth'),
+        (7, ':1.5'),
+    ]), lsb=True)
+    return header+b'\0'*(-len(header)%8)
@@ -1,9 +1,9 @@
 import unittest, logging
 _log = logging.getLogger(__name__)
 
-import asyncio, functools, os, sys
+import functools, os, sys, gc
 
-from ..conn import DBUS, DBUS_PATH, INTROSPECTABLE, RemoteError
+from ..conn import Connection, DBUS, DBUS_PATH, INTROSPECTABLE, UnknownObject, RemoteError
 from ..auth import connect_bus
 from ..proxy import SimpleProxy, createProxy
 from .util import inloop, test_bus, test_bus_info
@@ -13,9 +13,8 @@ class TestDBus(unittest.TestCase):
     timeout = 1.0
 
     @inloop
-    @asyncio.coroutine
-    def setUp(self):
-        self.conn = yield from connect_bus(test_bus_info(), loop=self.loop)
+    async def setUp(self):
+        self.conn = await connect_bus(test_bus_info())
         # proxy for dbus daemon
         self.obj = SimpleProxy(self.conn,
                                name=DBUS,
@@ -24,64 +23,98 @@ class TestDBus(unittest.TestCase):
         )
 
     @inloop
-    @asyncio.coroutine
-    def tearDown(self):
-        yield from self.conn.close()
+    async def tearDown(self):
+        await self.conn.close()
 
     def test_Hello(self):
         self.assertIsNotNone(self.conn.name)
         self.assertEqual(self.conn.name[0], ':')
 
     @inloop
-    @asyncio.coroutine
-    def test_ListNames(self):
-        names = yield from self.conn.daemon.ListNames()
+    async def test_context(self):
+        async with await connect_bus(test_bus_info()) as conn:
+            self.assertTrue(conn.running)
+            names = await conn.daemon.ListNames()
+            self.assertIn(conn.name, names)
+        self.assertFalse(conn.running)
+
+    @inloop
+    async def test_lightweight(self):
+        'Daemon proxy class is shared, and dispatch tree created on demand'
+        async with await connect_bus(test_bus_info()) as conn:
+            self.assertIsNotNone(conn.guid)
+            self.assertEqual(conn.guid, self.conn.guid)
+            self.assertIs(conn.daemon.__class__, self.conn.daemon.__class__)
+            self.assertIsNone(conn._methods)
+
+            try:
+                await self.conn.call(destination=conn.name, path='/',
+                                     interface=INTROSPECTABLE, member='Introspect')
+                self.fail('Unexpected success')
+            except RemoteError as e:
+                self.assertEqual(e.name, UnknownObject)
+
+            # NameAcquired handled without a task
+            self.assertIn(conn.name, conn.names)
+
+    @inloop
+    async def test_proxy_class_released(self):
+        'Shared daemon proxy class is forgotten once no connection uses it'
+        guid = self.conn.guid
+        self.assertIn(guid, Connection._daemon_proxies)
+        await self.conn.close()
+        self.conn.daemon = self.obj = None
+        gc.collect()
+        self.assertNotIn(guid, Connection._daemon_proxies)
+
+    @inloop
+    async def test_ListNames(self):
+        names = await self.conn.daemon.ListNames()
         # list should include me
         self.assertIn(self.conn.name, names)
         # list should include the daemon
         self.assertIn(DBUS, names)
 
     @inloop
-    @asyncio.coroutine
-    def test_RequestName(self):
+    async def test_RequestName(self):
         """Request a well known name on the bus
         """
         myname = 'foo.bar'
 
-        ACQ =     yield from self.conn.daemon.NameAcquired.connect()
-        LOST =    yield from self.conn.daemon.NameLost.connect()
-        CHANGED = yield from self.conn.daemon.NameOwnerChanged.connect()
+        ACQ =     await self.conn.daemon.NameAcquired.connect()
+        LOST =    await self.conn.daemon.NameLost.connect()
+        CHANGED = await self.conn.daemon.NameOwnerChanged.connect()
 
-        ret = yield from self.conn.daemon.RequestName(myname, 4) # Don't Queue
+        ret = await self.conn.daemon.RequestName(myname, 4) # Don't Queue
 
-        evt, sts = yield from ACQ.recv()
+        evt, sts = await ACQ.recv()
         self.assertEqual(evt.body, myname)
 
-        evt, sts = yield from CHANGED.recv()
+        evt, sts = await CHANGED.recv()
         thename, prev, cur = evt.body
         self.assertEqual(thename, myname)
         self.assertEqual(prev, '') # no previous owner
         self.assertEqual(cur, self.conn.name)
 
-        names = yield from self.conn.daemon.ListNames()
+        names = await self.conn.daemon.ListNames()
         # list should include me
         self.assertIn(self.conn.name, names)
         self.assertIn(myname, names)
 
-        ret = yield from self.conn.daemon.ListNames()
-        ret = yield from self.conn.daemon.ReleaseName(myname)
+        ret = await self.conn.daemon.ListNames()
+        ret = await self.conn.daemon.ReleaseName(myname)
         self.assertEqual(ret, 1) # Released
 
-        evt, sts = yield from LOST.recv()
+        evt, sts = await LOST.recv()
         self.assertEqual(evt.body, myname)
 
-        evt, sts = yield from CHANGED.recv()
+        evt, sts = await CHANGED.recv()
         thename, prev, cur = evt.body
         self.assertEqual(thename, myname)
         self.assertEqual(prev, self.conn.name)
         self.assertEqual(cur, '') # no owner
 
-        names = yield from self.conn.daemon.ListNames()
+        names = await self.conn.daemon.ListNames()
         # list should include me
         self.assertIn(self.conn.name, names)
         self.assertNotIn(myname, names)
@@ -90,15 +123,14 @@ class TestDBus(unittest.TestCase):
         self.assertTrue(LOST._Q.empty())
         self.assertTrue(CHANGED._Q.empty())
 
-        yield from ACQ.close()
-        yield from LOST.close()
-        yield from CHANGED.close()
+        await ACQ.close()
+        await LOST.close()
+        await CHANGED.close()
 
     @inloop
-    @asyncio.coroutine
-    def test_badmethod(self):
+    async def test_badmethod(self):
         try:
-            yield from self.obj.call(member='InvalidMethodName')
+            await self.obj.call(member='InvalidMethodName')
             self.fail('Unexpected success')
         except RemoteError as e:
             self.assertRegex(str(e), 'InvalidMethodName')
@@ -109,9 +141,8 @@ class TestDBus(unittest.TestCase):
             self.fail("Unexpected exception type")
 
     @inloop
-    @asyncio.coroutine
-    def test_introspect(self):
-        msg = yield from self.conn.call(
+    async def test_introspect(self):
+        msg = await self.conn.call(
                                destination=DBUS,
                                interface=INTROSPECTABLE,
                                path=DBUS_PATH,
@@ -123,31 +154,29 @@ class TestDBus(unittest.TestCase):
         self.assertEqual(root.tag, 'node')
 
     @inloop
-    @asyncio.coroutine
-    def test_cred(self):
+    async def test_cred(self):
         if hasattr(self.conn.daemon, 'GetConnectionCredentials'):
             # GetConnectionCredentials added in dbus 1.7
             # also tests dict decode
-            info = yield from self.conn.daemon.GetConnectionCredentials(self.conn.name)
+            info = await self.conn.daemon.GetConnectionCredentials(self.conn.name)
         elif sys.platform in ('linux',):
             info = {}
-            info['UnixUserID'] = (yield from self.conn.daemon.GetConnectionUnixUser(self.conn.name))
-            info['ProcessID'] = (yield from self.conn.daemon.GetConnectionUnixProcessID(self.conn.name))
+            info['UnixUserID'] = (await self.conn.daemon.GetConnectionUnixUser(self.conn.name))
+            info['ProcessID'] = (await self.conn.daemon.GetConnectionUnixProcessID(self.conn.name))
 
         if sys.platform in ('linux',):
             self.assertEqual(info['UnixUserID'], os.getuid())
             self.assertEqual(info['ProcessID'], os.getpid())
 
     @inloop
-    @asyncio.coroutine
-    def test_isolation(self):
+    async def test_isolation(self):
         """Try to detect if we are connected to the real session daemon,
         which would violate our testing isolation.
         
         The only well-known name should be the daemon
         """
 
-        names = yield from self.conn.daemon.ListNames()
+        names = await self.conn.daemon.ListNames()
 
         for N in names:
             unique = N[0]==':'
@@ -156,27 +185,25 @@ class TestDBus(unittest.TestCase):
             self.assertTrue(unique or dbus, N)
 
     @inloop
-    @asyncio.coroutine
-    def test_wait_for_disconnect(self):
+    async def test_wait_for_disconnect(self):
 
         test_bus().stop()
         try:
-            yield from self.conn._lost
+            await self.conn._lost
             self.assertFalse(self.conn.running)
         finally:
             test_bus().start()
 
     @inloop
-    @asyncio.coroutine
-    def test_call_after_restart(self):
-        initial = yield from self.conn.daemon.GetId()
+    async def test_call_after_restart(self):
+        initial = await self.conn.daemon.GetId()
         self.assertNotEqual(initial, '')
 
         _log.debug("Force close")
-        yield from test_bus().restart()
+        await test_bus().restart()
 
         try:
-            after = yield from self.conn.daemon.GetId()
+            after = await self.conn.daemon.GetId()
         except RemoteError as e:
             _log.debug("XX %s", e.name)
             self.assertRegex(e.name, 'NoReply')
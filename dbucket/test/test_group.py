@@ -0,0 +1,78 @@
+import unittest, logging
+_log = logging.getLogger(__name__)
+
+import asyncio, threading
+
+from ..auth import connect_bus
+from ..proxy import Interface, Method, Signal
+from ..group import ConnectionGroup
+from .util import inloop, test_bus_info
+
+class TestGroup(unittest.TestCase):
+    timeout = 5.0
+
+    @Interface('foo.bar')
+    class Echo(object):
+        @Method()
+        def Echo(self, i:int) -> int:
+            return i
+        @Signal()
+        def Tick(self, i:int):
+            pass
+
+    @inloop
+    async def setUp(self):
+        self.server = await connect_bus(test_bus_info())
+        self.obj = self.Echo()
+        self.server.attach(self.obj, path='/echo')
+        self.G = ConnectionGroup(test_bus_info(), 3)
+        await self.loop.run_in_executor(None, self.G.start)
+
+    @inloop
+    async def tearDown(self):
+        await self.loop.run_in_executor(None, self.G.close)
+        await self.server.close()
+
+    def test_shard(self):
+        self.assertEqual(self.G.shard('foo.bar'), self.G.shard('foo.bar'))
+        self.assertEqual({self.G.shard('n%d'%i) for i in range(100)}, {0, 1, 2})
+        self.assertIs(self.G.connection('x'), self.G.connections[self.G.shard('x')])
+        self.assertEqual(len({C.name for C in self.G.connections}), 3)
+
+    @inloop
+    async def test_call(self):
+        ret = await asyncio.gather(*[self.G.acall(key=i, destination=self.server.name, path='/echo',
+                                                  interface='foo.bar', member='Echo', sig='i', body=i)
+                                     for i in range(100)])
+        self.assertEqual(ret, list(range(100)))
+
+        # blocking, from another thread
+        F = self.G.call(destination=self.server.name, path='/echo', interface='foo.bar', member='Echo',
+                        sig='i', body=42)
+        self.assertEqual(await self.loop.run_in_executor(None, F.result), 42)
+
+        F = self.G.call(destination=self.server.name, path='/echo', interface='foo.bar', member='Nope')
+        with self.assertRaisesRegex(Exception, 'Unknown method'):
+            await asyncio.wrap_future(F)
+
+    @inloop
+    async def test_submit(self):
+        F = self.G.submit('x', lambda conn: (conn.name, threading.current_thread().name))
+        name, thread = await asyncio.wrap_future(F)
+        self.assertEqual(name, self.G.connection('x').name)
+        self.assertEqual(thread, 'dbucket-%d'%self.G.shard('x'))
+
+    @inloop
+    async def test_subscribe(self):
+        seen = []
+        got = threading.Event()
+        def cb(evt):
+            seen.append((evt.body, threading.current_thread().name))
+            got.set()
+        S = await asyncio.wrap_future(self.G.subscribe('ticks', cb, interface='foo.bar', member='Tick'))
+
+        self.obj.Tick(5)
+        self.assertTrue(await self.loop.run_in_executor(None, got.wait, 2.0))
+        self.assertEqual(seen, [(5, 'dbucket-%d'%self.G.shard('ticks'))])
+
+        await asyncio.wrap_future(self.G.submit('ticks', lambda conn: S.close()))
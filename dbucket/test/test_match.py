@@ -3,11 +3,11 @@ log = logging.getLogger(__name__)
 import unittest
 import asyncio
 from collections import defaultdict
-asyncio.get_event_loop().set_debug(True)
 
 from .util import inloop
-from ..signal import SignalQueue, Condition
-from ..conn import BusEvent, SIGNAL, ConnectionClosed
+from ..signal import SignalQueue, Subscription, Condition
+from ..conn import SIGNAL, ConnectionClosed
+from ..protocol import BusEvent
 
 class FakeConnection(object):
     log = logging.getLogger(__name__+'.FakeConnection')
@@ -15,12 +15,11 @@ class FakeConnection(object):
         self._loop = loop
         self.matches = defaultdict(set)
         self.Qs = []
-    @asyncio.coroutine
-    def AddMatch(self, obj, expr):
+        self._signal_held = 0
+    async def AddMatch(self, obj, expr):
         log.debug('AddMatch %s %s -> %s', obj, expr, self.matches)
         self.matches[expr].add(obj)
-    @asyncio.coroutine
-    def RemoveMatch(self, obj, expr):
+    async def RemoveMatch(self, obj, expr):
         log.debug('RemoveMatch %s %s <- %s', obj, expr, self.matches)
         L = self.matches[expr]
         L.remove(obj)
@@ -91,6 +90,18 @@ class TestCond(unittest.TestCase):
         self.assertTrue(cond.test(self.evt2))
         self.assertFalse(cond.test(self.evt3))
 
+    def test_arg0(self):
+        cond = Condition(member='member', arg0='foo')
+        # undecided until the body is decoded
+        self.assertIsNone(cond.test(self.evt1, decoded=False))
+        self.assertFalse(cond.test(self.evt3, decoded=False))
+
+        evt = BusEvent(SIGNAL, 1, [(1, '/path'), (3, 'member')], None)
+        evt.body = ('foo', 'bar')
+        self.assertTrue(cond.test(evt))
+        evt.body = ('bar', 'foo')
+        self.assertFalse(cond.test(evt))
+
 class TestQueue(unittest.TestCase):
     evt1 = BusEvent(SIGNAL, 1, [
         (1, '/path'),
@@ -101,8 +112,7 @@ class TestQueue(unittest.TestCase):
     ], None)
 
     @inloop
-    @asyncio.coroutine
-    def setUp(self):
+    async def setUp(self):
         self.conn = FakeConnection(self.loop)
         self.Q = SignalQueue(self.conn, qsize=2)
         self.conn.Qs.append(self.Q)
@@ -111,15 +121,14 @@ class TestQueue(unittest.TestCase):
         self.assertDictEqual(self.conn.matches, {})
 
     @inloop
-    @asyncio.coroutine
-    def test_Q(self):
+    async def test_Q(self):
         self.Q._emit(self.evt1)
 
         self.assertTrue(self.Q.empty())
         self.assertFalse(self.Q.full())
         self.assertEqual(self.Q.qsize(), 0)
 
-        C = yield from self.Q.add() # wildcard
+        C = await self.Q.add() # wildcard
         try:
 
             self.Q._emit(self.evt1)
@@ -138,21 +147,19 @@ class TestQueue(unittest.TestCase):
 
             self.assertRaises(asyncio.QueueEmpty, self.Q.poll)
         finally:
-            yield from self.Q.remove(C)
+            await self.Q.remove(C)
 
     @inloop
-    @asyncio.coroutine
-    def test_match(self):
-        C = yield from self.Q.add(member='test')
+    async def test_match(self):
+        C = await self.Q.add(member='test')
         try:
             self.assertIn("member='test'", self.conn.matches)
         finally:
-            yield from self.Q.remove(C)
+            await self.Q.remove(C)
 
     @inloop
-    @asyncio.coroutine
-    def test_oflow(self):
-        C = yield from self.Q.add()
+    async def test_oflow(self):
+        C = await self.Q.add()
         try:
 
             self.Q._emit(self.evt1)
@@ -177,18 +184,17 @@ class TestQueue(unittest.TestCase):
             self.assertTrue(self.Q.empty())
 
         finally:
-            yield from self.Q.remove(C)
+            await self.Q.remove(C)
 
     @inloop
-    @asyncio.coroutine
-    def test_close(self):
-        C = yield from self.Q.add()
+    async def test_close(self):
+        C = await self.Q.add()
         try:
             self.Q._emit(self.evt1)
 
             self.assertEqual(self.Q._done, 0)
 
-            yield from self.Q.close()
+            await self.Q.close()
 
             self.assertEqual(self.Q._done, 1)
 
@@ -206,5 +212,69 @@ class TestQueue(unittest.TestCase):
             self.assertIs(evt, None)
             self.assertEqual(sts, self.Q.DONE)
 
+            self.assertRaises(ConnectionClosed, self.Q.poll)
+
+        finally:
+            await self.Q.remove(C)
+
+    @inloop
+    async def test_iter(self):
+        async with self.Q as Q:
+            self.assertIs(Q, self.Q)
+            await Q.add()
+            Q._emit(self.evt1)
+            self.assertIn("", self.conn.matches)
+
+        # close()d on exit, but queued events still delivered
+        self.assertDictEqual(self.conn.matches, {})
+
+        events = []
+        async for evt, sts in self.Q:
+            self.assertEqual(sts, self.Q.NORMAL)
+            events.append(evt)
+        self.assertListEqual(events, [self.evt1])
+
+        async for evt, sts in self.Q:
+            self.fail("Iteration after DONE")
+
+class TestSubscription(unittest.TestCase):
+    evt1 = TestQueue.evt1
+
+    @inloop
+    async def setUp(self):
+        self.conn = FakeConnection(self.loop)
+        self.events = []
+        self.S = Subscription(self.conn, self.events.append)
+        self.conn.Qs.append(self.S)
+
+    def tearDown(self):
+        self.assertDictEqual(self.conn.matches, {})
+
+    @inloop
+    async def test_callback(self):
+        self.assertFalse(self.S._emit(self.evt1))
+        self.assertEqual(self.events, [])
+
+        await self.S.add(member='member')
+        self.assertIn("member='member'", self.conn.matches)
+
+        self.assertTrue(self.S._emit(self.evt1))
+        self.assertEqual(self.events, [self.evt1])
+
+        await self.S.close()
+        self.assertNotIn(self.S, self.conn.Qs)
+
+        self.assertFalse(self.S._emit(self.evt1))
+        self.assertEqual(self.events, [self.evt1])
+
+    @inloop
+    async def test_error(self):
+        def oops(evt):
+            raise RuntimeError("oops")
+        self.S._cb = oops
+        C = await self.S.add()
+        try:
+            # errors are logged, and the signal still counted as consumed
+            self.assertTrue(self.S._emit(self.evt1))
         finally:
-            yield from self.Q.remove(C)
+            await self.S.remove(C)
@@ -0,0 +1,66 @@
+import unittest, asyncio, time
+
+from ..conn import METHOD_CALL
+from ..protocol import BusEvent
+from ..monitor import LoopMonitor
+from .util import inloop
+
+class FakeConnection(object):
+    def __init__(self):
+        self.tracers = []
+    def add_tracer(self, **kws):
+        self.tracers.append(kws)
+        return kws
+    def remove_tracer(self, T):
+        self.tracers.remove(T)
+
+class TestMonitor(unittest.TestCase):
+    timeout = 2.0
+
+    @inloop
+    async def test_slow_handler(self):
+        conn = FakeConnection()
+        M = LoopMonitor(threshold=0.05, interval=0.01, loop=self.loop)
+        M.start()
+        try:
+            M.watch(conn)
+            T = conn.tracers[0]
+            evt = BusEvent.build(METHOD_CALL, 1, path='/foo', interface='foo.bar', member='Slow')
+
+            await asyncio.sleep(0.02)
+
+            T0 = time.time()
+            time.sleep(0.2) # a blocking handler
+            T['on_dispatch_done'](conn, evt, T0, time.time())
+
+            await asyncio.sleep(0.03)
+        finally:
+            M.stop()
+        self.assertEqual(conn.tracers, [])
+
+        R = [R for R in M.reports if R.kind=='method_call']
+        self.assertEqual(len(R), 1)
+        self.assertEqual((R[0].interface, R[0].member, R[0].path), ('foo.bar', 'Slow', '/foo'))
+        self.assertGreaterEqual(R[0].duration, 0.2)
+        # watchdog sampled the stack of this test
+        self.assertRegex(R[0].stack, 'test_slow_handler')
+        # stall not reported twice
+        self.assertEqual([R for R in M.reports if R.kind=='stall'], [])
+        self.assertGreaterEqual(M.snapshot()['lag_max'], 0.15)
+
+    @inloop
+    async def test_slow_consumer(self):
+        class Queue(object):
+            monitor = None
+            def __repr__(self):
+                return 'Queue(test)'
+        Q = Queue()
+        M = LoopMonitor(threshold=0.05, loop=self.loop)
+        M.watch_queue(Q)
+        M._consumer_got(Q)
+        await asyncio.sleep(0.1) # consumer busy elsewhere
+        M._consumer_next(Q)
+
+        R, = M.reports
+        self.assertEqual((R.kind, R.consumer), ('consumer', 'Queue(test)'))
+        self.assertEqual((R.interface, R.member, R.path), (None, None, None))
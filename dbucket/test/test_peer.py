@@ -9,6 +9,8 @@ from ..conn import DBUS, DBUS_PATH, RemoteError
 from ..signal import SignalQueue
 from ..auth import connect_bus
 from ..proxy import Interface, Method, Signal
+from ..protocol import RawBody
+from ..xcode import encode, Variant
 from .util import inloop, test_bus_info
 
 class TestPeer(unittest.TestCase):
@@ -24,49 +26,44 @@ class TestPeer(unittest.TestCase):
         def Echo(self, s:str) -> str:
             return s+' world'
         @Method()
-        @asyncio.coroutine
-        def DelayEcho(self, s:str) -> str:
+        async def DelayEcho(self, s:str) -> str:
             return s+' is a test'
         @Signal()
         def Testing(self, s:str):
             pass
 
     @inloop
-    @asyncio.coroutine
-    def setUp(self):
-        self.client = yield from connect_bus(test_bus_info(), loop=self.loop)
-        self.server = yield from connect_bus(test_bus_info(), loop=self.loop)
+    async def setUp(self):
+        self.client = await connect_bus(test_bus_info())
+        self.server = await connect_bus(test_bus_info())
         self.server.debug_net = True
         try:
             self.serverobj = self.Foo()
             self.server.attach(self.serverobj, path=self.servpath)
 
-            ret = yield from self.server.daemon.RequestName(self.servname, 4) # don't queue
+            ret = await self.server.daemon.RequestName(self.servname, 4) # don't queue
             self.assertEqual(ret, 1) # now primary owner
 
-            self.obj = yield from self.client.proxy(
+            self.obj = await self.client.proxy(
                 destination=self.servname,
                 interface=self.servname,
                 path=self.servpath,
             )
         except:
-            yield from asyncio.gather(self.client.close(),
+            await asyncio.gather(self.client.close(),
                                     self.server.close())
             raise
 
     @inloop
-    @asyncio.coroutine
-    def tearDown(self):
+    async def tearDown(self):
         self.server.detach(self.servpath)
-        yield from asyncio.gather(self.client.close(),
-                                  self.server.close(),
-                                  loop=self.loop)
+        await asyncio.gather(self.client.close(),
+                             self.server.close())
 
     @inloop
-    @asyncio.coroutine
-    def test_badcall(self):
+    async def test_badcall(self):
         try:
-            yield from self.client.call(
+            await self.client.call(
                 destination=self.servname,
                 interface=self.servname,
                 path=self.servpath,
@@ -77,28 +74,248 @@ class TestPeer(unittest.TestCase):
             self.assertEqual(e.name, 'org.freedesktop.DBus.Error.UnknownMethod')
 
     @inloop
-    @asyncio.coroutine
-    def test_callecho(self):
-        msg = yield from self.obj.Echo('hello')
+    async def test_callecho(self):
+        msg = await self.obj.Echo('hello')
         self.assertEqual(msg, 'hello world')
 
     @inloop
-    @asyncio.coroutine
-    def test_callechodelay(self):
-        msg = yield from self.obj.DelayEcho('hello')
+    async def test_callechodelay(self):
+        msg = await self.obj.DelayEcho('hello')
         self.assertEqual(msg, 'hello is a test')
 
     @inloop
-    @asyncio.coroutine
-    def test_signal(self):
+    async def test_signal(self):
         SIG = self.client.new_queue()
-        yield from self.obj.Testing.connect(SIG)
+        await self.obj.Testing.connect(SIG)
 
         self.serverobj.Testing('one')
 
-        evt, sts = yield from SIG.recv()
+        evt, sts = await SIG.recv()
         self.assertEqual(evt.body, 'one')
 
         self.assertTrue(SIG._Q.empty())
 
-        yield from SIG.close()
+        await SIG.close()
+
+    @inloop
+    async def test_signal_many(self):
+        SIG = self.client.new_queue()
+        await self.obj.Testing.connect(SIG)
+
+        self.server.signal_many([self.client.name, self.client.name],
+                                path=self.servpath,
+                                interface=self.servname,
+                                member='Testing',
+                                sig='s',
+                                body='two')
+
+        for i in range(2):
+            evt, sts = await SIG.recv()
+            self.assertEqual(evt.body, 'two')
+            self.assertEqual(evt.destination, self.client.name)
+
+        # large bodies are encoded by the executor
+        self.server.offload_size = 16
+        try:
+            self.server.signal_many([self.client.name], path=self.servpath, interface=self.servname,
+                                    member='Testing', sig='s', body='x'*32)
+            evt, sts = await SIG.recv()
+            self.assertEqual(evt.body, 'x'*32)
+        finally:
+            del self.server.offload_size
+
+        self.assertRaises(ValueError, self.server.signal_many, [self.client.name], path=self.servpath,
+                          interface=self.servname, member='Testing', sig='h', body=0)
+
+        await SIG.close()
+
+    @inloop
+    async def test_call_cb(self):
+        F = self.loop.create_future()
+        self.client.call_cb(lambda ret, err: F.set_result((ret, err)),
+            destination=self.servname,
+            interface=self.servname,
+            path=self.servpath,
+            member='Echo',
+            sig='s',
+            body='hello',
+        )
+        ret, err = await F
+        self.assertEqual(ret, 'hello world')
+        self.assertIsNone(err)
+
+        F = self.loop.create_future()
+        self.client.call_cb(lambda ret, err: F.set_result((ret, err)),
+            destination=self.servname,
+            interface=self.servname,
+            path=self.servpath,
+            member='baz',
+        )
+        ret, err = await F
+        self.assertIsNone(ret)
+        self.assertIsInstance(err, RemoteError)
+        self.assertEqual(err.name, 'org.freedesktop.DBus.Error.UnknownMethod')
+
+    @inloop
+    async def test_subscribe(self):
+        F = self.loop.create_future()
+        S = await self.client.subscribe(F.set_result,
+                                             path=self.servpath,
+                                             interface=self.servname,
+                                             member='Testing')
+
+        self.serverobj.Testing('three')
+
+        evt = await F
+        self.assertEqual(evt.body, 'three')
+
+        await S.close()
+        self.assertNotIn(S, self.client._signals)
+
+    @inloop
+    async def test_call_raw(self):
+        for lsb in (True, False):
+            ret = await self.client.call_raw(
+                destination=self.servname,
+                interface=self.servname,
+                path=self.servpath,
+                member='Echo',
+                sig='s',
+                body=encode(b's', 'hello', lsb=lsb),
+                lsb=lsb,
+            )
+            self.assertIsInstance(ret, RawBody)
+            self.assertEqual(ret.sig, 's')
+            self.assertEqual(ret.decode(), 'hello world')
+
+        try:
+            await self.client.call_raw(destination=self.servname, path=self.servpath, member='baz')
+            self.fail("Unexpected success")
+        except RemoteError as e:
+            self.assertEqual(e.name, 'org.freedesktop.DBus.Error.UnknownMethod')
+
+    @inloop
+    async def test_call_batch(self):
+        calls = [
+            {'path':self.servpath, 'interface':self.servname, 'member':'Echo', 'sig':'s', 'body':'hello'},
+            {'path':self.servpath, 'interface':self.servname, 'member':'DelayEcho', 'sig':'s', 'body':'this'},
+            {'path':self.servpath, 'interface':self.servname, 'member':'baz'},
+            {'path':'/other', 'interface':self.servname, 'member':'Echo', 'sig':'s', 'body':'x'},
+            {'path':self.servpath, 'member':'Echo', 'sig':'s', 'body':'again'},
+        ]
+        seen = []
+        dispatch = self.server._dispatch
+        def count(evt, *args):
+            seen.append(evt.member)
+            dispatch(evt, *args)
+        self.server._dispatch = count
+
+        for expect in (['Call'], ['Echo', 'DelayEcho', 'baz', 'Echo', 'Echo']):
+            seen[:] = []
+            ret = await self.client.call_batch(calls, destination=self.servname)
+            self.assertEqual(ret[:2], ['hello world', 'this is a test'])
+            self.assertIsInstance(ret[2], RemoteError)
+            self.assertEqual(ret[2].name, 'org.freedesktop.DBus.Error.UnknownMethod')
+            self.assertEqual(ret[3].name, 'org.freedesktop.DBus.Error.UnknownObject')
+            self.assertEqual(ret[4], 'again world')
+            self.assertEqual(seen, expect)
+            # subsequently, as if the peer lacked org.dbucket.Batch
+            self.client._no_batch = {self.servname}
+
+        # the daemon lacks org.dbucket.Batch
+        self.client._no_batch = None
+        ret = await self.client.call_batch([{'path':DBUS_PATH, 'interface':DBUS, 'member':'GetNameOwner',
+                                             'sig':'s', 'body':self.servname}], destination=DBUS)
+        self.assertEqual(ret, [self.server.name])
+        self.assertEqual(self.client._no_batch, {DBUS})
+
+    @inloop
+    async def test_attach_raw(self):
+        calls = []
+        def echo(evt):
+            calls.append(evt)
+            return evt.raw
+        self.server.attach_raw(echo)
+        try:
+            ret = await self.client.call(destination=self.servname, path='/other',
+                                         interface='foo.Other', member='Echo', sig='yv', body=(4, Variant(b'q', 5)))
+            self.assertEqual(ret, (4, 5))
+            self.assertIsNone(calls[0].body)
+            self.assertEqual(calls[0].raw.sig, 'yv')
+
+            # variant type information is preserved.  eg. 'q' not 'i'
+            body = encode(b'yv', (4, Variant(b'q', 5)))
+            ret = await self.client.call_raw(destination=self.servname, path='/other',
+                                             member='Echo', sig='yv', body=body)
+            self.assertEqual(ret.data, body)
+
+            ret = await self.client.call(destination=self.servname, path='/other', member='Empty')
+            self.assertIsNone(ret)
+
+            # attach()'d objects take precedence
+            msg = await self.obj.Echo('hello')
+            self.assertEqual(msg, 'hello world')
+            self.assertEqual(len(calls), 3)
+        finally:
+            self.server.detach_raw()
+
+    @inloop
+    async def test_signal_raw(self):
+        F = self.loop.create_future()
+        S = await self.client.subscribe(F.set_result, raw=True,
+                                        path=self.servpath,
+                                        interface=self.servname,
+                                        member='Testing')
+        try:
+            self.server.signal_raw(path=self.servpath, interface=self.servname, member='Testing',
+                                   sig='s', body=encode(b's', 'four', lsb=False), lsb=False)
+            evt = await F
+            self.assertIsNone(evt.body)
+            self.assertEqual(evt.raw.decode(), 'four')
+        finally:
+            await S.close()
+        self.assertEqual(self.client._raw_subs, 0)
+
+    @inloop
+    async def test_signal_raw_arg0(self):
+        'A raw subscription must not prevent decoding when an arg0 match needs the body'
+        raw, F = [], self.loop.create_future()
+        S1 = await self.client.subscribe(raw.append, raw=True, path=self.servpath,
+                                         interface=self.servname, member='Testing')
+        S2 = await self.client.subscribe(F.set_result, path=self.servpath,
+                                         interface=self.servname, member='Testing', arg0='four')
+        try:
+            self.server.signal(path=self.servpath, interface=self.servname, member='Testing',
+                               sig='s', body='four')
+            evt = await F
+            self.assertEqual(evt.body, 'four')
+            self.assertEqual(raw[0].raw.decode(), 'four')
+        finally:
+            await asyncio.gather(S1.close(), S2.close())
+
+    @inloop
+    async def test_offload(self):
+        self.server.offload_size = self.client.offload_size = 1
+        msg = await self.obj.Echo('hello')
+        self.assertEqual(msg, 'hello world')
+
+    @inloop
+    async def test_tracer(self):
+        sent, recvd, done = [], [], []
+        T = self.server.add_tracer(
+            on_send=lambda conn, mtype, sn, size, ts, data: sent.append((mtype, sn, size)),
+            on_recv=lambda conn, evt, size, ts, data: recvd.append((evt.member, size, sum(map(len, data)))),
+            on_dispatch_done=lambda conn, evt, start, end: done.append((evt.member, end>=start)),
+        )
+        try:
+            msg = await self.obj.Echo('hello')
+            self.assertEqual(msg, 'hello world')
+        finally:
+            self.server.remove_tracer(T)
+
+        self.assertEqual(len(sent), 1)
+        self.assertEqual(sent[0][0], 2) # METHOD_RETURN
+        self.assertEqual(recvd[-1][0], 'Echo')
+        self.assertEqual(recvd[-1][1], recvd[-1][2])
+        self.assertEqual(done[-1], ('Echo', True))
+        self.assertEqual(self.server._trace_send, ())
@@ -1,35 +1,33 @@
 
-import unittest, asyncio
+import unittest
 
-from ..conn import DBUS, DBUS_PATH
+from ..conn import DBUS, DBUS_PATH, ConnectionClosed
 from ..persist import PersistentConnection
-from .util import test_bus, test_bus_info, inloop
+from .util import test_bus, test_bus_info, test_loop, inloop
 
 class TestPersistent(unittest.TestCase):
     timeout = 1.0
 
     def setUp(self):
-        self.conn = PersistentConnection(test_bus_info)
+        self.conn = PersistentConnection(test_bus_info, loop=test_loop())
 
     @inloop
-    @asyncio.coroutine
-    def tearDown(self):
-        yield from self.conn.close()
+    async def tearDown(self):
+        await self.conn.close()
 
     @inloop
-    @asyncio.coroutine
-    def test_reconn(self):
-        yield from self.conn.connect
+    async def test_reconn(self):
+        await self.conn.connect
 
         before = self.conn.name
 
         test_bus().stop()
 
-        yield from self.conn.disconnect
+        await self.conn.disconnect
 
         test_bus().start()
 
-        yield from self.conn.connect
+        await self.conn.connect
 
         after = self.conn.name
 
@@ -38,11 +36,10 @@ class TestPersistent(unittest.TestCase):
         self.assertRegex(after, r'^:')
 
     @inloop
-    @asyncio.coroutine
-    def test_queue_call(self):
-        yield from self.conn.connect
+    async def test_queue_call(self):
+        await self.conn.connect
         test_bus().stop()
-        yield from self.conn.disconnect
+        await self.conn.disconnect
 
 
         F = self.conn.call(
@@ -55,9 +52,24 @@ class TestPersistent(unittest.TestCase):
         self.assertFalse(F.done())
 
         test_bus().start()
-        yield from self.conn.connect
+        await self.conn.connect
 
 
-        names = yield from F
+        names = await F
 
         self.assertIn(self.conn.name, names)
+
+    @inloop
+    async def test_close_queued(self):
+        'Calls queued while disconnected fail on close()'
+        await self.conn.connect
+        test_bus().stop()
+        try:
+            await self.conn.disconnect
+
+            F = self.conn.call(destination=DBUS, interface=DBUS, path=DBUS_PATH, member='ListNames')
+            await self.conn.close()
+            with self.assertRaises(ConnectionClosed):
+                await F
+        finally:
+            test_bus().start()
@@ -0,0 +1,92 @@
+import unittest, asyncio, os, pstats, tempfile
+
+from ..conn import RemoteError
+from ..auth import connect_bus
+from ..proxy import Interface, Method
+from ..profiler import Profiler, fetch_profile, PROFILER, PROFILER_PATH
+from .util import inloop, test_bus_info
+
+@Interface('foo.bar')
+class Busy(object):
+    @Method()
+    def Spin(self, N:int) -> int:
+        return sum(range(N))
+    @Method()
+    async def SpinLater(self, N:int) -> int:
+        await asyncio.sleep(0.001)
+        return _spin_later(N)
+
+def _spin_later(N):
+    return sum(range(N))
+
+class TestProfiler(unittest.TestCase):
+    timeout = 2.0
+
+    @inloop
+    async def setUp(self):
+        self.server = await connect_bus(test_bus_info())
+        self.client = await connect_bus(test_bus_info())
+        self.server.attach(Profiler(self.server), path=PROFILER_PATH)
+        self.server.attach(Busy(), path='/busy')
+
+    @inloop
+    async def tearDown(self):
+        await asyncio.gather(self.client.close(), self.server.close())
+
+    @inloop
+    async def test_profile(self):
+        F = self.loop.create_task(fetch_profile(self.client, destination=self.server.name,
+                                                duration=0.1, interfaces=['foo.bar']))
+        await asyncio.sleep(0.02)
+        ret = await self.client.call(destination=self.server.name, path='/busy',
+                                     interface='foo.bar', member='Spin', sig='i', body=1000)
+        self.assertEqual(ret, sum(range(1000)))
+
+        stats = await F
+        names = [func[2] for func in stats.stats]
+        self.assertIn('Spin', names)
+
+    @inloop
+    async def test_profile_async(self):
+        'The steps of an async handler after its first await are profiled'
+        F = self.loop.create_task(fetch_profile(self.client, destination=self.server.name,
+                                                duration=0.1, interfaces=['foo.bar']))
+        await asyncio.sleep(0.02)
+        ret = await self.client.call(destination=self.server.name, path='/busy',
+                                     interface='foo.bar', member='SpinLater', sig='i', body=1000)
+        self.assertEqual(ret, sum(range(1000)))
+
+        stats = await F
+        names = [func[2] for func in stats.stats]
+        self.assertIn('_spin_later', names)
+
+    @inloop
+    async def test_tracemalloc(self):
+        kws = {'destination':self.server.name, 'path':PROFILER_PATH, 'interface':PROFILER}
+        await self.client.call(member='TracemallocStart', sig='u', body=1, **kws)
+        try:
+            txt = await self.client.call(member='TracemallocSnapshot', sig='su', body=('filename', 5), **kws)
+            self.assertRegex(txt, r'size=')
+        finally:
+            await self.client.call(member='TracemallocStop', **kws)
+
+    @inloop
+    async def test_save(self):
+        kws = {'destination':self.server.name, 'path':PROFILER_PATH, 'interface':PROFILER}
+        with self.assertRaises(RemoteError) as E:
+            await self.client.call(member='Save', sig='s', body='out.pstats', **kws)
+        self.assertEqual(E.exception.name, 'org.freedesktop.DBus.Error.NotSupported')
+
+        with tempfile.TemporaryDirectory() as D:
+            self.server.detach(PROFILER_PATH)
+            self.server.attach(Profiler(self.server, save_dir=D), path=PROFILER_PATH)
+
+            await self.client.call(member='Start', sig='das', body=(1.0, []), **kws)
+            for name in ('../out.pstats', '/tmp/out.pstats', '..', ''):
+                with self.assertRaises(RemoteError) as E:
+                    await self.client.call(member='Save', sig='s', body=name, **kws)
+                self.assertEqual(E.exception.name, 'org.freedesktop.DBus.Error.InvalidArgs')
+
+            path = await self.client.call(member='Save', sig='s', body='out.pstats', **kws)
+            self.assertEqual(path, os.path.join(D, 'out.pstats'))
+            self.assertIsInstance(pstats.Stats(path).stats, dict)
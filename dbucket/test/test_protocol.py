@@ -0,0 +1,188 @@
+import unittest, logging
+
+from ..xcode import encode, decode, Object, Signature, Variant
+from ..protocol import Protocol, RawBody, _header_fields, METHOD_CALL, METHOD_RETURN, ERROR, SIGNAL
+from ..signal import SignalQueue, Subscription, Condition
+
+class FakeConnection(object):
+    def __init__(self, proto):
+        self._proto = proto
+        self._signal_held = 0
+        self.log = logging.getLogger(__name__)
+    def _drop_queue(self, Q):
+        self._proto.matchers.remove(Q)
+
+class TestFraming(unittest.TestCase):
+    def setUp(self):
+        self.client, self.server = Protocol(), Protocol()
+
+    def test_call(self):
+        SN, S = self.client.call('pending', path='/foo', interface='foo.bar', member='Baz',
+                                 destination=':1.1', sig='is', body=(42, 'hello'))
+        self.assertEqual(self.client.inprog, {SN:'pending'})
+
+        self.server.receive_data(b''.join(S))
+        evt = self.server.next_event()
+        self.assertIsNone(self.server.next_event())
+        self.assertEqual(self.server.buffered, 0)
+
+        self.assertEqual(evt.type, METHOD_CALL)
+        self.assertEqual(evt.serial, SN)
+        self.assertEqual((evt.path, evt.interface, evt.member, evt.destination), ('/foo', 'foo.bar', 'Baz', ':1.1'))
+        self.assertEqual(evt.body, (42, 'hello'))
+        self.assertEqual(evt._size, sum(map(len, S)))
+
+        evt.sender = ':1.2' # normally set by the daemon
+        self.client.receive_data(b''.join(self.server.method_return(evt, 's', 'world')))
+        reply = self.client.next_event()
+
+        self.assertEqual(reply.type, METHOD_RETURN)
+        self.assertEqual(reply.destination, ':1.2')
+        self.assertEqual(reply.body, 'world')
+        self.assertEqual(self.client.take_reply(reply), 'pending')
+        self.assertEqual(self.client.inprog, {})
+        self.assertIsNone(self.client.take_reply(reply))
+
+    def test_error(self):
+        SN, S = self.client.call('pending', path='/foo', member='Baz')
+        self.server.receive_data(b''.join(S))
+        evt = self.server.next_event()
+        evt.sender = ':1.2'
+        self.client.receive_data(b''.join(self.server.error(evt, 'foo.Error', 'oops')))
+        reply = self.client.next_event()
+        self.assertEqual(reply.type, ERROR)
+        self.assertEqual(reply._error, 'foo.Error')
+        self.assertEqual(reply.body, 'oops')
+        self.assertEqual(self.client.take_reply(reply), 'pending')
+
+    def test_partial(self):
+        'Messages split across, and sharing, reads'
+        data = b''.join(self.client.signal(path='/foo', interface='foo.bar', member='Sig', sig='s', body='one')
+                        +self.client.signal(path='/foo', interface='foo.bar', member='Sig', sig='s', body='two'))
+        evts = []
+        for i in range(len(data)):
+            self.server.receive_data(data[i:i+1])
+            evt = self.server.next_event()
+            if evt is not None:
+                evts.append(evt)
+        self.assertEqual([E.body for E in evts], ['one', 'two'])
+        self.assertEqual([E.type for E in evts], [SIGNAL, SIGNAL])
+        self.assertEqual(self.server.buffered, 0)
+
+    def test_big_endian(self):
+        body = encode(b's', 'hello', lsb=False)
+        header = encode(b'yyyyuua(yv)', (ord(b'B'), SIGNAL, 0, 1,  len(body), 7,  [
+            (1, Object('/foo')),
+            (2, 'foo.bar'),
+            (3, 'Sig'),
+            (8, Signature('s')),
+        ]), lsb=False)
+        pad = b'\0'*(-len(header)%8)
+        self.server.receive_data(header+pad+body)
+        evt = self.server.next_event()
+        self.assertEqual((evt.serial, evt.member, evt.body), (7, 'Sig', 'hello'))
+
+    def test_no_copy(self):
+        'The body returned by next_message() is a view of the raw message'
+        self.server.receive_data(b''.join(self.client.signal(path='/foo', interface='foo.bar', member='Sig',
+                                                             sig='s', body='hello')))
+        evt, body, lsb, raw = self.server.next_message()
+        self.assertIsInstance(body, memoryview)
+        self.assertIs(body.obj, raw)
+        self.assertEqual(self.server.decode_body(evt, body, lsb).body, 'hello')
+        # the receive buffer can still be resized
+        self.server.receive_data(b'x')
+        self.assertEqual(self.server.buffered, 1)
+
+    def test_header_fields(self):
+        'Fast path header decode agrees with decode(), and falls back for unusual fields'
+        for lsb in (True, False):
+            for fields, usual in [([(1, Object('/foo')), (3, 'Sig'), (8, Signature('su')), (5, Variant(b'u', 7))], True),
+                                  ([(3, 'Sig'), (10, Variant(b'ai', [1, 2]))], False)]:
+                header = encode(b'yyyyuua(yv)', (ord(b'l' if lsb else b'B'), SIGNAL, 0, 1,  0, 3, fields), lsb=lsb)
+                expect = decode(b'yyyyuua(yv)', header, lsb=lsb)[-1]
+                self.assertEqual(_header_fields(header, len(header), lsb), expect if usual else None)
+                self.server.receive_data(header+b'\0'*(-len(header)%8))
+                evt, _body, _lsb, _raw = self.server.next_message()
+                self.assertEqual((evt.member, evt.serial), ('Sig', 3))
+
+    def test_return_many(self):
+        'One reply to several calls, each with its own serial and destination'
+        calls = []
+        for sender in (':1.2', ':1.3'):
+            SN, S = self.client.call('pending', path='/foo', member='Baz')
+            self.server.receive_data(b''.join(S))
+            evt = self.server.next_event()
+            evt.sender = sender
+            calls.append(evt)
+
+        self.client.receive_data(b''.join(self.server.method_return_many(calls, 's', 'world')))
+        R = [self.client.next_event() for C in calls]
+        self.assertEqual([E._return_sn for E in R], [C.serial for C in calls])
+        self.assertEqual([E.destination for E in R], [':1.2', ':1.3'])
+        self.assertEqual([E.body for E in R], ['world', 'world'])
+        self.assertEqual(len(set([E.serial for E in R])), 2)
+
+        self.assertRaises(ValueError, self.server.method_return_many, calls, 'h', 0)
+
+    def test_many_reuse(self):
+        'Encoding does not modify the prepared message'
+        msg = self.server.prepare_signal_many([':1.2'], path='/foo', interface='foo.bar', member='Sig',
+                                              sig='s', body='hello')
+        opts = list(msg.opts)
+        S = self.server.encode_many(msg)
+        self.assertEqual(msg.opts, opts)
+        self.assertEqual(self.server.encode_many(msg), S)
+
+    def test_raw(self):
+        'Raw bodies are written as is, with a header of matching byte order'
+        body = encode(b'u', 42, lsb=False)
+        S = self.client.signal(path='/foo', interface='foo.bar', member='Sig', body=RawBody('u', body, False))
+        self.assertIs(S[2], body)
+        self.assertEqual(S[0][0], ord(b'B'))
+
+        self.server.receive_data(b''.join(S))
+        evt = self.server.next_event()
+        self.assertEqual(evt.body, 42)
+
+    def test_invalid(self):
+        self.server.receive_data(b'X'*16)
+        self.assertRaises(RuntimeError, self.server.next_message)
+
+    def test_serials(self):
+        self.client._nextsn = 0xffffffff
+        self.assertEqual(self.client.get_sn(), 0xffffffff)
+        self.assertEqual(self.client.get_sn(), 0)
+
+    def test_cancel(self):
+        self.client.call('A', path='/foo', member='Baz')
+        self.client.call('B', path='/foo', member='Baz')
+        self.assertEqual(sorted(self.client.cancel_replies()), ['A', 'B'])
+        self.assertEqual(self.client.inprog, {})
+
+class TestRouting(unittest.TestCase):
+    def setUp(self):
+        self.client, self.server = Protocol(), Protocol()
+        conn = FakeConnection(self.server)
+        self.Q = SignalQueue(conn, qsize=4)
+        self.Q._cond.append(Condition(remove=False, member='Sig'))
+        self.events = []
+        self.S = Subscription(conn, self.events.append)
+        self.S._cond.append(Condition(remove=False, member='Sig'))
+        self.server.matchers.extend([self.Q, self.S])
+
+    def _signal(self, member):
+        self.server.receive_data(b''.join(self.client.signal(path='/foo', interface='foo.bar', member=member)))
+        return self.server.next_event()
+
+    def test_route(self):
+        self.assertTrue(self.server.route_signal(self._signal('Sig')))
+        self.assertFalse(self.server.route_signal(self._signal('Other')))
+        self.assertEqual(self.Q.qsize(), 1)
+        self.assertEqual(len(self.events), 1)
+
+    def test_shed(self):
+        self.server.route_signal(self._signal('Sig'), shed=True)
+        self.assertEqual(self.Q.qsize(), 0)
+        self.assertEqual(self.Q.overflows, 1)
+        self.assertEqual(len(self.events), 1)
@@ -1,10 +1,11 @@
 
-import unittest, asyncio
+import unittest
 import xml.etree.ElementTree as ET
 
-from ..conn import DBUS, DBUS_PATH, METHOD_CALL, BusEvent
+from ..conn import DBUS, DBUS_PATH, METHOD_CALL
+from ..protocol import BusEvent
 from ..proxy import buildProxy, ProxyBase, Interface, Method, Signal, MethodDispatch, INTROSPECTABLE, IDOCTYPE
-from .util import inloop, FakeConnection
+from .util import inloop, test_loop, FakeConnection
 
 class TestBuilder(unittest.TestCase):
     xml = """<!DOCTYPE node PUBLIC "-//freedesktop//DTD D-BUS Object Introspection 1.0//EN"
@@ -29,13 +30,12 @@ class TestBuilder(unittest.TestCase):
 """
     
     def setUp(self):
-        self.loop = asyncio.get_event_loop()
+        self.loop = test_loop()
         self.conn = FakeConnection()
         self.root = ET.fromstring(self.xml)
 
     @inloop
-    @asyncio.coroutine
-    def test_call0(self):
+    async def test_call0(self):
         klass = buildProxy(self.root, interface=DBUS)
 
         self.assertFalse(hasattr(klass, 'Other'))
@@ -63,15 +63,14 @@ class TestBuilder(unittest.TestCase):
                             member='ListQueuedOwners',
         )
 
-        ret = yield from inst.Hello()
+        ret = await inst.Hello()
         self.assertEqual(ret, ':1.1')
 
-        ret = yield from inst.ListQueuedOwners('test')
+        ret = await inst.ListQueuedOwners('test')
         self.assertEqual(ret, [])
 
     @inloop
-    @asyncio.coroutine
-    def test_all_interfaces(self):
+    async def test_all_interfaces(self):
         klass = buildProxy(self.root)
 
         self.assertTrue(hasattr(klass, 'Other'))
@@ -182,6 +181,12 @@ class TestDispatch(unittest.TestCase):
                                             '<arg dir="out" type="s" />',
                                         '</method>',
                                        '</interface>',
+                                       '<interface name="org.dbucket.Batch">',
+                                        '<method name="Call">',
+                                            '<arg direction="in" type="a(ossgay)" />',
+                                            '<arg direction="out" type="a(sgay)" />',
+                                        '</method>',
+                                       '</interface>',
                                        '<interface name="foo.Op">',
                                         '<method name="Add">',
                                             '<arg direction="in" type="i" />',
@@ -223,6 +228,12 @@ class TestDispatch(unittest.TestCase):
                                             '<arg dir="out" type="s" />',
                                         '</method>',
                                        '</interface>',
+                                       '<interface name="org.dbucket.Batch">',
+                                        '<method name="Call">',
+                                            '<arg direction="in" type="a(ossgay)" />',
+                                            '<arg direction="out" type="a(sgay)" />',
+                                        '</method>',
+                                       '</interface>',
                                        '<interface name="foo.Op">',
                                         '<method name="Add">',
                                             '<arg direction="in" type="i" />',
@@ -245,6 +256,14 @@ class TestDispatch(unittest.TestCase):
                                        '<node name="foo" />',
                                        '</node>']))
 
+        # Batch only advertised at the root
+        val, sig = self.disp.handle(BusEvent.build(METHOD_CALL, 1,
+            path='/foo',
+            interface=INTROSPECTABLE,
+            member='Introspect',
+        ))
+        self.assertNotIn('org.dbucket.Batch', val)
+        self.assertIn('foo.Op', val)
 
         self.disp.detach('/foo')
 
@@ -270,6 +289,16 @@ class TestDispatch(unittest.TestCase):
         self.assertEqual(sig, 'i')
         self.assertEqual(val, 0)
 
+    def test_no_interface(self):
+
+        val, sig = self.disp.handle(BusEvent.build(METHOD_CALL, 1,
+            path='/',
+            member='Zero',
+        ))
+
+        self.assertEqual(sig, 'i')
+        self.assertEqual(val, 0)
+
     def test_Inv(self):
 
         val, sig = self.disp.handle(BusEvent.build(METHOD_CALL, 1,
@@ -0,0 +1,104 @@
+import unittest, struct, os, tempfile
+
+import asyncio
+
+from ..recorder import FlightRecorder, LINKTYPE_DBUS
+from ..server import socketpair
+from .util import inloop
+
+class FakeConnection(object):
+    def __init__(self):
+        self.tracers = []
+    def add_tracer(self, **kws):
+        self.tracers.append(kws)
+        return kws
+    def remove_tracer(self, T):
+        self.tracers.remove(T)
+
+class TestRecorder(unittest.TestCase):
+    def setUp(self):
+        self.conn = FakeConnection()
+
+    def test_ring(self):
+        R = FlightRecorder(self.conn, maxmsgs=3)
+        T = self.conn.tracers[0]
+        for i in range(5):
+            T['on_send'](self.conn, 4, i, 2, float(i), [b'T', b'', bytes([i])])
+        T['on_recv'](self.conn, None, 2, 2.5, (b'R', b'x'))
+
+        self.assertEqual(R.messages(), [
+            (2.0, 'tx', b'T\x02'),
+            (2.5, 'rx', b'Rx'),
+            (3.0, 'tx', b'T\x03'),
+            (4.0, 'tx', b'T\x04'),
+        ])
+        R.close()
+        self.assertEqual(self.conn.tracers, [])
+
+    def test_maxbytes(self):
+        R = FlightRecorder(self.conn, maxmsgs=10, maxbytes=5)
+        T = self.conn.tracers[0]
+        for i in range(4):
+            T['on_send'](self.conn, 4, i, 2, float(i), [b'T', b'', bytes([i])])
+        self.assertEqual([M[2] for M in R.messages()], [b'T\x02', b'T\x03'])
+        self.assertEqual(R._tx.nbytes, 4)
+
+        # too big to keep at all
+        T['on_send'](self.conn, 4, 9, 6, 9.0, [b'T', b'', b'12345'])
+        self.assertEqual([M[2] for M in R.messages()], [b'T\x02', b'T\x03'])
+        self.assertEqual(R._tx.oversize, 1)
+
+    def test_maxmsgs(self):
+        self.assertRaises(ValueError, FlightRecorder, self.conn, maxmsgs=0)
+        self.assertEqual(self.conn.tracers, [])
+
+    def test_pcap(self):
+        R = FlightRecorder(self.conn)
+        T = self.conn.tracers[0]
+        T['on_send'](self.conn, 4, 1, 4, 1.5, [b'ab', b'', b'cd'])
+
+        fd, fname = tempfile.mkstemp(suffix='.pcap')
+        os.close(fd)
+        try:
+            self.assertEqual(R.dump(fname), 1)
+            with open(fname, 'rb') as F:
+                raw = F.read()
+        finally:
+            os.remove(fname)
+
+        magic, major, minor, _z, _s, snap, link = struct.unpack('=IHHiIII', raw[:24])
+        self.assertEqual((magic, major, minor, link), (0xa1b2c3d4, 2, 4, LINKTYPE_DBUS))
+        sec, usec, incl, orig = struct.unpack('=IIII', raw[24:40])
+        self.assertEqual((sec, usec, incl, orig), (1, 500000, 4, 4))
+        self.assertEqual(raw[40:], b'abcd')
+
+class TestRecorderConn(unittest.TestCase):
+    timeout = 2.0
+
+    @inloop
+    async def test_undecodable(self):
+        'A received message which can not be decoded is still recorded'
+        A, B = await socketpair()
+        R = FlightRecorder(B)
+        try:
+            # a string which is not utf-8
+            bad = b'\x02\x00\x00\x00\xff\xfe\x00'
+            A.signal_raw(path='/x', interface='foo.bar', member='Bad', sig='s', body=bad, lsb=True)
+            for i in range(100):
+                if R.messages('rx'):
+                    break
+                await asyncio.sleep(0.01)
+            [(_ts, _dir, raw)] = R.messages('rx')
+            self.assertTrue(raw.endswith(bad))
+
+            fd, fname = tempfile.mkstemp(suffix='.pcap')
+            os.close(fd)
+            try:
+                self.assertEqual(R.dump(fname, 'rx'), 1)
+                with open(fname, 'rb') as F:
+                    self.assertEqual(F.read()[40:], raw)
+            finally:
+                os.remove(fname)
+        finally:
+            R.close()
+            await asyncio.gather(A.close(), B.close())
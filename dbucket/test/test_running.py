@@ -1,5 +1,4 @@
 
-import asyncio
 import unittest
 
 from .util import DaemonRunner, inloop
@@ -10,11 +9,10 @@ class TestRunner(unittest.TestCase):
             self.assertRegex(run.addr, "dbus-test-")
 
     @inloop
-    @asyncio.coroutine
-    def test_restart(self):
+    async def test_restart(self):
         with DaemonRunner() as run:
             abefore, pbefore = run.addr, run.proc.pid
-            yield from run.restart()
+            await run.restart()
             aafter, pafter = run.addr, run.proc.pid
         self.assertRegex(aafter, "dbus-test-")
         self.assertEqual(abefore, aafter)
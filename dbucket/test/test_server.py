@@ -0,0 +1,117 @@
+import unittest, logging
+_log = logging.getLogger(__name__)
+
+import asyncio, os
+
+from ..conn import RemoteError
+from ..auth import connect_peer
+from ..proxy import Interface, Method, Signal
+from ..server import Server, socketpair
+from ..unixfd import sealed_memfd
+from .util import inloop
+
+@Interface('foo.bar')
+class Echo(object):
+    @Method()
+    def Echo(self, s:str) -> str:
+        return s+' world'
+    @Method()
+    def Size(self, fd:'h') -> 'u':
+        return os.fstat(fd.fileno()).st_size
+    @Signal()
+    def Tick(self, i:'u'):
+        pass
+
+class TestServer(unittest.TestCase):
+    timeout = 2.0
+
+    @inloop
+    async def setUp(self):
+        self.obj = Echo()
+        self.accepted = []
+        def on_connect(conn):
+            conn.attach(self.obj, path='/echo')
+            self.accepted.append(conn)
+        self.server = await Server(on_connect, abstract='dbucket-test-%d'%os.getpid()).start()
+
+    @inloop
+    async def tearDown(self):
+        await self.server.close()
+
+    @inloop
+    async def test_call(self):
+        conn = await connect_peer([self.server.info])
+        try:
+            self.assertTrue(conn.peer)
+            self.assertIsNone(conn.daemon)
+            self.assertEqual(await conn.call(path='/echo', interface='foo.bar', member='Echo',
+                                             sig='s', body='hello'), 'hello world')
+            with self.assertRaises(RemoteError):
+                await conn.call(path='/echo', interface='foo.bar', member='Nope')
+
+            P = await conn.proxy(path='/echo', interface='foo.bar')
+            self.assertEqual(await P.Echo('bye'), 'bye world')
+
+            self.assertEqual(len(self.accepted), 1)
+            self.assertEqual(self.accepted[0].peer_uid, os.getuid())
+            self.assertIsNone(conn.peer_uid) # not known to the connecting side
+        finally:
+            await conn.close()
+
+    @inloop
+    async def test_signal(self):
+        conn = await connect_peer([self.server.info])
+        try:
+            await conn.call(path='/echo', interface='foo.bar', member='Echo', sig='s', body='')
+            Q = asyncio.Queue()
+            sub = await conn.subscribe(Q.put_nowait, interface='foo.bar', member='Tick')
+            for i in range(3):
+                self.obj.Tick(i)
+            self.assertEqual([(await Q.get()).body for i in range(3)], [0, 1, 2])
+            await sub.close()
+        finally:
+            await conn.close()
+
+    @inloop
+    async def test_unix_fd(self):
+        conn = await connect_peer([self.server.info], unix_fd=True)
+        try:
+            self.assertTrue(conn.unix_fd)
+            with sealed_memfd(b'x'*1000) as fd:
+                self.assertEqual(await conn.call(path='/echo', interface='foo.bar', member='Size',
+                                                 sig='h', body=fd), 1000)
+        finally:
+            await conn.close()
+
+    @inloop
+    async def test_reject(self):
+        'Wrong identity is rejected'
+        R, W = await asyncio.open_unix_connection('\0'+self.server.info['unix:abstract'])
+        try:
+            W.write(b'\0AUTH\r\n')
+            self.assertEqual(await R.readline(), b'REJECTED EXTERNAL\r\n')
+            W.write(b'AUTH EXTERNAL '+str(os.getuid()+1).encode('ascii').hex().encode('ascii')+b'\r\n')
+            self.assertEqual(await R.readline(), b'REJECTED EXTERNAL\r\n')
+            W.write(b'BEGIN\r\n')
+            self.assertTrue((await R.readline()).startswith(b'ERROR'))
+        finally:
+            W.close()
+        self.assertEqual(self.accepted, [])
+
+class TestSocketPair(unittest.TestCase):
+    timeout = 2.0
+
+    @inloop
+    async def test_pair(self):
+        A, B = await socketpair()
+        try:
+            obj = Echo()
+            A.attach(obj, path='/echo')
+            self.assertEqual(await B.call(path='/echo', interface='foo.bar', member='Echo',
+                                          sig='s', body='hi'), 'hi world')
+            # and the other way
+            B.attach(Echo(), path='/other')
+            self.assertEqual(await A.call(path='/other', interface='foo.bar', member='Echo',
+                                          sig='s', body='ho'), 'ho world')
+        finally:
+            await asyncio.gather(A.close(), B.close())
@@ -0,0 +1,110 @@
+import unittest, asyncio
+
+from ..conn import DBUS
+from ..auth import connect_bus
+from ..protocol import Protocol
+from ..stats import Stats, Histogram, StatsExport, prometheus, STATS, STATS_PATH
+from .util import inloop, test_bus_info
+
+class TestHistogram(unittest.TestCase):
+    def test_observe(self):
+        H = Histogram(buckets=(1.0, 2.0))
+        for V in (0.5, 1.0, 1.5, 3.0):
+            H.observe(V)
+        S = H.snapshot()
+        self.assertEqual(S['count'], 4)
+        self.assertEqual(S['sum'], 6.0)
+        self.assertEqual(S['buckets'], [(1.0, 2), (2.0, 3), (float('inf'), 4)])
+
+class TestCalls(unittest.TestCase):
+    def test_forget(self):
+        S = Stats()
+        P = Protocol(stats=S)
+        SN, _S = P.call('pending', path='/foo', member='Baz')
+        self.assertIn(SN, S._calls)
+        self.assertEqual(P.forget_reply(SN), 'pending')
+        self.assertEqual(S._calls, {})
+
+class TestPrometheus(unittest.TestCase):
+    def test_format(self):
+        S = Stats()
+        S._received(4, 100)
+        S._call_start(1, 'foo.bar', 'Baz')
+        S._call_done(1)
+        txt = prometheus(S.snapshot(), labels={'conn':':1.1'})
+        self.assertIn('# TYPE dbucket_messages_in_total counter\n', txt)
+        self.assertIn('dbucket_messages_in_total{conn=":1.1",type="signal"} 1\n', txt)
+        self.assertIn('dbucket_bytes_in_total{conn=":1.1",type="signal"} 100\n', txt)
+        self.assertIn('dbucket_call_latency_seconds_count{conn=":1.1",interface="foo.bar",member="Baz"} 1\n', txt)
+        self.assertIn('dbucket_call_latency_seconds_bucket{conn=":1.1",interface="foo.bar",le="+Inf",member="Baz"} 1\n', txt)
+
+class TestConnStats(unittest.TestCase):
+    timeout = 1.0
+
+    @inloop
+    async def setUp(self):
+        self.conn = await connect_bus(test_bus_info(), stats=True)
+        self.peer = await connect_bus(test_bus_info())
+
+    @inloop
+    async def tearDown(self):
+        await asyncio.gather(self.conn.close(), self.peer.close())
+
+    def test_disabled(self):
+        self.assertIsNone(self.peer.stats())
+
+    @inloop
+    async def test_snapshot(self):
+        await self.conn.daemon.ListNames()
+
+        S = self.conn.stats()
+        # Hello, ListNames.  (Introspect only by the first connection of the process)
+        self.assertGreaterEqual(S['messages_out']['method_call'], 2)
+        self.assertGreaterEqual(S['messages_in']['method_return'], 2)
+        self.assertGreater(S['bytes_in']['method_return'], 0)
+        self.assertEqual(S['inprog'], 0)
+        self.assertEqual(S['call_latency']['%s.ListNames'%DBUS]['count'], 1)
+        # daemon signals are handled by a Subscription, not a queue
+        self.assertDictEqual(S['signal_queues'], {})
+
+    @inloop
+    async def test_same_label(self):
+        'Queues with the same label are counted separately'
+        A, B, C = self.conn.new_queue(name='dup'), self.conn.new_queue(name='dup'), self.conn.new_queue(name='one')
+        try:
+            A.overflows = 1
+            Qs = self.conn.stats()['signal_queues']
+            self.assertDictEqual(Qs, {
+                'dup #%x'%id(A):{'depth':0, 'overflows':1},
+                'dup #%x'%id(B):{'depth':0, 'overflows':0},
+                'one':{'depth':0, 'overflows':0},
+            })
+        finally:
+            await asyncio.gather(A.close(), B.close(), C.close())
+
+    @inloop
+    async def test_offload(self):
+        'Encode and decode time in the executor is counted'
+        self.conn.offload_size = 16
+        try:
+            self.assertFalse(await self.conn.daemon.NameHasOwner('org.example.'+'x'*64))
+            self.assertEqual(await self.conn.daemon.GetNameOwner(DBUS), DBUS)
+        finally:
+            del self.conn.offload_size
+        S = self.conn.stats()
+        self.assertGreater(S['encode_seconds'], 0.0)
+        self.assertEqual(S['inprog'], 0)
+
+    @inloop
+    async def test_export(self):
+        self.conn.attach(StatsExport(self.conn), path=STATS_PATH)
+        try:
+            flat = await self.peer.call(destination=self.conn.name, path=STATS_PATH,
+                                        interface=STATS, member='Get')
+            self.assertGreaterEqual(flat['messages_in.method_return'], 1.0) # Hello
+
+            txt = await self.peer.call(destination=self.conn.name, path=STATS_PATH,
+                                       interface=STATS, member='Prometheus')
+            self.assertRegex(txt, r'dbucket_messages_in_total\{conn=":[0-9.]+",type="method_call"\} [1-9]')
+        finally:
+            self.conn.detach(STATS_PATH)
@@ -0,0 +1,132 @@
+import unittest, logging
+_log = logging.getLogger(__name__)
+
+import asyncio, mmap, os
+
+from ..conn import RemoteError
+from ..auth import connect_bus
+from ..stream import Channel, StreamExport, open_stream, new_ring, _HDR, _MAGIC, _DATA
+from ..xcode import UnixFD
+from .util import inloop, test_bus_info
+
+class TestChannel(unittest.TestCase):
+    @inloop
+    async def setUp(self):
+        self.P, self.C = Channel.pair(100)
+
+    def tearDown(self):
+        self.P.close()
+        self.C.close()
+
+    @inloop
+    async def test_nowait(self):
+        self.assertEqual(self.P.capacity, 4096)
+        self.assertIs(self.C.try_read(), False)
+        self.assertTrue(self.P.try_write(b'one'))
+        self.assertTrue(self.P.try_write(b''))
+        self.assertEqual(self.C.try_read(), b'one')
+        self.assertEqual(self.C.try_read(), b'')
+        self.assertIs(self.C.try_read(), False)
+
+        self.assertRaises(ValueError, self.P.try_write, b'x'*4096)
+        self.assertRaises(RuntimeError, self.C.try_write, b'x')
+        self.assertRaises(RuntimeError, self.P.try_read)
+
+    def test_unsealed(self):
+        'A ring buffer which the other side could truncate is refused'
+        _mem, data, space = new_ring(4096)
+        _mem.close()
+        mem = UnixFD(os.memfd_create('test', os.MFD_CLOEXEC))
+        os.ftruncate(mem.fileno(), _DATA+4096)
+        with mmap.mmap(mem.fileno(), _DATA) as M:
+            _HDR.pack_into(M, 0, _MAGIC, 1, 4096)
+        try:
+            with self.assertRaisesRegex(ValueError, 'not sealed'):
+                Channel(mem, data, space, producer=False, loop=self.loop)
+        finally:
+            for F in (mem, data, space):
+                F.close()
+
+    @inloop
+    async def test_wrap(self):
+        'Records wrap around the end of the ring, and the producer waits for space'
+        records = [bytes([i%256])*(i*37%1500) for i in range(200)]
+
+        async def produce():
+            for R in records:
+                await self.P.write(R)
+            self.P.close()
+
+        T = self.loop.create_task(produce())
+        out = []
+        async for R in self.C:
+            out.append(R)
+        await T
+        self.assertEqual(out, records)
+
+    @inloop
+    async def test_consumer_close(self):
+        while self.P.try_write(b'y'):
+            pass
+        T = self.loop.create_task(self.P.write(b'y'))
+        await asyncio.sleep(0.01)
+        self.assertFalse(T.done())
+        self.C.close()
+        with self.assertRaises(BrokenPipeError):
+            await T
+
+class TestBus(unittest.TestCase):
+    timeout = 2.0
+
+    @inloop
+    async def setUp(self):
+        self.client = await connect_bus(test_bus_info(), unix_fd=True)
+        self.server = await connect_bus(test_bus_info(), unix_fd=True)
+        self.opened, self.tasks = [], []
+        self.server.attach(StreamExport(self.on_open, max_size=2**16), path='/stream')
+
+    def on_open(self, name, chan):
+        self.opened.append((name, chan.producer))
+        if name=='count':
+            async def feed():
+                async with chan:
+                    for i in range(1000):
+                        await chan.write(b'%d'%i)
+            self.tasks.append(self.server.loop.create_task(feed()))
+        elif name=='sink':
+            async def sink():
+                async with chan:
+                    self.received = [R async for R in chan]
+            self.tasks.append(self.server.loop.create_task(sink()))
+        else:
+            raise RuntimeError("No stream %s"%name)
+
+    @inloop
+    async def tearDown(self):
+        await asyncio.gather(*self.tasks)
+        await asyncio.gather(self.client.close(), self.server.close())
+
+    @inloop
+    async def test_read(self):
+        chan = await open_stream(self.client, destination=self.server.name, path='/stream',
+                                 name='count', size=4096)
+        async with chan:
+            out = [int(R) async for R in chan]
+        self.assertEqual(out, list(range(1000)))
+        self.assertEqual(self.opened, [('count', True)])
+
+    @inloop
+    async def test_write(self):
+        chan = await open_stream(self.client, destination=self.server.name, path='/stream',
+                                 name='sink', mode='w', size=4096)
+        async with chan:
+            for i in range(10):
+                await chan.write(b'x'*i)
+        await asyncio.gather(*self.tasks)
+        self.assertEqual(self.received, [b'x'*i for i in range(10)])
+
+    @inloop
+    async def test_errors(self):
+        for kws in [{'name':'other'}, {'name':'count', 'mode':'x'}, {'name':'count', 'size':2**20}]:
+            with self.assertRaises(RemoteError):
+                await open_stream(self.client, destination=self.server.name, path='/stream', **kws)
@@ -0,0 +1,145 @@
+import unittest, logging
+_log = logging.getLogger(__name__)
+
+import asyncio, os, socket
+
+from ..xcode import encode, decode, UnixFD
+from ..protocol import Protocol
+from ..auth import connect_bus
+from ..proxy import Interface, Method
+from ..unixfd import FDStream, sealed_memfd, map_sealed
+from .util import inloop, test_bus_info
+
+def _same_file(A, B):
+    SA, SB = os.fstat(A.fileno()), os.fstat(B.fileno())
+    return (SA.st_dev, SA.st_ino)==(SB.st_dev, SB.st_ino)
+
+class TestCodec(unittest.TestCase):
+    def test_fds(self):
+        R, W = os.pipe()
+        with UnixFD(R) as R, UnixFD(W) as W:
+            fds = []
+            body = encode(b'hih', (R, 42, W), fds=fds)
+            self.assertEqual(len(fds), 2)
+            self.assertTrue(_same_file(fds[0], R))
+            self.assertNotEqual(fds[0].fileno(), R.fileno()) # a duplicate
+
+            V = decode(b'hih', body, fds=fds)
+            self.assertIs(V[0], fds[0])
+            self.assertIs(V[2], fds[1])
+            self.assertEqual(V[1], 42)
+
+            # without fds=, an index
+            self.assertEqual(decode(b'hih', body), (0, 42, 1))
+
+    def test_close(self):
+        R, W = os.pipe()
+        F = UnixFD(R)
+        del F # closed by GC
+        self.assertRaises(OSError, os.fstat, R)
+        with UnixFD(W) as F:
+            pass
+        self.assertTrue(F.closed)
+        self.assertRaises(OSError, os.fstat, W)
+
+class TestMemfd(unittest.TestCase):
+    def test_sealed(self):
+        data = b'hello world'*1000
+        with sealed_memfd(data) as F:
+            M = map_sealed(F)
+            self.assertEqual(M[:], data)
+            M.close()
+            self.assertRaises(PermissionError, os.write, F.fileno(), b'x')
+            self.assertRaises(PermissionError, os.ftruncate, F.fileno(), 0)
+
+        with sealed_memfd(b'') as F:
+            self.assertEqual(map_sealed(F), b'')
+
+    def test_unsealed(self):
+        with UnixFD(os.memfd_create('test')) as F:
+            self.assertRaises(ValueError, map_sealed, F)
+
+class TestStream(unittest.TestCase):
+    @inloop
+    async def setUp(self):
+        A, B = socket.socketpair()
+        self.A, self.B = FDStream(A), FDStream(B)
+        self.client, self.server = Protocol(unix_fd=True), Protocol(unix_fd=True)
+
+    def tearDown(self):
+        self.A.close()
+        self.B.close()
+
+    async def _recv(self):
+        while True:
+            evt = self.server.next_event()
+            if evt is not None:
+                return evt
+            data = await self.B.read(1024)
+            self.assertNotEqual(data, b'')
+            self.server.receive_fds(self.B.take_fds())
+            self.server.receive_data(data)
+
+    @inloop
+    async def test_pass(self):
+        with sealed_memfd(b'one') as F1, sealed_memfd(b'x'*2**20) as F2:
+            for F in (F1, F2):
+                SN, S = self.client.call(None, path='/foo', member='Put', sig='hs', body=(F, 'hello'))
+                self.assertEqual(len(S.fds), 1)
+                self.A.writelines(S)
+            # a large message without descriptors, which must be buffered
+            SN, S = self.client.call(None, path='/foo', member='Put', sig='ay', body=b'z'*2**20)
+            self.A.writelines(S)
+            self.assertGreater(self.A.get_write_buffer_size(), 0)
+
+            evt1 = await self._recv()
+            evt2 = await self._recv()
+            evt3 = await self._recv()
+
+            self.assertTrue(_same_file(evt1.body[0], F1))
+            self.assertTrue(_same_file(evt2.body[0], F2))
+            self.assertEqual(map_sealed(evt1.body[0])[:], b'one')
+            self.assertEqual(len(evt3.body), 2**20)
+            self.assertEqual(self.A.get_write_buffer_size(), 0)
+
+class TestBus(unittest.TestCase):
+    timeout = 2.0
+
+    @Interface('foo.bar')
+    class Store(object):
+        def __init__(self):
+            self.data = b''
+        @Method()
+        def Get(self) -> 'h':
+            return sealed_memfd(self.data)
+        @Method()
+        def Size(self, fd:'h') -> 'u':
+            return os.fstat(fd.fileno()).st_size
+
+    @inloop
+    async def setUp(self):
+        self.client = await connect_bus(test_bus_info(), unix_fd=True)
+        self.server = await connect_bus(test_bus_info(), unix_fd=True)
+        self.obj = self.Store()
+        self.server.attach(self.obj, path='/store')
+
+    @inloop
+    async def tearDown(self):
+        await asyncio.gather(self.client.close(), self.server.close())
+
+    @inloop
+    async def test_memfd(self):
+        self.assertTrue(self.client.unix_fd)
+        self.obj.data = os.urandom(4*2**20)
+
+        fd = await self.client.call(destination=self.server.name, path='/store',
+                                    interface='foo.bar', member='Get')
+        with fd:
+            self.assertIsInstance(fd, UnixFD)
+            M = map_sealed(fd)
+            self.assertEqual(M[:], self.obj.data)
+            M.close()
+
+            size = await self.client.call(destination=self.server.name, path='/store',
+                                          interface='foo.bar', member='Size', sig='h', body=fd)
+            self.assertEqual(size, len(self.obj.data))
@@ -53,6 +53,10 @@ class TestXCode(unittest.TestCase):
 
 class TestEncode(unittest.TestCase):
     data = [
+        # byte array from bytes or bytearray
+        (b'yayb', (99, b'1234', 1633837924),
+                  b'c\x00\x00\x00\x04\x00\x00\x001234dcba'),
+        (b'ayy', (bytearray(b'12'), 51), b'\x02\x00\x00\x00123'),
         # dict
         (b'a{sv}',
          OrderedDict([('ProcessID',Variant(b'u', 12514)), ('UnixUserID', Variant(b'u', 1000))]),
@@ -78,6 +82,10 @@ class TestEncode(unittest.TestCase):
 
 class TestDecode(unittest.TestCase):
     data = [
+        # byte arrays, decoded as a list of ints
+        (b'ayy', ([49, 50, 51], 52), b'\x03\x00\x00\x00\x31\x32\x33\x34'),
+        (b'yayu', (99, [], 7), b'c\x00\x00\x00\x00\x00\x00\x00\x07\x00\x00\x00'),
+        (b'ayay', ([1, 2], [3]), b'\x02\x00\x00\x00\x01\x02\x00\x00\x01\x00\x00\x00\x03'),
         # dict
         (b'a{sv}',
          {'ProcessID':12514, 'UnixUserID':1000},
@@ -3,28 +3,39 @@ import logging
 _log = logging.getLogger(__name__)
 import asyncio, functools, logging
 
-import os, tempfile
+import os, sys, tempfile
 import subprocess as SP
 from collections import defaultdict
 
+_testloop=[None]
+
+def test_loop():
+    """The process-wide event loop used by tests.
+    Created on first use, and installed as the current loop.
+    """
+    if _testloop[0] is None:
+        loop = _testloop[0] = asyncio.new_event_loop()
+        loop.set_debug(True)
+        asyncio.set_event_loop(loop)
+    return _testloop[0]
+
 def inloop(fn):
     """Decorator assumes wrapping method of object with .loop and maybe .timeout
     """
     @functools.wraps(fn)
     def testmethod(self):
-        F = fn(self)
         if not hasattr(self, 'loop'):
-            self.loop = asyncio.get_event_loop()
-            self.loop.set_debug(True)
+            self.loop = test_loop()
+        F = fn(self)
         timeout = getattr(self, 'timeout', None)
         if timeout is not None:
-            F = asyncio.wait_for(F, timeout, loop=self.loop)
+            F = asyncio.wait_for(F, timeout)
         self.loop.run_until_complete(F)
     return testmethod
 
 class FakeConnection(object):
     def __init__(self):
-        self._loop = asyncio.get_event_loop()
+        self._loop = test_loop()
         self._running = False
         self._signals = []
         self.log = logging.getLogger(__name__)
@@ -34,46 +45,51 @@ class FakeConnection(object):
     def prep_call(self, ret, *, interface=None, path='/', destination=None, member=None):
         self._results[(interface, path, destination, member)].append(ret)
 
-    @asyncio.coroutine
-    def call(self, *, interface=None, path='/', destination=None, member=None, sig=None, body=None):
+    async def call(self, *, interface=None, path='/', destination=None, member=None, sig=None, body=None):
         try:
             return self._results[(interface, path, destination, member)].pop(0)
         except:
             raise RuntimeError('Unexpected call: %s'%((interface, path, destination, member),))
 
     def signal(self, **kws):
-        from ..conn import BusEvent, SIGNAL
+        from ..conn import SIGNAL
+        from ..protocol import BusEvent
         self._signals.append(BusEvent.build(SIGNAL, 1, **kws))
 
 class DaemonRunner(object):
     daemon = 'dbus-daemon'
-    def __init__(self, *, loop=None):
-        from distutils.spawn import find_executable
-        self.exe = find_executable(self.daemon)
+    #: Environment of the child process.  None to inherit
+    env = None
+    def __init__(self):
+        import shutil
+        self.exe = shutil.which(self.daemon)
         # this is an abstract socket, so the file never actually exists
         self.addr = tempfile.mktemp(prefix='dbus-test-')
         self.proc = None
 
-        self.loop = loop
-        self.F = asyncio.Future(loop=loop)
-
     def get_info(self):
         return [{'unix:abstract':self.addr}]
 
+    def args(self):
+        return [self.exe, '--nofork', '--address=unix:abstract=%s'%self.addr, '--session', '--print-address']
+
     def start(self):
         if self.proc is not None:
             raise RuntimeError("Already running")
 
-        args = [self.exe, '--nofork', '--address=unix:abstract=%s'%self.addr, '--session']
+        args = self.args()
         _log.debug("Launching daemon with: %s",
                    ' '.join(map(repr, args)))
-        P = SP.Popen(args, executable=self.exe, shell=False,
-                        stdin=SP.DEVNULL, pass_fds=(1,2))
+        P = SP.Popen(args, executable=self.exe, shell=False, env=self.env,
+                        stdin=SP.DEVNULL, stdout=SP.PIPE, pass_fds=(2,))
 
         try:
+            # the address is printed once the daemon is listening
+            if not P.stdout.readline():
+                raise RuntimeError("%s failed to start"%self.daemon)
+            P.stdout.close()
             self.proc = P
             _log.info("Test dbus-daemon started")
-            self.F.set_result(self.addr)
         except:
             P.kill()
             self.proc = None
@@ -83,15 +99,14 @@ class DaemonRunner(object):
         if self.proc is None:
             raise RuntimeError("Not running")
         self.proc.kill()
+        self.proc.wait() # releases the socket
         self.proc = None
-        self.F = asyncio.Future(loop=self.loop)
         _log.info("Test dbus-daemon stopped")
 
-    @asyncio.coroutine
-    def restart(self, wait=0.01):
+    async def restart(self, wait=0.01):
         _log.info("Test dbus-daemon restarting")
         self.stop()
-        yield from asyncio.sleep(wait)
+        await asyncio.sleep(wait)
         self.start()
         _log.info("Test dbus-daemon restarted")
 
@@ -105,9 +120,38 @@ class DaemonRunner(object):
             self.stop()
 
     def __repr__(self):
-        return 'DaemonRunner(%s)'%self.addr
+        return '%s(%s)'%(self.__class__.__name__, self.addr)
     __str__ = __repr__
 
+class BrokerRunner(DaemonRunner):
+    """Runs a :py:class:`dbucket.broker.Broker` in a child process,
+    in place of dbus-daemon.
+    """
+    daemon = 'dbucket.broker'
+    def __init__(self):
+        DaemonRunner.__init__(self)
+        self.exe = sys.executable
+        # the child imports this copy of dbucket
+        top = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        self.env = dict(os.environ)
+        self.env['PYTHONPATH'] = os.pathsep.join([top]+[P for P in [os.environ.get('PYTHONPATH')] if P])
+
+    def args(self):
+        return [self.exe, '-m', 'dbucket.broker', '--address=unix:abstract=%s'%self.addr, '--print-address']
+
+def test_bus_runner():
+    """The runner class selected by $DBUCKET_TEST_BUS, 'daemon' or 'broker'.
+    Default is dbus-daemon if installed, else the broker.
+    """
+    import shutil
+    kind = os.environ.get('DBUCKET_TEST_BUS')
+    if kind is None:
+        kind = 'daemon' if shutil.which(DaemonRunner.daemon) else 'broker'
+    try:
+        return {'daemon':DaemonRunner, 'broker':BrokerRunner}[kind]
+    except KeyError:
+        raise ValueError("DBUCKET_TEST_BUS must be 'daemon' or 'broker', not %r"%kind)
+
 _testbus=[None]
 
 def _close_test_bus():
@@ -116,13 +160,14 @@ def _close_test_bus():
         _testbus[0] = None
 
 def test_bus():
-    """Helper to start a process-wide unique dbus-daemon
+    """Helper to start a process-wide unique bus daemon
     which will be automatically stopped on process exit.
+    cf. test_bus_runner()
     """
     if _testbus[0] is None:
         import atexit
         atexit.register(_close_test_bus)
-        R = _testbus[0] = DaemonRunner(loop=None)
+        R = _testbus[0] = test_bus_runner()()
         R.start()
     return _testbus[0]
 
@@ -0,0 +1,282 @@
+"""Unix file descriptor passing
+
+After NEGOTIATE_UNIX_FD (cf. connect_bus(unix_fd=True)) a Connection
+communicates through an :py:class:`FDStream`, which sends and receives
+file descriptors as SCM_RIGHTS ancillary data.  Values of type 'h'
+are then received as :py:class:`.UnixFD`.
+
+Large payloads may be passed as a sealed memfd, which the receiver maps
+instead of decoding.  Neither the sender nor the bus daemon copies the data
+through the socket.
+
+eg. exporting 'def Fetch(self) -> "h": return sealed_memfd(data)'
+and on the client 'with await proxy.Fetch() as fd: M = map_sealed(fd)'
+"""
+import logging
+_log = logging.getLogger(__name__)
+
+import os, socket, array, mmap
+from collections import deque
+import asyncio
+
+from .xcode import UnixFD
+
+__all__ = [
+    'UnixFD',
+    'FDStream',
+    'sealed_memfd',
+    'map_sealed',
+]
+
+_FDSIZE = array.array('i').itemsize
+
+def _wake(F):
+    if not F.done():
+        F.set_result(None)
+
+class FDStream(object):
+    """Reader and writer for a unix socket which passes file descriptors.
+
+    Stands in for both the asyncio.StreamReader and StreamWriter
+    (and WriteTransport) of a :py:class:`.Connection`,
+    as asyncio transports discard ancillary data.
+
+    Descriptors received are held until taken with take_fds().
+    Lists of buffers passed to writelines() with an attribute 'fds'
+    have these descriptors sent with their first byte.
+    """
+    #: Maximum number of descriptors accepted with one read.
+    max_fds = 64
+
+    def __init__(self, sock, loop=None):
+        sock.setblocking(False)
+        self._rxdata = b'' # cf. unread()
+        self._sock, self._fd = sock, sock.fileno()
+        self._loop = loop or asyncio.get_event_loop()
+        self.transport = self
+        self._ancsize = socket.CMSG_SPACE(self.max_fds*_FDSIZE)
+        self._rxfds = [] # [int]
+        self._reader = None # Future while read() waits
+        self._wbuf = deque() # [[bytearray, [UnixFD]|None]]
+        self._wsize = 0
+        self._high, self._low = 64*1024, 16*1024
+        self._drainer = None # Future while drain() waits
+        self._closing = False
+
+    @classmethod
+    def from_stream(klass, W, loop=None):
+        """Take over the socket of an asyncio StreamWriter, which is closed.
+
+        The stream must have no buffered data in either direction.
+        """
+        sock = W.get_extra_info('socket')
+        S = socket.socket(sock.family, sock.type, fileno=os.dup(sock.fileno()))
+        W.close()
+        return klass(S, loop=loop)
+
+    def unread(self, data):
+        'Return data to be read again, before any further data from the socket.'
+        self._rxdata = data+self._rxdata
+
+    def take_fds(self):
+        'Descriptors received so far.  The caller takes ownership.'
+        fds, self._rxfds = self._rxfds, []
+        return fds
+
+    async def read(self, n):
+        """Read up to n bytes.  b'' at end of stream.
+        """
+        if self._rxdata:
+            data, self._rxdata = self._rxdata[:n], self._rxdata[n:]
+            return data
+        while not self._closing:
+            try:
+                data, anc, flags, _addr = self._sock.recvmsg(n, self._ancsize)
+            except (BlockingIOError, InterruptedError):
+                pass
+            else:
+                for level, kind, cdata in anc:
+                    if level==socket.SOL_SOCKET and kind==socket.SCM_RIGHTS:
+                        fds = array.array('i')
+                        fds.frombytes(cdata[:len(cdata)-len(cdata)%_FDSIZE])
+                        self._rxfds.extend(fds)
+                if flags & socket.MSG_CTRUNC:
+                    _log.error("Too many file descriptors received.  Some lost.")
+                return data
+
+            F = self._reader = self._loop.create_future()
+            self._loop.add_reader(self._fd, _wake, F)
+            try:
+                await F
+            finally:
+                self._reader = None
+                if not self._closing:
+                    self._loop.remove_reader(self._fd)
+        return b''
+
+    def _send(self, bufs, fds):
+        anc = []
+        if fds:
+            anc = [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', [F.fileno() for F in fds]))]
+        return self._sock.sendmsg(bufs, anc)
+
+    def write(self, data):
+        self.writelines([data])
+
+    def writelines(self, S):
+        if self._closing:
+            return
+        fds = getattr(S, 'fds', None)
+        if not self._wbuf:
+            try:
+                N = self._send(S, fds)
+            except (BlockingIOError, InterruptedError):
+                N = 0
+            except OSError as e:
+                self._abort(e)
+                return
+            if N==sum(map(len, S)):
+                return
+            data = bytearray(b''.join(S)[N:])
+            if N:
+                fds = None # sent with the first byte
+            self._loop.add_writer(self._fd, self._writable)
+
+        elif fds is None and self._wbuf[-1][1] is None:
+            # append to the last entry
+            data = b''.join(S)
+            self._wbuf[-1][0] += data
+            self._wsize += len(data)
+            return
+
+        else:
+            data = bytearray(b''.join(S))
+
+        # keeps the descriptors open until sent
+        self._wbuf.append([data, fds])
+        self._wsize += len(data)
+
+    def _writable(self):
+        Q = self._wbuf
+        while Q:
+            E = Q[0]
+            try:
+                N = self._send([E[0]], E[1])
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError as e:
+                self._abort(e)
+                return
+            self._wsize -= N
+            if N<len(E[0]):
+                del E[0][:N]
+                if N:
+                    E[1] = None # sent with the first byte
+                break
+            Q.popleft()
+
+        if self._drainer is not None and self._wsize<=self._low:
+            _wake(self._drainer)
+        if not Q:
+            self._loop.remove_writer(self._fd)
+            if self._closing:
+                self._sock.close()
+
+    def get_write_buffer_size(self):
+        return self._wsize
+
+    def set_write_buffer_limits(self, high=None, low=None):
+        if high is None:
+            high = 64*1024 if low is None else 4*low
+        if low is None:
+            low = high//4
+        self._high, self._low = high, low
+
+    async def drain(self):
+        'Wait until the write buffer is below the low water mark, if above the high mark.'
+        if self._closing:
+            raise ConnectionResetError('Connection closed')
+        if self._wsize>self._high:
+            if self._drainer is None:
+                self._drainer = self._loop.create_future()
+            try:
+                await self._drainer
+            finally:
+                self._drainer = None
+
+    def is_closing(self):
+        return self._closing
+
+    def close(self):
+        """Stop reading.  The socket is closed once buffered data is sent.
+        """
+        if self._closing:
+            return
+        self._closing = True
+        self._loop.remove_reader(self._fd)
+        if self._reader is not None:
+            _wake(self._reader)
+        if self._drainer is not None:
+            _wake(self._drainer)
+        for fd in self.take_fds():
+            os.close(fd)
+        if not self._wbuf:
+            self._sock.close()
+
+    def _abort(self, e):
+        _log.debug("FDStream error: %s", e)
+        self._wbuf.clear()
+        self._wsize = 0
+        self._loop.remove_writer(self._fd)
+        self.close()
+
+_SEALS = ('F_SEAL_SEAL', 'F_SEAL_SHRINK', 'F_SEAL_GROW', 'F_SEAL_WRITE')
+
+def sealed_memfd(data, name='dbucket'):
+    """Copy data into a new memfd, sealed against any further modification.
+
+    Returned from a method of type 'h', the receiver may map the data with
+    :py:func:`map_sealed` without trusting the sender not to change it.
+    Linux only.
+
+    :param data: bytes-like
+    :returns: UnixFD
+    """
+    import fcntl
+    F = UnixFD(os.memfd_create(name, os.MFD_CLOEXEC|os.MFD_ALLOW_SEALING))
+    try:
+        size = len(data)
+        if size:
+            os.ftruncate(F.fileno(), size)
+            with mmap.mmap(F.fileno(), size) as M:
+                M[:] = data
+        seals = 0
+        for S in _SEALS:
+            seals |= getattr(fcntl, S)
+        fcntl.fcntl(F.fileno(), fcntl.F_ADD_SEALS, seals)
+        return F
+    except:
+        F.close()
+        raise
+
+def map_sealed(fd):
+    """Map a memfd read-only, after checking that it can not be modified or truncated.
+
+    :param fd: UnixFD, or an int
+    :returns: An mmap.mmap, or b'' if empty
+    :throws: ValueError if fd is not sealed.
+    """
+    import fcntl
+    if not isinstance(fd, int):
+        fd = fd.fileno()
+    required = fcntl.F_SEAL_SHRINK|fcntl.F_SEAL_WRITE
+    try:
+        seals = fcntl.fcntl(fd, fcntl.F_GET_SEALS)
+    except OSError:
+        seals = 0
+    if seals&required!=required:
+        raise ValueError("file descriptor is not sealed")
+    size = os.fstat(fd).st_size
+    if size==0:
+        return b''
+    return mmap.mmap(fd, size, prot=mmap.PROT_READ)
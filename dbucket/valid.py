@@ -3,9 +3,11 @@ import re
 
 __all__ = [
     'is_interface',
+    'is_bus_name',
 ]
 
 _interface = re.compile(r'^[A-Za-z0-9_]+\.(?:[A-Za-z0-9_]+\.)*[A-Za-z0-9_]+$')
+_bus_name = re.compile(r'^[A-Za-z_-][A-Za-z0-9_-]*(?:\.[A-Za-z_-][A-Za-z0-9_-]*)+$')
 
 def is_interface(s):
     """
@@ -26,3 +28,17 @@ def is_interface(s):
     False
     """
     return isinstance(s, str) and _interface.match(s) is not None
+
+def is_bus_name(s):
+    """A well-known bus name.  Unique names (eg. ':1.2') are not.
+
+    >>> is_bus_name("org.example-1.Foo")
+    True
+    >>> is_bus_name("org.1foo")
+    False
+    >>> is_bus_name(":1.2")
+    False
+    >>> is_bus_name("a")
+    False
+    """
+    return isinstance(s, str) and len(s)<=255 and _bus_name.match(s) is not None
@@ -3,7 +3,7 @@ import logging, sys
 _log = logging.getLogger(__name__)
 
 from collections import OrderedDict
-import struct
+import os, struct
 
 __all__ = [
     'encode',
@@ -12,6 +12,7 @@ __all__ = [
     'Object',
     'Signature',
     'Integer',
+    'UnixFD',
 ]
 
 _sys_lsb = sys.byteorder=='little'
@@ -64,15 +65,61 @@ _dmap_plain = (
 _decode_plain = dict([(ord(d),p) for d,p in _dmap_plain])
 del _dmap_plain
 
+class UnixFD(object):
+    """A file descriptor passed as DBus type 'h'.
+
+    Owns the descriptor, which is closed by close(), on exit from a 'with' block,
+    or when garbage collected.  Use detach() to take ownership.
+    """
+    __slots__ = ('_fd',)
+    def __init__(self, fd):
+        self._fd = fd
+
+    def fileno(self):
+        if self._fd<0:
+            raise ValueError("UnixFD closed")
+        return self._fd
+
+    @property
+    def closed(self):
+        return self._fd<0
+
+    def detach(self):
+        'Release ownership.  Returns the descriptor number.'
+        fd, self._fd = self.fileno(), -1
+        return fd
+
+    def dup(self):
+        'A new UnixFD with a duplicate of this descriptor'
+        return UnixFD(os.dup(self.fileno()))
+
+    def close(self):
+        fd, self._fd = self._fd, -1
+        if fd>=0:
+            os.close(fd)
+
+    __del__ = close
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, A, B, C):
+        self.close()
+
+    def __repr__(self):
+        return 'UnixFD(%d)'%self._fd
+
 class Decoder(object):
     debug = False
     _log = logging.getLogger(__name__+'.decode')
+    #: Received file descriptors.  Values of type 'h' index this list.  None to decode as uint32.
+    fds = None
     def __init__(self, buf, pos, lsb):
         self.buffer, self.bpos = buf, pos
         self.lsb, self._L = lsb, '<' if lsb else '>'
 
     def __repr__(self):
-        return 'Decoder(pos=%d, lsb=%s, buf="%s")'%(self.bpos, self.lsb, self.buffer)
+        return 'Decoder(pos=%d, lsb=%s, buf="%s")'%(self.bpos, self.lsb, bytes(self.buffer))
 
     def _dalign(self, size):
         M = self.bpos%size
@@ -86,7 +133,7 @@ class Decoder(object):
     def _short_string(self):
         size = self.buffer[0]
         ret, self.buffer, self.bpos = self.buffer[1:1+size], self.buffer[2+size:], self.bpos+2+size
-        return ret
+        return bytes(ret)
 
     def decode(self, sig):
         if self.debug:
@@ -129,7 +176,11 @@ class Decoder(object):
                 assert len(self.buffer)==asize, (len(self.buffer), asize, self.buffer)
 
                 after = self.bpos+asize
-                ARR = []
+                if esig==b'y':
+                    # byte array fast path
+                    ARR, self.buffer, self.bpos = list(self.buffer), b'', after
+                else:
+                    ARR = []
                 while len(self.buffer)>0:
                     ARR.append(self.decode(esig)[0])
                 assert self.bpos==after, (self.bpos, after) # array decode
@@ -146,7 +197,7 @@ class Decoder(object):
                 asize, = struct.unpack(self._L+'I', self.buffer[:4])
                 self.bpos += 4+asize+1
                 V, self.buffer = self.buffer[4:4+asize], self.buffer[4+asize+1:]
-                ret.append(V.decode('utf-8'))
+                ret.append(str(V, 'utf-8'))
 
             elif selem[0]==ord(b'v'):
                 V = self.decode(self._short_string())
@@ -162,33 +213,42 @@ class Decoder(object):
                     raise ValueError("Error %s decoding %s with %s at %s"%(e, self.buffer[:S.size], _decode_plain[selem[0]], self.bpos))
                 self.buffer = self.buffer[S.size:]
                 self.bpos += S.size
+                if selem[0]==ord(b'h') and self.fds is not None:
+                    try:
+                        V = self.fds[V]
+                    except IndexError:
+                        raise ValueError("Message has no file descriptor %d"%V)
                 ret.append(V)
 
         return tuple(ret)
 
-def decode(sig, buffer, lsb=_sys_lsb, bpos=0, debug=False):
+def decode(sig, buffer, lsb=_sys_lsb, bpos=0, debug=False, fds=None):
     """Decode a python value from the given bytestring with the given signature bytestring
 
     :param bytes sig: DBus type signature
-    :param bytes buffer: Byte buffer to decode
+    :param buffer: Byte buffer to decode.  bytes, bytearray, or memoryview
     :param bool lsb: True if buffer was encoded as LSB, False for MSB.  Defaults to host byte order.
     :param int bpos: Offset of buffer[0] is original bytestring.  Used in dbus alignment rules.
     :param bool debug: Enabled verbose debugging of decoder processing
+    :param list fds: File descriptors (UnixFD) received with the message.  Type 'h' is decoded
+                     as an element of this list.  If None, 'h' is decoded as an integer index.
     :returns: The decoded value.
     """
-    D = Decoder(buffer, bpos, lsb)
+    # slices of a memoryview are not copies
+    D = Decoder(memoryview(buffer), bpos, lsb)
     D.debug = debug
+    D.fds = fds
     if debug:
         D._log.debug("Start decode %s %s", sig, buffer)
     try:
         R = D.decode(sig)
         remain, bpos = D.buffer, D.bpos
     except Exception as e:
-        raise ValueError("Error %s while decoding %s %s.  %s"%(e, sig, repr(buffer), D))
+        raise ValueError("Error %s while decoding %s %s.  %s"%(e, sig, repr(bytes(buffer)), D))
     if bpos!=len(buffer):
-        raise ValueError("Incomplete decode: %d/%d while decoding %s %s.  %s"%(bpos, len(buffer), sig, repr(buffer), D))
+        raise ValueError("Incomplete decode: %d/%d while decoding %s %s.  %s"%(bpos, len(buffer), sig, repr(bytes(buffer)), D))
     elif len(remain)!=0:
-        raise ValueError("Incomplete decode: %s while decoding %s %s.  %s"%(repr(remain), sig, repr(buffer), D))
+        raise ValueError("Incomplete decode: %s while decoding %s %s.  %s"%(repr(bytes(remain)), sig, repr(bytes(buffer)), D))
     if isinstance(R, tuple) and len(R)==1:
         return R[0]
     else:
@@ -239,6 +299,9 @@ def _infer_sig(val):
 class Encoder(object):
     debug = False
     _log = logging.getLogger(__name__+'.encode')
+    #: File descriptors to be sent with the message.  Values of type 'h' are
+    #: appended as UnixFD duplicates, and encoded as an index.  None to encode 'h' as uint32.
+    fds = None
     def __init__(self, pos=0, lsb=_sys_lsb):
         self.lsb, self.L = lsb, '<' if lsb else '>'
         self.bpos = pos
@@ -293,6 +356,12 @@ class Encoder(object):
                 # array size doesn't include padding before first element
                 ipos = self.bpos
 
+                if esig==b'y' and isinstance(mem, (bytes, bytearray)):
+                    # byte array fast path
+                    self.bufs.append(bytes(mem))
+                    self.bpos += len(mem)
+                    mem = ()
+
                 for E in mem:
                     if self.debug:
                         self._log.debug("Encode array element %s %s.  out pos %d", esig, E, self.bpos)
@@ -325,6 +394,12 @@ class Encoder(object):
                 self.encode(vsig, (mem,))
 
             else:
+                if selem[0]==ord(b'h') and self.fds is not None:
+                    # an int, or an object with fileno().  eg. UnixFD or a file
+                    fd = mem if isinstance(mem, int) else mem.fileno()
+                    self.fds.append(UnixFD(os.dup(fd)))
+                    mem = len(self.fds)-1
+
                 S = struct.Struct(self.L+_decode_plain[selem[0]])
                 self.align(S.size)
 
@@ -339,7 +414,7 @@ class Encoder(object):
         if len(sig)>0:
             raise ValueError("Incomplete value, stops before '%s'"%sig)
 
-def encode(sig, val, lsb=_sys_lsb, debug=False):
+def encode(sig, val, lsb=_sys_lsb, debug=False, fds=None):
     """Encode the given object using the given signature bytestring.
 
     :param bytes sig: DBus type signature
@@ -347,6 +422,7 @@ def encode(sig, val, lsb=_sys_lsb, debug=False):
     :param bool lsb: True if buffer was encoded as LSB, False for MSB.  Defaults to host byte order.
     :param int bpos: Offset of buffer[0] is original bytestring.  Used in dbus alignment rules.
     :param bool debug: Enabled verbose debugging of decoder processing
+    :param list fds: If not None, a list to which duplicates of file descriptors (type 'h') are appended.
     :returns: A bytestring
     :rtype: bytes
     """
@@ -354,6 +430,7 @@ def encode(sig, val, lsb=_sys_lsb, debug=False):
         val = (val,)
     E = Encoder(0, lsb)
     E.debug = debug
+    E.fds = fds
     try:
         E.encode(sig, val)
         return b''.join(E.bufs)
@@ -25,36 +25,35 @@ _elem = numpy.dtype([
     ('S', 'I4'),
 ])
 
-@asyncio.coroutine
-def getData(since):
-    conn = yield from connect_bus(get_system_infos())
+async def getData(since):
+    conn = await connect_bus(get_system_infos())
     try:
-        UP = yield from conn.proxy(
+        UP = await conn.proxy(
             destination=UPOWER,
             interface=UPOWER,
             path=UPOWER_PATH,
         )
 
         rate, charge = {}, {}
-        devices = yield from UP.EnumerateDevices()
+        devices = await UP.EnumerateDevices()
         for dpath in devices:
             print("Device", dpath)
-            dev = yield from conn.proxy(
+            dev = await conn.proxy(
                 destination=UPOWER,
                 interface=DEVICE,
                 path=dpath
             )
 
             try:
-                rate[dpath]   = yield from dev.GetHistory('rate', int(since*60), 60)
-                charge[dpath] = yield from dev.GetHistory('charge', int(since*60), 60)
+                rate[dpath]   = await dev.GetHistory('rate', int(since*60), 60)
+                charge[dpath] = await dev.GetHistory('charge', int(since*60), 60)
             except RemoteError as e:
                 print(dpath, e)
                 continue
 
         return rate, charge
     finally:
-        yield from conn.close()
+        await conn.close()
 
 def getargs():
     from argparse import ArgumentParser
@@ -65,9 +64,7 @@ def getargs():
 
 def main(args):
     logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO)
-    loop = asyncio.get_event_loop()
-    loop.set_debug(args.debug)
-    rate, charge = loop.run_until_complete(getData(args.since))
+    rate, charge = asyncio.run(getData(args.since), debug=args.debug)
 
     #PL.subplot(2,1,1)
     ax = PL.gca()
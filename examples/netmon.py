@@ -22,8 +22,7 @@ states = {
     70:'Global',
 }
 
-@asyncio.coroutine
-def onStateChange(conn, netman, state):
+async def onStateChange(conn, netman, state):
     try:
         _log.info('Current State %s', states.get(state,'???'))
 
@@ -40,42 +39,42 @@ def onStateChange(conn, netman, state):
             return
 
         # How are we connected?
-        con = yield from netman.PrimaryConnection
+        con = await netman.PrimaryConnection
         _log.info("PrimaryConnection: %s", con)
         if con=='/':
             # when no active connnection we get root instead of an error :(
             _log.warn('No primary connection')
             return
 
-        con = yield from netman[con]
+        con = await netman[con]
 
-        ctype = yield from con.Type
+        ctype = await con.Type
 
         if ctype not in ('802-11-wireless',):
             _log.debug('Primary is not WIFI? %s', ctype)
 
-        devs = yield from con.Devices
+        devs = await con.Devices
         if len(devs)==0:
             _log.error("No devices")
             return
         elif len(devs)>1:
             _log.warn("More than one device, using first")
-        dev = yield from netman[devs[0]]
+        dev = await netman[devs[0]]
 
-        ap = yield from netman[(yield from dev.ActiveAccessPoint)]
+        ap = await netman[(await dev.ActiveAccessPoint)]
         _log.info("Access Point %s", ap)
 
         if not hasattr(ap, 'Ssid'):
             _log.info('Primary no WIFI')
 
-        ssid = ''.join(map(chr, (yield from ap.Ssid)))
+        ssid = ''.join(map(chr, (await ap.Ssid)))
 
         _log.info("WIFI connected to '%s'", ssid)
 
         if not ssid.startswith('MSUnet Guest'):
             return
 
-        yield from conn.loop.run_in_executor(None, msulogin)
+        await conn.loop.run_in_executor(None, msulogin)
     except:
         _log.exception("Error in onStateChange")
 
@@ -93,35 +92,33 @@ def msulogin():
     }).raise_for_status()
     _log.info("Login Successful")
 
-@asyncio.coroutine
-def run():
-    conn = yield from connect_bus(get_system_infos())
+async def run():
+    conn = await connect_bus(get_system_infos())
     #conn.debug_net = True
     try:
-        netman = yield from conn.proxy(destination=SERVICE, path=PATH)
+        netman = await conn.proxy(destination=SERVICE, path=PATH)
 
         SIGQ = conn.new_queue()
-        yield from netman.PropertiesChanged.connect(SIGQ)
+        await netman.PropertiesChanged.connect(SIGQ)
 
-        istate = yield from netman.State
-        yield from onStateChange(conn, netman, istate)
+        istate = await netman.State
+        await onStateChange(conn, netman, istate)
 
         def sig():
             print("Request exit")
-            asyncio.async(SIGQ.close(), loop=conn.loop)
+            conn.loop.create_task(SIGQ.close())
 
         conn.loop.add_signal_handler(signal.SIGINT, sig)
-        while True:
-            print("wait sig")
-            evt, sts = yield from SIGQ.recv()
+        print("wait sig")
+        async for evt, sts in SIGQ:
             if 'PrimaryConnection' not in evt.body:
                 continue
             print("have sig", evt, sts)
-            istate = yield from netman.State
-            yield from onStateChange(conn, netman, istate)
+            istate = await netman.State
+            await onStateChange(conn, netman, istate)
 
     finally:
-        yield from conn.close()
+        await conn.close()
 
 def getargs():
     from argparse import ArgumentParser
@@ -131,10 +128,8 @@ def getargs():
 
 def main(args):
     logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO)
-    loop = asyncio.get_event_loop()
-    loop.set_debug(args.debug)
     try:
-        loop.run_until_complete(run())
+        asyncio.run(run(), debug=args.debug)
     except asyncio.CancelledError:
         sys.exit(1)
 
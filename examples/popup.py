@@ -10,15 +10,14 @@ from dbucket.auth import with_session
 SERVICE = 'org.freedesktop.Notifications'
 PATH = '/org/freedesktop/Notifications'
 
-@asyncio.coroutine
-def run(args, conn):
-    note = yield from conn.proxy(destination=SERVICE, path=PATH)
+async def run(args, conn):
+    note = await conn.proxy(destination=SERVICE, path=PATH)
 
     SIGQ = conn.new_queue()
-    yield from note.NotificationClosed.connect(SIGQ)
-    yield from note.ActionInvoked.connect(SIGQ)
+    await note.NotificationClosed.connect(SIGQ)
+    await note.ActionInvoked.connect(SIGQ)
 
-    id = yield from note.Notify(
+    id = await note.Notify(
         "Pop-up Example",
         0, # no replace
         "", # no icon
@@ -32,7 +31,7 @@ def run(args, conn):
 
     ret = 0
     while True:
-        evt, sts = yield from SIGQ.recv()
+        evt, sts = await SIGQ.recv()
         print("signal", evt)
         if evt.member=='ActionInvoked':
             aid, act = evt.body
@@ -42,7 +41,7 @@ def run(args, conn):
 
     print("Closing", id)
     # TODO: doesn't seem to cause close w/ KDE?
-    yield from note.CloseNotification(id)
+    await note.CloseNotification(id)
 
     return ret
 
@@ -56,9 +55,7 @@ def getargs():
 
 def main(args):
     logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO)
-    loop = asyncio.get_event_loop()
-    loop.set_debug(args.debug)
-    ret = loop.run_until_complete(with_session(functools.partial(run, args)))
+    ret = asyncio.run(with_session(functools.partial(run, args)), debug=args.debug)
     sys.exit(ret)
 
 if __name__=='__main__':